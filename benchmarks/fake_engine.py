@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+_version_prefix = re.compile(r'^/v[0-9.]+')
+
+API_VERSION = '1.22'
+
+
+def fake_container(index: int) -> dict:
+    return {
+        'Id': '{:064x}'.format(index + 1),
+        'Names': ['/container_{}'.format(index)],
+        'Image': 'example/image:{}'.format(index % 10),
+        'ImageID': 'sha256:{:064x}'.format(index % 10 + 1),
+        'Command': 'sh -c "while true; do sleep 1; done"',
+        'Created': 1460000000 + index,
+        'State': 'running',
+        'Status': 'Up 2 hours',
+        'Ports': [{'IP': '0.0.0.0', 'PrivatePort': 80, 'PublicPort': 30000 + index % 30000, 'Type': 'tcp'}],
+        'Labels': {'com.example.index': str(index)},
+        'HostConfig': {'NetworkMode': 'default'}
+    }
+
+
+def fake_image(index: int) -> dict:
+    return {
+        'Id': 'sha256:{:064x}'.format(index + 1),
+        'ParentId': '',
+        'RepoTags': ['example/image:{}'.format(index)],
+        'RepoDigests': None,
+        'Created': 1460000000 + index,
+        'Size': 1000000 * (index % 500 + 1),
+        'VirtualSize': 1000000 * (index % 500 + 1),
+        'Labels': {}
+    }
+
+
+def pull_events(image: str, layers: int, steps: int) -> list:
+    events = [{'status': 'Pulling from {}'.format(image.split(':')[0]), 'id': image.split(':')[-1]}]
+    layer_ids = ['{:012x}'.format(layer + 1) for layer in range(layers)]
+    for layer_id in layer_ids:
+        events.append({'status': 'Pulling fs layer', 'progressDetail': {}, 'id': layer_id})
+
+    total = 10000000
+    for step in range(1, steps + 1):
+        for layer_id in layer_ids:
+            current = total * step // steps
+            events.append({'status': 'Downloading', 'id': layer_id, 'progress': '[=====>     ] {}'.format(current),
+                           'progressDetail': {'current': current, 'total': total}})
+
+    for layer_id in layer_ids:
+        events.append({'status': 'Download complete', 'progressDetail': {}, 'id': layer_id})
+        events.append({'status': 'Pull complete', 'progressDetail': {}, 'id': layer_id})
+
+    events.append({'status': 'Digest: sha256:{:064x}'.format(layers)})
+    events.append({'status': 'Status: Downloaded newer image for {}'.format(image)})
+    return events
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # unix socket peers have no address, which the default implementation expects
+    def address_string(self):
+        return 'unix'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body=None, content_type: str='application/json'):
+        if body is None:
+            data = b''
+        elif isinstance(body, bytes):
+            data = body
+        else:
+            data = json.dumps(body).encode('utf-8')
+
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunked(self, chunks):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _dispatch(self, method: str):
+        engine = self.server.engine
+        url = urlparse(self.path)
+        path = _version_prefix.sub('', url.path)
+        query = parse_qs(url.query)
+
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        if length:
+            self.rfile.read(length)
+
+        engine.requests += 1
+        if engine.latency:
+            time.sleep(engine.latency)
+
+        if path == '/_ping':
+            return self._send(200, b'OK', 'text/plain')
+        if path == '/version':
+            return self._send(200, {'ApiVersion': API_VERSION, 'Version': 'fake', 'Os': 'linux', 'Arch': 'amd64'})
+        if method == 'GET' and path == '/containers/json':
+            return self._send(200, engine.containers_body)
+        if method == 'GET' and path == '/images/json':
+            return self._send(200, engine.images_body)
+        if method == 'POST' and path == '/images/create':
+            image = query.get('fromImage', ['example/image'])[0]
+            tag = query.get('tag', [''])[0]
+            if tag:
+                image = "{}:{}".format(image, tag)
+            return self._send_chunked(engine.pull_chunks(image))
+        if method == 'GET' and path == '/events':
+            return self._send(200, b'')
+
+        match = re.match(r'^/containers/([^/]+)(/[a-z]+)?$', path)
+        if match:
+            action = match.group(2)
+            if method == 'DELETE' and action is None:
+                return self._send(204)
+            if method == 'POST' and action in ('/start', '/stop', '/kill', '/restart'):
+                return self._send(204)
+            if method == 'GET' and action == '/json':
+                container = fake_container(0)
+                container['Id'] = match.group(1)
+                container['Name'] = '/' + match.group(1)
+                return self._send(200, container)
+
+        match = re.match(r'^/images/([^/]+)$', path)
+        if match and method == 'DELETE':
+            return self._send(200, [{'Untagged': match.group(1)}])
+
+        self._send(404, {'message': 'fake engine does not implement {} {}'.format(method, path)})
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def do_HEAD(self):
+        self._dispatch('HEAD')
+
+
+class FakeEngine:
+    def __init__(self, containers: int=10, images: int=10, latency: float=0.0, pull_layers: int=5,
+                 pull_steps: int=50, chunk_size: int=512, socket_path: str=None):
+        self.latency = latency
+        self.pull_layers = pull_layers
+        self.pull_steps = pull_steps
+        self.chunk_size = chunk_size
+        self.requests = 0
+
+        self.containers_body = json.dumps([fake_container(index) for index in range(containers)]).encode('utf-8')
+        self.images_body = json.dumps([fake_image(index) for index in range(images)]).encode('utf-8')
+
+        self._directory = None
+        if socket_path is None:
+            self._directory = tempfile.mkdtemp(prefix='dkr-fake-engine-')
+            socket_path = os.path.join(self._directory, 'docker.sock')
+        self.socket_path = socket_path
+
+        self._server = None
+        self._thread = None
+
+    @property
+    def docker_host(self) -> str:
+        return 'unix://{}'.format(self.socket_path)
+
+    def pull_chunks(self, image: str) -> list:
+        data = b''.join(json.dumps(event).encode('utf-8') + b'\r\n'
+                        for event in pull_events(image, self.pull_layers, self.pull_steps))
+        # deliberately split objects across chunk boundaries, like a real daemon can
+        return [data[index:index + self.chunk_size] for index in range(0, len(data), self.chunk_size)]
+
+    def start(self):
+        self._server = _Server(self.socket_path, _Handler)
+        self._server.engine = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        if self._directory is not None:
+            os.rmdir(self._directory)
+            self._directory = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Fake Docker Engine API server for benchmarking dkr")
+    arg_parser.add_argument('--socket', help="Socket path. Default: a temporary directory")
+    arg_parser.add_argument('--containers', type=int, default=10)
+    arg_parser.add_argument('--images', type=int, default=10)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request")
+    arg_parser.add_argument('--pull-layers', type=int, default=5)
+    args = arg_parser.parse_args()
+
+    engine = FakeEngine(args.containers, args.images, args.latency, args.pull_layers, socket_path=args.socket)
+    with engine:
+        print("export DOCKER_HOST={}".format(engine.docker_host))
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
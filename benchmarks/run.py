@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+benchmark_directory = os.path.dirname(os.path.realpath(__file__))
+project_directory = os.path.dirname(benchmark_directory)
+sys.path.insert(0, project_directory)
+
+from benchmarks.fake_engine import FakeEngine  # noqa: E402
+
+RESULTS_VERSION = 1
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.10
+LIST_SIZES = [10, 1000, 50000]
+BULK_CONTAINERS = 50
+BULK_LATENCY = 0.01
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=project_directory, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+
+def _summary(runs: list, **extra) -> dict:
+    result = {
+        'unit': 's',
+        'median': statistics.median(runs),
+        'min': min(runs),
+        'max': max(runs),
+        'runs': runs
+    }
+    result.update(extra)
+    return result
+
+
+class Runner:
+    def __init__(self, repeat: int, home: str):
+        self.repeat = repeat
+        self.home = home
+        self.dkr = os.path.join(project_directory, 'dkr')
+
+    def environment(self, engine: FakeEngine=None) -> dict:
+        env = dict(os.environ)
+        env['HOME'] = self.home
+        env['DKR_NO_SERVER'] = '1'
+        env.pop('DOCKER_TLS_VERIFY', None)
+        env.pop('DOCKER_CERT_PATH', None)
+        if engine is not None:
+            env['DOCKER_HOST'] = engine.docker_host
+        return env
+
+    def time_command(self, args: list, engine: FakeEngine=None) -> dict:
+        env = self.environment(engine)
+        command = [sys.executable, self.dkr] + args
+
+        # one untimed run so the manifest and the page cache are warm, which is what a user sees day to day
+        self._run(command, env)
+
+        runs = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            self._run(command, env)
+            runs.append(time.perf_counter() - started)
+        return _summary(runs, command=args)
+
+    @staticmethod
+    def _run(command: list, env: dict):
+        completed = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if completed.returncode != 0:
+            message = completed.stderr.decode('utf-8', 'replace').strip()
+            raise RuntimeError("`{}` exited with {}: {}".format(' '.join(command[1:]), completed.returncode, message))
+
+    def time_function(self, func) -> list:
+        runs = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            func()
+            runs.append(time.perf_counter() - started)
+        return runs
+
+
+def bench_startup(runner: Runner) -> dict:
+    from dkr_core import dkr
+
+    results = {'startup.help': runner.time_command(['--help'])}
+
+    def load_cold():
+        directory = tempfile.mkdtemp(dir=runner.home)
+        try:
+            dkr.load_commands(directory)
+        finally:
+            shutil.rmtree(directory)
+
+    warm_directory = tempfile.mkdtemp(dir=runner.home)
+    dkr.load_commands(warm_directory)
+
+    results['startup.load_commands.cold'] = _summary(runner.time_function(load_cold))
+    results['startup.load_commands.warm'] = _summary(runner.time_function(lambda: dkr.load_commands(warm_directory)))
+
+    with FakeEngine(containers=10, images=10) as engine:
+        results['startup.container_list'] = runner.time_command(['container', 'list', '-q'], engine)
+    return results
+
+
+def bench_list(runner: Runner, sizes: list) -> dict:
+    results = {}
+    for size in sizes:
+        with FakeEngine(containers=size, images=size) as engine:
+            results['list.container.table.{}'.format(size)] = runner.time_command(['container', 'list'], engine)
+            results['list.container.ndjson.{}'.format(size)] = runner.time_command(['container', 'list', '--ndjson'],
+                                                                                   engine)
+            results['list.image.table.{}'.format(size)] = runner.time_command(['image', 'list'], engine)
+    return results
+
+
+def bench_pull(runner: Runner) -> dict:
+    from dkr_core import jsonstream, progress
+
+    engine = FakeEngine(pull_layers=20, pull_steps=500, chunk_size=4096)
+    chunks = engine.pull_chunks('example/image:latest')
+    size = sum(len(chunk) for chunk in chunks)
+    counts = []
+
+    def decode():
+        counts.append(sum(1 for _ in jsonstream.iter_objects(chunks)))
+
+    def render():
+        pull_progress = progress.PullProgress(file=io.StringIO(), images=['example/image:latest'])
+        for event in jsonstream.iter_objects(chunks):
+            pull_progress.update(event, 'example/image:latest')
+        pull_progress.finish()
+
+    decode_runs = runner.time_function(decode)
+    render_runs = runner.time_function(render)
+    results = {
+        'pull.decode': _summary(decode_runs, bytes=size, events=counts[0],
+                                mb_per_s=size / statistics.median(decode_runs) / 1024 / 1024),
+        'pull.decode_render': _summary(render_runs, bytes=size, events=counts[0],
+                                       mb_per_s=size / statistics.median(render_runs) / 1024 / 1024)
+    }
+
+    with FakeEngine(pull_layers=5, pull_steps=100) as engine:
+        results['pull.command'] = runner.time_command(['image', 'pull', 'example/image:latest'], engine)
+    return results
+
+
+def bench_bulk(runner: Runner) -> dict:
+    names = ['container_{}'.format(index) for index in range(BULK_CONTAINERS)]
+    results = {}
+    with FakeEngine(containers=BULK_CONTAINERS, latency=BULK_LATENCY) as engine:
+        for jobs in (1, 8):
+            results['bulk.stop.j{}'.format(jobs)] = runner.time_command(
+                ['container', 'stop', '-t', '0', '-j', str(jobs)] + names, engine)
+            results['bulk.rm.j{}'.format(jobs)] = runner.time_command(
+                ['container', 'rm', '-j', str(jobs)] + names, engine)
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    print("{:<40} {:>10} {:>10} {:>8}".format("benchmark", "baseline", "current", "ratio"), file=sys.stderr)
+    for name, result in sorted(results['benchmarks'].items()):
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None:
+            print("{:<40} {:>10} {:>10.4f} {:>8}".format(name, "-", result['median'], "new"), file=sys.stderr)
+            continue
+
+        ratio = result['median'] / previous['median'] if previous['median'] else float('inf')
+        marker = ""
+        if ratio > 1 + threshold:
+            marker = " REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            marker = " faster"
+        print("{:<40} {:>10.4f} {:>10.4f} {:>7.2f}x{}".format(name, previous['median'], result['median'], ratio,
+                                                            marker), file=sys.stderr)
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmarks dkr against a fake Docker Engine API server")
+    arg_parser.add_argument('-o', '--output', help="Write the results as JSON to this file")
+    arg_parser.add_argument('--compare', metavar='FILE', help="Compare against results written by an earlier run")
+    arg_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                            help="Relative slowdown reported as a regression. Default: {}".format(DEFAULT_THRESHOLD))
+    arg_parser.add_argument('-r', '--repeat', type=int, default=DEFAULT_REPEAT,
+                            help="Timed runs per benchmark. Default: {}".format(DEFAULT_REPEAT))
+    arg_parser.add_argument('--only', action='append', choices=['startup', 'list', 'pull', 'bulk'],
+                            help="Only run these groups")
+    arg_parser.add_argument('--quick', action='store_true', help="Skip the {} row lists".format(LIST_SIZES[-1]))
+    args = arg_parser.parse_args()
+
+    groups = args.only if args.only else ['startup', 'list', 'pull', 'bulk']
+    sizes = LIST_SIZES[:-1] if args.quick else LIST_SIZES
+
+    home = tempfile.mkdtemp(prefix='dkr-bench-')
+    runner = Runner(args.repeat, home)
+    benchmarks = {}
+    try:
+        for group in groups:
+            print("Running {} benchmarks".format(group), file=sys.stderr)
+            if group == 'startup':
+                benchmarks.update(bench_startup(runner))
+            elif group == 'list':
+                benchmarks.update(bench_list(runner, sizes))
+            elif group == 'pull':
+                benchmarks.update(bench_pull(runner))
+            elif group == 'bulk':
+                benchmarks.update(bench_bulk(runner))
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created': time.time(),
+        'repeat': args.repeat,
+        'benchmarks': benchmarks
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("{} benchmark(s) slower than {:.0%} over the baseline".format(len(regressions), args.threshold),
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import docker
+import sys
+import time
+
+from dkr_core import cache
+from dkr_core import errors
+
+
+def command() -> str:
+    return 'cache'
+
+
+def help_summary(name: str) -> str:
+    return "Local snapshot of containers and images kept up to date from docker events"
+
+
+# noinspection PyUnusedLocal
+def import_command(docker_client: docker.Client, args, state: dict):
+    args.set_defaults(func=default)
+    subparsers = args.add_subparsers(title="Cache Commands", metavar="COMMAND")
+
+    watch_cmd = subparsers.add_parser('watch', help="Sync the cache and keep it updated from the event stream")
+    watch_cmd.add_argument('--resync', type=float, default=cache.RESYNC_INTERVAL,
+                           help="Seconds between full resyncs. Default: {}".format(cache.RESYNC_INTERVAL))
+    watch_cmd.set_defaults(func=watch_cache)
+
+    status_cmd = subparsers.add_parser('status', help="Show how fresh the cache is")
+    status_cmd.set_defaults(func=cache_status)
+
+    resolve_cmd = subparsers.add_parser('resolve', help="Resolve container names or ID prefixes from the cache")
+    resolve_cmd.add_argument('-i', '--image', action='store_true', help="Resolve image tags or ID prefixes instead")
+    resolve_cmd.add_argument('reference', nargs="+", help="The name, tag or ID prefix to resolve")
+    resolve_cmd.set_defaults(func=resolve)
+
+
+# noinspection PyUnusedLocal
+def default(client: docker.Client, args, state: dict):
+    print("No valid command specified. `{} cache -h` for help.".format(sys.argv[0]), file=sys.stderr)
+
+
+# noinspection PyUnusedLocal
+def watch_cache(docker_client: docker.Client, args, state: dict):
+    watcher = cache.Watcher(docker_client, resync_interval=args.resync)
+    watcher.watch()
+
+
+# noinspection PyUnusedLocal
+def cache_status(docker_client: docker.Client, args, state: dict):
+    snapshot = cache.load_snapshot(max_age=float('inf'))
+    if snapshot is None:
+        raise errors.DkrException("No cache, start one with `{} cache watch`".format(sys.argv[0]), errors.INVALID_INPUT)
+
+    max_age = state.get('cache_max_age', cache.DEFAULT_MAX_AGE)
+    print("containers: {}".format(len(snapshot.container_index)))
+    print("images: {}".format(len(snapshot.image_index)))
+    print("last full sync: {:.0f}s ago".format(time.time() - snapshot.synced))
+    print("last heartbeat: {:.0f}s ago ({})".format(snapshot.age, "fresh" if snapshot.age <= max_age else "stale"))
+
+
+# noinspection PyUnusedLocal
+def resolve(docker_client: docker.Client, args, state: dict):
+    snapshot = cache.require_snapshot(state)
+
+    error = 0
+    for reference in args.reference:
+        if args.image:
+            matches = snapshot.resolve_image(reference)
+        else:
+            matches = snapshot.resolve_container(reference)
+
+        if len(matches) == 1:
+            print(matches[0])
+        elif not matches:
+            print("No such {}: {}".format('image' if args.image else 'container', reference), file=sys.stderr)
+            error = errors.merge(error, errors.INVALID_INPUT)
+        else:
+            print("Ambiguous reference {} matches {} objects".format(reference, len(matches)), file=sys.stderr)
+            error = errors.merge(error, errors.INVALID_INPUT)
+
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
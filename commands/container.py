@@ -1,16 +1,51 @@
+import argparse
 import docker
 import docker.errors
+import queue
 import sys
-from pprint import pprint
-from tabulate import tabulate
 import json
 from datetime import datetime
-import pretty
+import io
 import re
-import yaml
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from dkr_core import cache
 from dkr_core import errors
+from dkr_core import frames
 from dkr_core import cmd_to_json
+from dkr_core import documents
+from dkr_core import output
+from dkr_core import parallel
+from dkr_core import stats
+from dkr_core import template
+from dkr_core import waiting
+from dkr_core.client import open_stream, stream_json
+
+
+CONTAINER_HEADERS = ["ID", "NAME", "IMAGE", "CMD", "CREATED", "STATUS", "PORTS"]
+CONTAINER_WIDTHS = [12, 24, 24, 24, 10, 20, 0]
+
+STATS_HEADERS = ["ID", "NAME", "CPU %", "MEM USAGE / LIMIT", "MEM %", "NET I/O", "BLOCK I/O", "PIDS"]
+STATS_RATE_HEADERS = ["ID", "NAME", "CPU %", "MEM USAGE / LIMIT", "MEM %", "NET RX / TX /s", "BLOCK R / W /s", "PIDS"]
+STATS_WIDTHS = [12, 24, 8, 22, 8, 22, 22, 0]
+
+# output batches waiting to be written; a container that prints faster than the terminal keeps up with blocks on a full
+# queue, which stops reads from its socket instead of buffering its output
+EXEC_QUEUE_SIZE = 64
+# exec_inspect polls, 50ms apart, for an exit code once the output of an exec has ended
+EXEC_EXIT_POLLS = 20
+
+CLEAR_SCREEN = '\x1b[H\x1b[2J'
+
+CONTAINER_FIELDS = {
+    'ID': lambda container: container['Id'][:12],
+    'Name': lambda container: container['Names'][0][1:],
+    'Names': lambda container: [name[1:] for name in container['Names']],
+    'CreatedSince': lambda container: _created_string(container['Created']),
+    'Ports': lambda container: ', '.join([_port_string(p) for p in container.get('Ports', [])])
+}
 
 
 class Port:
@@ -47,18 +82,36 @@ def import_command(docker_client: docker.Client, args, state: dict):
     list_cmd.add_argument('-q', '--quiet', action='store_true', help='Only print IDs')
     list_cmd.add_argument('--json', action='store_true', help='Render all as json')
     list_cmd.add_argument('--pprint', action='store_true', help='Dump contents using python\'s pprint function')
+    list_cmd.add_argument('--ndjson', action='store_true', help='Stream one json object per line')
+    list_cmd.add_argument('--stream', action='store_true',
+                          help='Print rows as they are received using fixed-width columns')
+    list_cmd.add_argument('--cached', action='store_true',
+                          help='Read from the snapshot kept by `cache watch` instead of asking the daemon')
+    list_cmd.add_argument('-f', '--filter', action='append',
+                          help='Filter on the daemon, e.g. status=exited, label=KEY=VALUE, name=NAME, '
+                               'ancestor=IMAGE or network=NETWORK')
+    format_help = "Print each container with a template, e.g. '{{.ID}} {{.Name}} {{.Ports}}'. " \
+                  "Fields are the API's (Id, Image, State, Labels.KEY, ...) plus " + ', '.join(sorted(CONTAINER_FIELDS))
+    list_cmd.add_argument('--format', help=format_help.replace('%', '%%'))
     list_cmd.set_defaults(func=list_containers)
 
-    inspect_cmd = subparsers.add_parser('inspect', help="Inspects the detail of an container")
-    inspect_cmd.add_argument('container', help="The name or ID of the Container")
-    inspect_cmd.add_argument('--json', action='store_true', help='Render all as json')
-    inspect_cmd.add_argument('--pprint', action='store_true', help='Dump contents using python\'s pprint function')
+    inspect_cmd = subparsers.add_parser('inspect', help="Inspects the detail of one or more containers")
+    inspect_cmd.add_argument('container', nargs="+", help="The name or ID of the Container")
+    documents.add_inspect_arguments(inspect_cmd)
     inspect_cmd.set_defaults(func=inspect_container)
 
     create_cmd = subparsers.add_parser('create', help="Create a new container")
     create_cmd.set_defaults(func=create_container)
 
     run_cmd = subparsers.add_parser('run', help="Create a new container and start it")
+    run_cmd.add_argument('--attach', action='store_true',
+                         help="Stream the container's output and exit with its exit code")
+    run_cmd.add_argument('--wait', action='store_true',
+                         help="Wait for the container to exit and exit with its exit code")
+    run_cmd.add_argument('--rm', action='store_true', help="Remove the container once it exits. Implies --wait")
+    run_cmd.add_argument('--wait-healthy', action='store_true',
+                         help="Wait until the container's health check passes before returning")
+    run_cmd.add_argument('--timeout', type=float, help="Seconds --wait-healthy waits at most")
     run_cmd.set_defaults(func=run_container)
 
     for cmd in [create_cmd, run_cmd]:
@@ -74,8 +127,15 @@ def import_command(docker_client: docker.Client, args, state: dict):
         cmd.add_argument('image', help="The image to create the container from")
         cmd.add_argument('cmd', nargs="*", help="The command to run")
 
+    apply_cmd = subparsers.add_parser('apply', help="Create and start every container described in a stack file")
+    apply_cmd.add_argument('-f', '--file', required=True, help="The stack file to apply (\"-\" for stdin)")
+    apply_cmd.add_argument('--no-start', action='store_true', help="Only create the containers")
+    parallel.add_parallel_argument(apply_cmd, default=8)
+    apply_cmd.set_defaults(func=apply_stack)
+
     start_cmd = subparsers.add_parser('start', help="Start an existing container")
     start_cmd.add_argument('container', nargs="+", help="The container to start")
+    parallel.add_parallel_argument(start_cmd)
     start_cmd.set_defaults(func=start_container)
 
     stop_cmd = subparsers.add_parser('stop', help="Stops a running container")
@@ -85,8 +145,9 @@ def import_command(docker_client: docker.Client, args, state: dict):
 
     stop_cmd_help = "The amount of time to wait, in seconds, before killing the container. " \
                     "Default: {}".format(state['default_stop_time'])
-    stop_cmd.add_argument('-t', '--timeout', default=state['default_stop_time'], help=stop_cmd_help)
+    stop_cmd.add_argument('-t', '--timeout', type=int, default=state['default_stop_time'], help=stop_cmd_help)
     stop_cmd.add_argument('container', nargs="+", help="The container to stop")
+    parallel.add_parallel_argument(stop_cmd)
     stop_cmd.set_defaults(func=stop_container)
 
     rm_cmd = subparsers.add_parser('rm', help="Removes a stopped container")
@@ -97,74 +158,146 @@ def import_command(docker_client: docker.Client, args, state: dict):
     rm_cmd.add_argument('-v', '--volumes', action='store_true', default=False,
                         help='Remove the volumes associated with the container')
     rm_cmd.add_argument('container', nargs="+", help="The container to remove")
+    parallel.add_parallel_argument(rm_cmd)
     rm_cmd.set_defaults(func=rm_container)
 
+    stats_cmd = subparsers.add_parser('stats', help="Shows live resource usage of running containers")
+    stats_cmd.add_argument('--once', action='store_true', help="Print a single sample of each container and exit")
+    stats_cmd.add_argument('--ndjson', action='store_true', help='Print one json object per container and sample')
+    stats_cmd.add_argument('--interval', type=float, default=2.0,
+                           help="Seconds between refreshes of the table. Default: 2")
+    stats_cmd.add_argument('-f', '--filter', action='append',
+                           help="Only show running containers matching KEY=VALUE, as for list. Repeatable")
+    stats_cmd.add_argument('container', nargs="*", help="The container(s) to show. Default: all running containers")
+    parallel.add_parallel_argument(stats_cmd, default=16)
+    stats_cmd.set_defaults(func=stats_container)
+
+    exec_cmd = subparsers.add_parser('exec', help="Runs a command in one or more running containers")
+    exec_cmd.add_argument('-c', '--container', action='append',
+                          help="A container to run the command in. Can be specified multiple times")
+    exec_cmd.add_argument('-f', '--filter', action='append',
+                          help="Run in every running container matching KEY=VALUE, as for list. Repeatable")
+    exec_cmd.add_argument('-a', '--all', action='store_true', help="Run in every running container")
+    exec_cmd.add_argument('-u', '--user', help="The user to run the command as")
+    parallel.add_parallel_argument(exec_cmd, default=8)
+    exec_cmd.add_argument('cmd', nargs=argparse.REMAINDER, help="The command to run, after --")
+    exec_cmd.set_defaults(func=exec_container)
+
+    wait_cmd = subparsers.add_parser('wait', help="Waits until containers exit, become healthy or are running")
+    wait_cmd.add_argument('--condition', choices=waiting.CONDITIONS, default='exited',
+                          help="What to wait for. Default: exited, which exits with the first non-zero exit code")
+    wait_cmd.add_argument('--timeout', type=float, help="Give up after this many seconds")
+    wait_cmd.add_argument('container', nargs="+", help="The container(s) to wait for")
+    parallel.add_parallel_argument(wait_cmd, default=8)
+    wait_cmd.set_defaults(func=wait_container)
+
+    logs_cmd = subparsers.add_parser('logs', help="Prints the logs of one or more containers")
+    logs_cmd.add_argument('-f', '--follow', action='store_true', help="Keep printing new output")
+    time_help = "a unix timestamp, a local time like 2016-06-01T10:00:00 or a duration like 10m, 2h or 1d ago"
+    logs_cmd.add_argument('--since', help="Only print logs written after this time: {}".format(time_help))
+    logs_cmd.add_argument('--until', help="Only print logs written before this time: {}".format(time_help))
+    logs_cmd.add_argument('--tail', default='all',
+                          help="Number of lines to print from the end of each log. Default: all")
+    logs_cmd.add_argument('-t', '--timestamps', action='store_true', help="Show timestamps")
+    logs_cmd.add_argument('-g', '--grep', metavar='PATTERN',
+                          help="Only print lines matching this regular expression")
+    logs_cmd.add_argument('container', nargs="+", help="The container(s) to print the logs of")
+    logs_cmd.set_defaults(func=logs_container)
+
 
 def default(client: docker.Client, args, state: dict):
     print("No valid command specified. `{} container -h` for help.".format(sys.argv[0]))
 
 
 def list_containers(client: docker.Client, args, state: dict):
-    containers = client.containers(all=args.all, quiet=args.quiet)
+    filters = cmd_to_json.parse_filters(args.filter)
+    render = template.compile_template(args.format, CONTAINER_FIELDS) if args.format else None
+
+    if args.cached:
+        if filters:
+            raise errors.DkrException("--filter cannot be used with --cached", errors.INVALID_INPUT)
+        containers = cache.require_snapshot(state).containers(include_stopped=args.all)
+    elif args.pprint or args.json:
+        containers = client.containers(all=args.all, quiet=args.quiet, filters=filters if filters else None)
+    else:
+        params = {'all': 1 if args.all else 0}
+        if filters:
+            params['filters'] = json.dumps(filters)
+        containers = stream_json(client, '/containers/json', params)
 
     if args.pprint:
-        pprint(containers)
+        from pprint import pprint
+        pprint(list(containers))
         return
 
     if args.json:
-        print(json.dumps(containers, indent=4, sort_keys=True))
+        print(json.dumps(list(containers), indent=4, sort_keys=True))
+        return
+
+    if args.ndjson:
+        for container in containers:
+            print(json.dumps(container, sort_keys=True))
+        return
+
+    if render:
+        for container in containers:
+            print(render(container))
         return
 
-    table = []
     if args.quiet:
-        headers = ()
-    else:
-        headers = ["ID", "NAME", "IMAGE", "CMD", "CREATED", "STATUS", "PORTS"]
+        for container in containers:
+            print(container['Id'])
+        return
 
-    for container in containers:
-        row = []
-        table.append(row)
+    if args.stream:
+        table = output.StreamTable(CONTAINER_HEADERS, CONTAINER_WIDTHS)
+        for container in containers:
+            table.write_row(_container_row(container))
+        return
 
-        if args.quiet:
-            row.append(container['Id'])
-            continue
+    from tabulate import tabulate
+    table = [_container_row(container) for container in containers]
+    print(tabulate(table, headers=CONTAINER_HEADERS, tablefmt="plain"))
 
-        row.append(container['Id'][:12])
-        row.append(container['Names'][0][1:])
-        row.append(container['Image'])
-        row.append(container['Command'])
 
-        created_seconds = container['Created']
-        created_date = datetime.fromtimestamp(created_seconds)
-        row.append(re.sub(r"\.[0-9]+", '', pretty.date(created_date, short=True)))
+def _container_row(container: dict) -> list:
+    row = []
 
-        row.append(container['Status'])
+    row.append(container['Id'][:12])
+    row.append(container['Names'][0][1:])
+    row.append(container['Image'])
+    row.append(container['Command'])
+    row.append(_created_string(container['Created']))
+    row.append(container['Status'])
 
-        ports = ""
-        if 'Ports' in container:
-            ports = ', '.join([_port_string(p) for p in container['Ports']])
-        row.append(ports)
+    ports = ""
+    if 'Ports' in container:
+        ports = ', '.join([_port_string(p) for p in container['Ports']])
+    row.append(ports)
 
-    print(tabulate(table, headers=headers, tablefmt="plain"))
+    return row
 
 
-def inspect_container(docker_client: docker.Client, args, state: dict):
-    if args.container == '-':
-        args.container = get_last_container(state)
+def _created_string(created_seconds: int) -> str:
+    import pretty
 
-    container = docker_client.inspect_container(args.container)
+    created_date = datetime.fromtimestamp(created_seconds)
+    return re.sub(r"\.[0-9]+", '', pretty.date(created_date, short=True))
 
-    state['last_container'] = container['Id']
 
-    if args.pprint:
-        pprint(container)
-        return
+def inspect_container(docker_client: docker.Client, args, state: dict):
+    containers = [_resolve_container(container, state) for container in args.container]
 
-    if args.json:
-        print(json.dumps(container, indent=4))
-        return
+    def inspect(container):
+        return cache.with_container(container, state, docker_client.inspect_container)
+
+    inspected, error = documents.print_inspected(containers, inspect, args, docker_client)
 
-    print(yaml.dump(container, default_flow_style=False))
+    if inspected:
+        state['last_container'] = inspected[-1]['Id']
+
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
 
 
 def bind_volumes(volumes: list, docker_args: dict):
@@ -263,25 +396,12 @@ def split_port(port: str) -> Port:
     return Port(ip, int(host_port), int(guest_port), proto)
 
 
-def create_container(docker_client: docker.Client, args, state: dict):
-    image = args.image
-    if image == '-':
-        image = state['last_image']
-    state['last_image'] = image
-
-    cmd = args.cmd if args.cmd else None
-    name = args.name if args.name else None
-
-    ports = args.publish
-    volumes = args.volume
-    environment_variables = args.env
-
+def build_create_args(docker_client: docker.Client, image: str, cmd=None, name: str=None, options: dict=None,
+                      ports: list=None, volumes: list=None, environment_variables: list=None) -> dict:
     docker_args = {}
 
-    if 'option' in args:
-        user_docker_options = cmd_to_json.parse_options(args.option)
-        if user_docker_options:
-            docker_args.update(user_docker_options)
+    if options:
+        docker_args.update(options)
 
     if volumes:
         bind_volumes(volumes, docker_args)
@@ -289,6 +409,9 @@ def create_container(docker_client: docker.Client, args, state: dict):
     if ports:
         bind_ports(ports, docker_args)
 
+    if environment_variables:
+        docker_args['environment'] = environment_variables
+
     if 'host_config' in docker_args:
         docker_args['host_config'] = docker_client.create_host_config(**docker_args['host_config'])
 
@@ -297,68 +420,254 @@ def create_container(docker_client: docker.Client, args, state: dict):
     docker_args['command'] = cmd
     docker_args['name'] = name
 
-    container = docker_client.create_container(**docker_args)
+    return docker_args
 
-    state['last_container'] = container['Id']
 
-    if container['Warnings']:
-        print("WARNING:", container['Warnings'], file=sys.stderr)
+def create_container(docker_client: docker.Client, args, state: dict):
+    container, docker_args = _create_from_args(docker_client, args, state)
 
     if args.id:
         print(container['Id'])
+    elif args.name:
+        print(args.name)
     else:
         container = docker_client.inspect_container(container)
         print(container['Name'][1:])
 
 
+def _create_from_args(docker_client: docker.Client, args, state: dict):
+    image = args.image
+    if image == '-':
+        image = state['last_image']
+    state['last_image'] = image
+
+    cmd = args.cmd if args.cmd else None
+    name = args.name if args.name else None
+
+    user_docker_options = None
+    if 'option' in args:
+        user_docker_options = cmd_to_json.parse_options(args.option)
+
+    docker_args = build_create_args(docker_client, image, cmd, name, user_docker_options,
+                                    args.publish, args.volume, args.env)
+
+    container = docker_client.create_container(**docker_args)
+
+    state['last_container'] = container['Id']
+
+    if container['Warnings']:
+        print("WARNING:", container['Warnings'], file=sys.stderr)
+
+    return container, docker_args
+
+
+def apply_stack(docker_client: docker.Client, args, state: dict):
+    specs = _load_stack(args.file)
+    names = list(specs)
+    dependencies = {name: specs[name]['depends_on'] for name in names}
+    parallel.topological_order(names, dependencies)
+
+    create_args = {}
+    for name in names:
+        spec = specs[name]
+        create_args[name] = build_create_args(docker_client, spec['image'], spec['cmd'], spec['name'],
+                                              cmd_to_json.parse_options(spec['option']),
+                                              spec['publish'], spec['volume'], spec['env'])
+
+    def create(name):
+        return docker_client.create_container(**create_args[name])
+
+    error = 0
+    created = {}
+    for name, container, e in parallel.run_ordered(names, create, args.parallel, docker_client):
+        if e is not None:
+            error = errors.merge(error, errors.report(e))
+            continue
+
+        created[name] = container['Id']
+        state['last_container'] = container['Id']
+        if container['Warnings']:
+            print("WARNING:", name, container['Warnings'], file=sys.stderr)
+        print("Created {}".format(specs[name]['name']))
+
+    if not args.no_start:
+        failed = [name for name in names if name not in created]
+
+        def start(name):
+            if name in failed:
+                raise errors.DkrException("{} was not created".format(specs[name]['name']), errors.INVALID_INPUT)
+            docker_client.start(created[name])
+
+        for name, _, e in parallel.run_graph(names, dependencies, start, args.parallel, docker_client):
+            if e is None:
+                print("Started {}".format(specs[name]['name']))
+            elif name not in failed:
+                error = errors.merge(error, errors.report(e))
+
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
+
+
+def _load_stack(path: str) -> dict:
+    import yaml
+
+    if path == '-':
+        document = yaml.safe_load(sys.stdin)
+    else:
+        with open(path, 'r') as file:
+            document = yaml.safe_load(file)
+
+    if not isinstance(document, dict) or not isinstance(document.get('containers'), dict):
+        raise errors.DkrException("{} must have a `containers` mapping".format(path), errors.INVALID_INPUT)
+
+    specs = {}
+    for key, spec in document['containers'].items():
+        if not isinstance(spec, dict) or 'image' not in spec:
+            raise errors.DkrException("Container {} must have an image".format(key), errors.INVALID_INPUT)
+
+        cmd = spec.get('cmd')
+        specs[key] = {
+            'image': spec['image'],
+            'name': spec.get('name', key),
+            'cmd': cmd if cmd else None,
+            'option': _as_list(spec.get('option')),
+            'publish': _as_list(spec.get('publish')),
+            'volume': _as_list(spec.get('volume')),
+            'env': _as_list(spec.get('env')),
+            'depends_on': _as_list(spec.get('depends_on'))
+        }
+    return specs
+
+
+def _as_list(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
 def start_container(docker_client: docker.Client, args, state: dict):
     containers = args.container
 
-    started = start_containers(containers, docker_client, state, print_update=True)
+    started = start_containers(containers, docker_client, state, print_update=True, jobs=args.parallel)
     state['last_container'] = started[-1]
 
 
-def start_containers(containers, docker_client, state, print_update=False) -> list:
+def start_containers(containers, docker_client, state, print_update=False, jobs=1) -> list:
+    containers = [_resolve_container(container, state) for container in containers]
+
+    def start(container):
+        cache.with_container(container, state, docker_client.start)
+
+    error = 0
     result = []
-    for container in containers:
-        if container == '-':
-            container = get_last_container(state)
-        docker_client.start(container)
+    for container, _, e in parallel.run_ordered(containers, start, jobs, docker_client):
+        if e is not None:
+            error = errors.merge(error, errors.report(e))
+            continue
         if print_update:
             print(container)
         result.append(container)
+
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
     return result
 
 
 def run_container(docker_client: docker.Client, args, state: dict):
-    create_container(docker_client, args, state)
-    start_containers([get_last_container(state)], docker_client, state, print_update=False)
+    if args.wait_healthy and args.attach:
+        raise errors.DkrException("--wait-healthy can not be combined with --attach", errors.INVALID_INPUT)
+
+    container, docker_args = _create_from_args(docker_client, args, state)
+    container_id = container['Id']
+
+    waiter = None
+    if args.wait_healthy:
+        # subscribed before the start, so the health events of a fast container can not be missed
+        waiter = waiting.ContainerWaiter(docker_client, 'healthy')
+        waiter.subscribe()
+
+    attach_stream = None
+    try:
+        if args.attach:
+            # attaching before the start means no output can be missed and nothing has to be polled
+            attach_params = {'stdout': 1, 'stderr': 1, 'stream': 1, 'logs': 0}
+            attach_stream = open_stream(docker_client, 'post', '/containers/{0}/attach', container_id,
+                                        params=attach_params)
+            start_containers([container_id], docker_client, state)
+        elif args.id or args.name:
+            start_containers([container_id], docker_client, state)
+            print(container_id if args.id else args.name)
+        else:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                inspect_future = executor.submit(docker_client.inspect_container, container_id)
+                start_containers([container_id], docker_client, state)
+                print(inspect_future.result()['Name'][1:])
+
+        if waiter is not None:
+            for _, _, e in waiter.wait([container_id], args.timeout):
+                if e is not None:
+                    raise e
+    finally:
+        if waiter is not None:
+            waiter.close()
+
+    if attach_stream is not None:
+        with attach_stream:
+            frames.copy_to_stdio(attach_stream.raw, tty=bool(docker_args.get('tty')))
+
+    if not (args.attach or args.wait or args.rm):
+        return
 
+    exit_code = docker_client.wait(container_id)
+    if isinstance(exit_code, dict):
+        exit_code = exit_code.get('StatusCode', 0)
 
-def stop_container(docker_client: docker.Client, args, state: dict):
-    containers = args.container
+    if args.rm:
+        docker_client.remove_container(container_id, v=True)
+        state.pop('last_container', None)
 
-    error = 0
+    if exit_code:
+        raise errors.DkrException("", exit_code)
+
+
+def wait_container(docker_client: docker.Client, args, state: dict):
+    containers = [_resolve_container(container, state) for container in args.container]
 
+    exit_codes = {}
+    waiter = waiting.ContainerWaiter(docker_client, args.condition, args.parallel)
+    try:
+        waiter.subscribe()
+        for container, exit_code, e in waiter.wait(containers, args.timeout):
+            if e is not None:
+                exit_codes[container] = errors.report(e)
+            elif args.condition == 'exited':
+                print("{} {}".format(container, exit_code))
+                exit_codes[container] = exit_code
+            else:
+                print(container)
+    finally:
+        waiter.close()
+
+    # the first failure in the order the containers were given, so `dkr container wait a b` is deterministic
     for container in containers:
-        if container == '-':
-            container = get_last_container(state)
-        try:
-            docker_client.stop(container, timeout=args.timeout)
+        if exit_codes.get(container):
+            raise errors.DkrException("", exit_codes[container])
+
+
+def stop_container(docker_client: docker.Client, args, state: dict):
+    containers = [_resolve_container(container, state) for container in args.container]
+
+    def stop(container):
+        cache.with_container(container, state, lambda target: docker_client.stop(target, timeout=args.timeout))
+
+    error = 0
+    for container, _, e in parallel.run_ordered(containers, stop, args.parallel, docker_client):
+        if e is None:
             print(container)
-        except docker.errors.APIError as e:
-            status_code = e.response.status_code
-            if status_code < 500:
-                print(e.response.content.decode('utf-8').strip(), file=sys.stderr)
-                error = errors.INVALID_INPUT
-            else:
-                print(e.response.content.decode('utf-8').strip(), file=sys.stderr)
-                if error == 0:
-                    error = errors.DOCKER_ERROR
-        except docker.errors.DockerException as e:
-            print(e.explanation.decode('utf-8').strip(), file=sys.stderr)
-            if error == 0:
-                error = errors.DOCKER_ERROR
+        else:
+            error = errors.merge(error, errors.report(e))
 
     state['last_container'] = containers[-1]
 
@@ -367,31 +676,18 @@ def stop_container(docker_client: docker.Client, args, state: dict):
 
 
 def rm_container(docker_client: docker.Client, args, state: dict):
-    containers = args.container
+    containers = [_resolve_container(container, state) for container in args.container]
 
-    error = 0
+    def remove(container):
+        cache.with_container(container, state, lambda target: docker_client.remove_container(
+            target, link=args.link, v=args.volumes, force=args.force))
 
-    for container in containers:
-        if container == '-':
-            container = get_last_container(state)
-        try:
-            docker_client.remove_container(container, link=args.link, v=args.volumes, force=args.force)
+    error = 0
+    for container, _, e in parallel.run_ordered(containers, remove, args.parallel, docker_client):
+        if e is None:
             print(container)
-        except docker.errors.NotFound:
-            pass
-        except docker.errors.APIError as e:
-            status_code = e.response.status_code
-            if status_code < 500:
-                print(e.response.content.decode('utf-8').strip(), file=sys.stderr)
-                error = errors.INVALID_INPUT
-            else:
-                print(e.response.content.decode('utf-8').strip(), file=sys.stderr)
-                if error == 0:
-                    error = errors.DOCKER_ERROR
-        except docker.errors.DockerException as e:
-            print(e.explanation.decode('utf-8').strip(), file=sys.stderr)
-            if error == 0:
-                error = errors.DOCKER_ERROR
+        elif not isinstance(e, docker.errors.NotFound):
+            error = errors.merge(error, errors.report(e))
 
     if error > 0:
         raise errors.DkrException("There was an error", error)
@@ -400,12 +696,345 @@ def rm_container(docker_client: docker.Client, args, state: dict):
         state.pop('last_container')
 
 
+def exec_container(docker_client: docker.Client, args, state: dict):
+    cmd = args.cmd[1:] if args.cmd and args.cmd[0] == '--' else args.cmd
+    if not cmd:
+        raise errors.DkrException("No command given, e.g. `dkr container exec --all -- hostname`", errors.INVALID_INPUT)
+
+    targets = _exec_targets(docker_client, args, state)
+    if not targets:
+        raise errors.DkrException("No running containers matched", errors.INVALID_INPUT)
+
+    width = max(len(name) for _, name in targets)
+    output_queue = queue.Queue(maxsize=EXEC_QUEUE_SIZE)
+    work = queue.Queue()
+    for target in targets:
+        work.put(target)
+
+    def worker():
+        while True:
+            try:
+                container, name = work.get_nowait()
+            except queue.Empty:
+                return
+
+            prefix = "{} | ".format(name.ljust(width)).encode('utf-8') if len(targets) > 1 else b''
+            try:
+                exit_code = _exec_in(docker_client, container, state, cmd, args.user, prefix, output_queue)
+                output_queue.put((None, (name, exit_code, None)))
+            except Exception as e:
+                output_queue.put((None, (name, None, e)))
+
+    jobs = max(1, min(args.parallel, len(targets)))
+    if hasattr(docker_client, 'ensure_pool_size'):
+        docker_client.ensure_pool_size(jobs)
+    for _ in range(jobs):
+        threading.Thread(target=worker, daemon=True).start()
+
+    outputs = {frames.STDERR: sys.stderr.buffer}
+    failures = []
+    error = 0
+    finished = 0
+    try:
+        while finished < len(targets):
+            stream, item = output_queue.get()
+            if stream is not None:
+                outputs.get(stream, sys.stdout.buffer).write(item)
+                if output_queue.empty():
+                    sys.stdout.buffer.flush()
+                    sys.stderr.buffer.flush()
+                continue
+
+            finished += 1
+            name, exit_code, e = item
+            if e is not None:
+                print("{}: ".format(name), end='', file=sys.stderr)
+                error = errors.merge(error, errors.report(e))
+            elif exit_code:
+                failures.append("{}: exited with {}".format(name, exit_code))
+                error = errors.merge(error, errors.COMMAND_ERROR)
+    except KeyboardInterrupt:
+        raise errors.DkrException("Interrupted, the command may still be running in some containers",
+                                  errors.COMMAND_ERROR)
+    finally:
+        sys.stdout.buffer.flush()
+        sys.stderr.buffer.flush()
+
+    state['last_container'] = targets[-1][0]
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
+
+
+def _exec_targets(docker_client: docker.Client, args, state: dict) -> list:
+    filters = cmd_to_json.parse_filters(args.filter)
+    if not args.container and not filters and not args.all:
+        raise errors.DkrException("Choose the containers with --container, --filter or --all", errors.INVALID_INPUT)
+
+    targets = []
+    for container in args.container or []:
+        container = _resolve_container(container, state)
+        targets.append((container, container))
+
+    if filters or args.all:
+        for container in docker_client.containers(filters=filters if filters else None):
+            targets.append((container['Id'], container['Names'][0][1:]))
+    return targets
+
+
+def _exec_in(docker_client: docker.Client, container: str, state: dict, cmd: list, user: str, prefix: bytes,
+             output_queue: queue.Queue) -> int:
+    def create(target):
+        return docker_client.exec_create(target, cmd, stdout=True, stderr=True, user=user if user else '')
+
+    exec_id = cache.with_container(container, state, create)['Id']
+
+    response = open_stream(docker_client, 'post', '/exec/{0}/start', exec_id,
+                           data=json.dumps({'Detach': False, 'Tty': False}),
+                           headers={'Content-Type': 'application/json'})
+    with response:
+        for stream, data in frames.iter_lines(response.raw, False, prefix):
+            output_queue.put((stream, data))
+
+    # the exit code can lag the end of the output stream by a moment
+    for _ in range(EXEC_EXIT_POLLS):
+        exit_code = docker_client.exec_inspect(exec_id).get('ExitCode')
+        if exit_code is not None:
+            return exit_code
+        time.sleep(0.05)
+    raise errors.DkrException("Unknown exit code, the command was still running after its output ended",
+                              errors.COMMAND_ERROR)
+
+
+def logs_container(docker_client: docker.Client, args, state: dict):
+    containers = [_resolve_container(container, state) for container in args.container]
+
+    params = {'stdout': 1, 'stderr': 1, 'follow': int(args.follow), 'timestamps': int(args.timestamps),
+              'tail': args.tail}
+    if args.since:
+        params['since'] = _parse_time(args.since)
+    if args.until:
+        params['until'] = _parse_time(args.until)
+
+    pattern = None
+    if args.grep:
+        try:
+            # matched against the raw bytes, so lines that are filtered out are never decoded
+            pattern = re.compile(args.grep.encode('utf-8'))
+        except re.error as e:
+            raise errors.DkrException("Invalid --grep pattern: {}".format(e), errors.INVALID_INPUT)
+
+    def inspect(container):
+        return cache.with_container(container, state, docker_client.inspect_container)
+
+    # sized for all containers, as every followed log holds on to a connection for as long as it runs
+    error = 0
+    inspected = []
+    for container, info, e in parallel.run_ordered(containers, inspect, len(containers), docker_client):
+        if e is None:
+            inspected.append(info)
+        else:
+            error = errors.merge(error, errors.report(e))
+
+    if inspected:
+        state['last_container'] = inspected[-1]['Id']
+
+    names = [info['Name'][1:] for info in inspected]
+    width = max([len(name) for name in names] + [0])
+    lock = threading.Lock()
+    failures = []
+
+    def print_log(info: dict, name: str):
+        prefix = "{} | ".format(name.ljust(width)).encode('utf-8') if len(inspected) > 1 else b''
+        try:
+            _print_log(docker_client, info, params, prefix, pattern, lock)
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=print_log, args=(info, name), daemon=True)
+               for info, name in zip(inspected, names)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for thread in threads:
+            # joined with a timeout so Ctrl+C is noticed while following
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        return
+
+    for e in failures:
+        error = errors.merge(error, errors.report(e))
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
+
+
+def _print_log(docker_client: docker.Client, info: dict, params: dict, prefix: bytes, pattern, lock: threading.Lock):
+    outputs = {frames.STDERR: sys.stderr.buffer}
+
+    response = open_stream(docker_client, 'get', '/containers/{0}/logs', info['Id'], params=params)
+    with response:
+        tty = info['Config'].get('Tty', False)
+        for stream, data in frames.iter_lines(response.raw, tty, prefix, pattern):
+            out = outputs.get(stream, sys.stdout.buffer)
+            with lock:
+                out.write(data)
+                out.flush()
+
+
+def stats_container(docker_client: docker.Client, args, state: dict):
+    filters = cmd_to_json.parse_filters(args.filter)
+    if args.container:
+        if filters:
+            raise errors.DkrException("--filter cannot be used with named containers", errors.INVALID_INPUT)
+        containers = [_resolve_container(container, state) for container in args.container]
+
+        def inspect(container):
+            return cache.with_container(container, state, docker_client.inspect_container)
+
+        targets = []
+        error = 0
+        for container, info, e in parallel.run_ordered(containers, inspect, args.parallel, docker_client):
+            if e is None:
+                targets.append((info['Id'], info['Name'][1:]))
+            else:
+                error = errors.merge(error, errors.report(e))
+        if error > 0:
+            raise errors.DkrException("There was an error", error)
+    else:
+        targets = [(container['Id'], container['Names'][0][1:])
+                   for container in docker_client.containers(filters=filters if filters else None)]
+
+    if args.once:
+        _print_stats_once(docker_client, args, targets)
+        return
+
+    names = dict(targets)
+    watcher = stats.StatsWatcher(docker_client, [container_id for container_id, _ in targets])
+    watcher.start()
+    tty = sys.stdout.isatty()
+    try:
+        while watcher.running:
+            time.sleep(args.interval)
+            samples = watcher.snapshot()
+            if not samples and not watcher.running:
+                break
+            if args.ndjson:
+                now = time.time()
+                lines = [json.dumps(_stats_record(container_id, names[container_id], usage, now), sort_keys=True)
+                         for container_id, usage in samples]
+                sys.stdout.write(''.join(line + '\n' for line in lines))
+            else:
+                rows = [_stats_row(container_id, names[container_id], usage, rates=True)
+                        for container_id, usage in samples]
+                frame = _stats_table(rows, STATS_RATE_HEADERS)
+                sys.stdout.write(CLEAR_SCREEN + frame if tty else frame + '\n')
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        return
+
+    error = 0
+    for e in watcher.errors:
+        error = errors.merge(error, errors.report(e))
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
+
+
+def _print_stats_once(docker_client: docker.Client, args, targets: list):
+    def fetch(target):
+        return stats.fetch_once(docker_client, target[0])
+
+    rows = []
+    error = 0
+    now = time.time()
+    for (container_id, name), usage, e in parallel.run_ordered(targets, fetch, args.parallel, docker_client):
+        if e is not None:
+            error = errors.merge(error, errors.report(e))
+        elif args.ndjson:
+            print(json.dumps(_stats_record(container_id, name, usage, now), sort_keys=True))
+        else:
+            rows.append(_stats_row(container_id, name, usage, rates=False))
+
+    if rows:
+        sys.stdout.write(_stats_table(rows, STATS_HEADERS))
+
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
+
+
+def _stats_record(container_id: str, name: str, usage: dict, now: float) -> dict:
+    record = {'id': container_id, 'name': name, 'time': now}
+    record.update(usage)
+    return record
+
+
+def _stats_row(container_id: str, name: str, usage: dict, rates: bool) -> list:
+    if rates:
+        net = "{}/s / {}/s".format(output.sizeof_fmt(usage['net_rx_rate']), output.sizeof_fmt(usage['net_tx_rate']))
+        block = "{}/s / {}/s".format(output.sizeof_fmt(usage['block_read_rate']),
+                                     output.sizeof_fmt(usage['block_write_rate']))
+    else:
+        net = "{} / {}".format(output.sizeof_fmt(usage['net_rx']), output.sizeof_fmt(usage['net_tx']))
+        block = "{} / {}".format(output.sizeof_fmt(usage['block_read']), output.sizeof_fmt(usage['block_write']))
+
+    return [
+        container_id[:12],
+        name,
+        "{:.2f}%".format(usage['cpu_percent']),
+        "{} / {}".format(output.sizeof_fmt(usage['memory_usage']), output.sizeof_fmt(usage['memory_limit'])),
+        "{:.2f}%".format(usage['memory_percent']),
+        net,
+        block,
+        usage['pids']
+    ]
+
+
+def _stats_table(rows: list, headers: list) -> str:
+    buffer = io.StringIO()
+    table = output.StreamTable(headers, STATS_WIDTHS, file=buffer)
+    table.write_headers()
+    for row in rows:
+        table.write_row(row)
+    return buffer.getvalue()
+
+
+def _parse_time(value: str) -> int:
+    try:
+        return int(float(value))
+    except ValueError:
+        pass
+
+    try:
+        return int(time.time() - cmd_to_json.parse_duration(value))
+    except errors.DkrException:
+        pass
+
+    for time_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, time_format).timestamp())
+        except ValueError:
+            pass
+
+    raise errors.DkrException("Invalid time: {}".format(value), errors.INVALID_INPUT)
+
+
 def get_last_container(state):
     if 'last_container' not in state:
         raise errors.DkrException('No container to reference for "-"', errors.INVALID_INPUT)
     return state['last_container']
 
 
+# The container the user meant, as they would like to see it printed. API calls go through cache.with_container, which
+# turns names and ID prefixes into full ids without asking the daemon while `dkr cache watch` keeps the cache fresh.
+def _resolve_container(container: str, state: dict) -> str:
+    if container == '-':
+        return get_last_container(state)
+    return container
+
+
 def _port_string(port_obj: dict) -> str:
     ip = "{}:".format(port_obj['IP']) if 'IP' in port_obj else ''
     private_port = port_obj['PrivatePort'] if 'PrivatePort' in port_obj else ''
@@ -2,13 +2,45 @@ import docker
 import docker.errors
 
 import sys
-from pprint import pprint
-from tabulate import tabulate
 import json
 from datetime import datetime
-import pretty
 import re
-import yaml
+import heapq
+import itertools
+import os
+import stat
+import time
+from collections import OrderedDict
+
+from dkr_core import archive
+from dkr_core import buildcontext
+from dkr_core import cache
+from dkr_core import cmd_to_json
+from dkr_core import documents
+from dkr_core import errors
+from dkr_core import jsonstream
+from dkr_core import layers
+from dkr_core import output
+from dkr_core import parallel
+from dkr_core import progress
+from dkr_core.client import open_stream, stream_json
+
+IMAGE_HEADERS = ["ID", "REPO", "TAG", "CREATED", "SIZE", "VIRTUAL SIZE"]
+IMAGE_WIDTHS = [12, 32, 16, 10, 10, 0]
+
+SORT_KEYS = {
+    'size': lambda image: image['Size'],
+    'created': lambda image: image['Created']
+}
+
+
+USAGE_HEADERS = ["ID", "REPOSITORY:TAG", "CONTAINERS", "SIZE", "SHARED", "UNIQUE"]
+USAGE_SORT_KEYS = {
+    'unique': lambda usage: usage['UniqueSize'],
+    'size': lambda usage: usage['Size'],
+    'shared': lambda usage: usage['SharedSize'],
+    'created': lambda usage: usage['Created']
+}
 
 
 def command() -> list:
@@ -31,25 +63,91 @@ def import_command(docker_client: docker.Client, args, state: dict):
     list_cmd.add_argument('-q', '--quiet', action='store_true', help='Only print IDs')
     list_cmd.add_argument('--json', action='store_true', help='Render all as json')
     list_cmd.add_argument('--pprint', action='store_true', help='Dump contents using python\'s pprint function')
+    list_cmd.add_argument('--ndjson', action='store_true', help='Stream one json object per line')
+    list_cmd.add_argument('--stream', action='store_true',
+                          help='Print rows as they are received using fixed-width columns')
+    list_cmd.add_argument('--cached', action='store_true',
+                          help='Read from the snapshot kept by `cache watch` instead of asking the daemon')
+    list_cmd.add_argument('-f', '--filter', action='append',
+                          help='Filter on the daemon, e.g. dangling=true, label=KEY=VALUE, reference=REPO, '
+                               'before=IMAGE or since=IMAGE')
+    list_cmd.add_argument('--sort', choices=sorted(SORT_KEYS), help='Sort largest or newest first')
+    list_cmd.add_argument('-n', '--limit', type=int, help='Only print the first N rows')
     list_cmd.set_defaults(func=list_images)
 
-    inspect_cmd = subparsers.add_parser('inspect', help="Inspects the detail of an image")
-    inspect_cmd.add_argument('image', help="The name or ID of the Image")
-    inspect_cmd.add_argument('--json', action='store_true', help='Render all as json')
-    inspect_cmd.add_argument('--pprint', action='store_true', help='Dump contents using python\'s pprint function')
+    inspect_cmd = subparsers.add_parser('inspect', help="Inspects the detail of one or more images")
+    inspect_cmd.add_argument('image', nargs="+", help="The name or ID of the Image")
+    documents.add_inspect_arguments(inspect_cmd)
     inspect_cmd.set_defaults(func=inspect_image)
 
     pull_cmd = subparsers.add_parser('pull', help="Pulls an image")
-    pull_cmd.add_argument('image', help="The name of the image to pull")
+    pull_cmd.add_argument('image', nargs="*", help="The name of the image(s) to pull")
     pull_cmd.add_argument('-a', '--all-tags', action='store_true', help='Download all tagged images in the repository')
+    pull_cmd.add_argument('--from-file', metavar='FILE',
+                          help='Also pull every image listed in FILE, one per line ("-" for stdin)')
+    parallel.add_parallel_argument(pull_cmd)
     pull_cmd.set_defaults(func=pull_image)
 
-    rm_cmd = subparsers.add_parser('rm', help="Removes an image")
-    rm_cmd.add_argument('image', nargs="+", help="The name of the image to remove")
+    build_cmd = subparsers.add_parser('build', help="Builds an image from a directory with a Dockerfile")
+    build_cmd.add_argument('context', help="The build context directory")
+    build_cmd.add_argument('-t', '--tag', action='append', default=[], help="Name and tag for the image")
+    build_cmd.add_argument('-f', '--file', help="The Dockerfile, inside the context. Default: CONTEXT/Dockerfile")
+    build_cmd.add_argument('--build-arg', action='append', default=[], metavar='KEY=VALUE',
+                           help="Set a build-time variable")
+    build_cmd.add_argument('--target', help="The build stage to stop at")
+    build_cmd.add_argument('--no-cache', action='store_true',
+                           help="Do not use the daemon's cache, and always send the context")
+    build_cmd.add_argument('--pull', action='store_true',
+                           help="Always pull newer base images, and always send the context")
+    build_cmd.add_argument('--force', action='store_true',
+                           help="Send the context even when it has not changed since the last build of the tags")
+    build_cmd.add_argument('-q', '--quiet', action='store_true', help="Only print the image ID")
+    build_cmd.set_defaults(func=build_image)
+
+    rm_cmd = subparsers.add_parser('rm', help="Removes images, children before their parents")
+    rm_cmd.add_argument('image', nargs="*", help="The name of the image(s) to remove")
+    rm_cmd.add_argument('--dangling', action='store_true', help='Also remove untagged images no container uses')
     rm_cmd.add_argument('-f', '--force', action='store_true', help='Force removal of the image')
     rm_cmd.add_argument('--no-prune', action='store_true', help='Do not delete untagged parents')
+    parallel.add_parallel_argument(rm_cmd)
     rm_cmd.set_defaults(func=rm_image)
 
+    save_cmd = subparsers.add_parser('save', help="Saves images to a tar archive, compressed by its extension")
+    save_cmd.add_argument('image', nargs="+", help="The name(s) of the image(s) to save")
+    save_cmd.add_argument('-o', '--output', default='-',
+                          help="File to write: .tar, .tar.gz/.tgz or .tar.zst. Default: stdout")
+    save_cmd.add_argument('--compress', choices=archive.COMPRESSIONS,
+                          help="Compression to use instead of the one the extension implies")
+    save_cmd.add_argument('-l', '--level', type=int, help="Compression level. Default: 6 for gzip, 3 for zstd")
+    parallel.add_parallel_argument(save_cmd, default=os.cpu_count() or 1)
+    save_cmd.set_defaults(func=save_image)
+
+    load_cmd = subparsers.add_parser('load', help="Loads images from a tar archive, compressed or not")
+    load_cmd.add_argument('-i', '--input', default='-', help="File to read. Default: stdin")
+    parallel.add_parallel_argument(load_cmd, default=os.cpu_count() or 1)
+    load_cmd.set_defaults(func=load_image)
+
+    usage_cmd = subparsers.add_parser('usage', help="Shows the disk space used by images, accounting for shared layers")
+    usage_cmd.add_argument('--sort', choices=sorted(USAGE_SORT_KEYS), default='unique',
+                           help='Sort largest or newest first. Default: unique')
+    usage_cmd.add_argument('-n', '--limit', type=int, help='Only print the first N images')
+    usage_cmd.add_argument('--ndjson', action='store_true', help='Print one json object per image')
+    usage_cmd.set_defaults(func=image_usage)
+
+    prune_cmd = subparsers.add_parser('prune', help="Removes images no tag or container needs")
+    prune_mode = prune_cmd.add_mutually_exclusive_group()
+    prune_mode.add_argument('--dangling', action='store_true',
+                            help="Only remove untagged images no container uses. The default")
+    prune_mode.add_argument('--unused', action='store_true',
+                            help="Also remove tagged images no container, running or not, uses")
+    prune_cmd.add_argument('--older-than', metavar='DURATION',
+                           help="Only remove images created longer ago than this, e.g. 12h or 7d")
+    prune_cmd.add_argument('--min-size', metavar='SIZE',
+                           help="Only remove images that would free at least this much on their own, e.g. 100M")
+    prune_cmd.add_argument('--dry-run', action='store_true', help="Only print what would be removed")
+    parallel.add_parallel_argument(prune_cmd)
+    prune_cmd.set_defaults(func=prune_images)
+
 
 # noinspection PyUnusedLocal
 def default(client: docker.Client, args, state: dict):
@@ -57,133 +155,503 @@ def default(client: docker.Client, args, state: dict):
 
 
 def list_images(client: docker.Client, args, state: dict):
-    images = client.images(all=args.all)
+    filters = cmd_to_json.parse_filters(args.filter)
+
+    if args.cached:
+        if filters:
+            raise errors.DkrException("--filter cannot be used with --cached", errors.INVALID_INPUT)
+        images = cache.require_snapshot(state).images()
+    elif args.pprint or args.json:
+        images = client.images(all=args.all, filters=filters if filters else None)
+    else:
+        params = {'all': 1 if args.all else 0}
+        if filters:
+            params['filters'] = json.dumps(filters)
+        images = stream_json(client, '/images/json', params)
+
+    if args.sort:
+        key = SORT_KEYS[args.sort]
+        if args.limit is not None:
+            images = heapq.nlargest(args.limit, images, key=key)
+        else:
+            images = sorted(images, key=key, reverse=True)
+    elif args.limit is not None:
+        images = itertools.islice(images, args.limit)
 
     if args.pprint:
-        pprint(images)
+        from pprint import pprint
+        pprint(list(images))
         return
 
     if args.json:
-        print(json.dumps(images, indent=4, sort_keys=True))
+        print(json.dumps(list(images), indent=4, sort_keys=True))
+        return
+
+    if args.ndjson:
+        for image in images:
+            print(json.dumps(image, sort_keys=True))
         return
 
-    table = []
     if args.quiet:
-        headers = ()
-    else:
-        headers = ["ID", "REPO", "TAG", "CREATED", "SIZE", "VIRTUAL SIZE"]
+        for image in images:
+            print(_full_id(image))
+        return
 
-    for image in images:
-        full_id = image['Id']
-        if full_id.startswith("sha256:"):
-            full_id = full_id[7:]
+    rows = (row for image in images for row in _image_rows(image))
+    if args.limit is not None:
+        rows = itertools.islice(rows, args.limit)
 
-        if args.quiet:
-            row = []
-            table.append(row)
-            row.append(full_id)
-            continue
+    if args.stream:
+        table = output.StreamTable(IMAGE_HEADERS, IMAGE_WIDTHS)
+        for row in rows:
+            table.write_row(row)
+        return
 
-        tags = image['RepoTags']
+    from tabulate import tabulate
+    print(tabulate(list(rows), headers=IMAGE_HEADERS, tablefmt="plain"))
 
-        for tag in tags:
-            row = []
-            table.append(row)
 
-            row.append(full_id[:12])
-            split = tag.split(":")
-            row.append(split[0])
-            row.append(split[1])
+def _full_id(image: dict) -> str:
+    full_id = image['Id']
+    if full_id.startswith("sha256:"):
+        full_id = full_id[7:]
+    return full_id
 
-            created_seconds = image['Created']
-            created_date = datetime.fromtimestamp(created_seconds)
-            row.append(re.sub(r"\.[0-9]+", '', pretty.date(created_date, short=True)))
 
-            row.append(_sizeof_fmt(image['Size']))
-            row.append(_sizeof_fmt(image['VirtualSize']))
+def _image_rows(image: dict) -> list:
+    import pretty
 
-    print(tabulate(table, headers=headers, tablefmt="plain"))
+    full_id = _full_id(image)
+    created_date = datetime.fromtimestamp(image['Created'])
+    created = re.sub(r"\.[0-9]+", '', pretty.date(created_date, short=True))
+    size = output.sizeof_fmt(image['Size'])
+    virtual_size = output.sizeof_fmt(image.get('VirtualSize', image['Size']))
+
+    rows = []
+    for tag in image.get('RepoTags') or ['<none>:<none>']:
+        repo, _, tag_name = tag.rpartition(":")
+        rows.append([full_id[:12], repo, tag_name, created, size, virtual_size])
+    return rows
 
 
 def inspect_image(docker_client: docker.Client, args, state: dict):
-    if args.image == '-':
-        args.image = state['last_image']
-    image = docker_client.inspect_image(args.image)
+    images = [state['last_image'] if image == '-' else image for image in args.image]
 
-    state['last_image'] = image['RepoTags'][0]
+    def inspect(image):
+        return cache.with_image(image, state, docker_client.inspect_image)
 
-    if args.pprint:
-        pprint(image)
-        return
+    inspected, error = documents.print_inspected(images, inspect, args, docker_client)
 
-    if args.json:
-        print(json.dumps(image, indent=4))
-        return
+    if inspected and inspected[-1].get('RepoTags'):
+        state['last_image'] = inspected[-1]['RepoTags'][0]
 
-    print(yaml.dump(image, default_flow_style=False))
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
 
 
 def pull_image(docker_client: docker.Client, args, state: dict):
-    if args.image == '-':
-        args.image = state['last_image']
+    images = list(args.image)
+    if args.from_file:
+        images.extend(_read_image_list(args.from_file))
 
-    CURSOR_UP_ONE = '\x1b[1A'
-    ERASE_LINE = '\x1b[2K'
+    if not images:
+        raise errors.DkrException("No images to pull", errors.INVALID_INPUT)
 
-    image = args.image
+    for index, image in enumerate(images):
+        if image == '-':
+            image = state['last_image']
 
-    if not args.all_tags and ":" not in image:
-        image = "{}:latest".format(image)
+        if not args.all_tags and ":" not in image:
+            image = "{}:latest".format(image)
+        images[index] = image
 
-    state['last_image'] = image
+    state['last_image'] = images[-1]
 
-    print("Pulling {}".format(image))
-    pull_status_gen = docker_client.pull(image, stream=True)
+    pull_progress = progress.PullProgress(images=images)
 
-    previous_layer = ""
-    for pull_status in pull_status_gen:
-        pull_statuses = pull_status.decode('utf8').strip().split("\r\n")
+    def pull(image):
+        pull_progress.message("Pulling {}".format(image))
+        pull_status_gen = docker_client.pull(image, stream=True)
+        for pull_obj in jsonstream.iter_objects(pull_status_gen):
+            pull_progress.update(pull_obj, image)
 
-        for ps in pull_statuses:
-            pull_obj = json.loads(ps)
+    for image, _, e in parallel.run_ordered(images, pull, args.parallel, docker_client):
+        if e is not None:
+            if isinstance(e, docker.errors.APIError):
+                message = e.response.content.decode('utf-8').strip()
+            else:
+                message = str(e)
+            pull_progress.update({'error': message}, image)
+
+    pull_progress.finish()
+
+
+def _build_args(values: list) -> dict:
+    result = {}
+    for value in values:
+        key, separator, setting = value.partition('=')
+        if not separator:
+            # like docker, a bare KEY passes on the variable from the environment
+            if key not in os.environ:
+                continue
+            setting = os.environ[key]
+        result[key] = setting
+    return result
+
+
+def _tags_point_to(docker_client: docker.Client, tags: list, image_id: str) -> bool:
+    try:
+        if not tags:
+            return docker_client.inspect_image(image_id)['Id'] == image_id
+        return all(docker_client.inspect_image(tag)['Id'] == image_id for tag in tags)
+    except docker.errors.NotFound:
+        return False
+
+
+# The ids the base images currently have locally, or None when one of them is missing
+def _base_image_ids(docker_client: docker.Client, bases: list):
+    try:
+        return {base: docker_client.inspect_image(base)['Id'] for base in bases}
+    except docker.errors.NotFound:
+        return None
+
+
+def build_image(docker_client: docker.Client, args, state: dict):
+    context = args.context
+    if not os.path.isdir(context):
+        raise errors.DkrException("{} is not a directory".format(context), errors.INVALID_INPUT)
+
+    dockerfile_path = os.path.join(context, 'Dockerfile')
+    if args.file:
+        dockerfile_path = args.file
+        if not os.path.isabs(dockerfile_path) and not os.path.exists(dockerfile_path):
+            # a relative -f that does not exist from the working directory is taken relative to the context
+            dockerfile_path = os.path.join(context, dockerfile_path)
+    dockerfile = os.path.relpath(dockerfile_path, context).replace(os.sep, '/')
+    if dockerfile == '..' or dockerfile.startswith('../'):
+        raise errors.DkrException("The Dockerfile must be inside the context", errors.INVALID_INPUT)
+
+    tags = [state['last_image'] if tag == '-' else tag for tag in args.tag]
+    build_args = _build_args(args.build_arg)
+
+    rules = buildcontext.IgnoreRules.from_context(context)
+    entries = list(buildcontext.iter_context(context, rules, {dockerfile, '.dockerignore'}))
+    if not any(path == dockerfile for path, _ in entries):
+        raise errors.DkrException("No {} in {}".format(dockerfile, context), errors.INVALID_INPUT)
+
+    with open(os.path.join(context, dockerfile), 'r', errors='replace') as file:
+        bases = buildcontext.base_images(file.read())
+
+    index = buildcontext.ContextIndex(buildcontext.index_file(context))
+    key = buildcontext.build_key(dockerfile, tags, build_args, args.target)
+    previous = index.previous_build(key)
+    if previous and bases is not None and not (args.no_cache or args.pull or args.force):
+        context_digest = index.context_digest(context, entries)
+        # a base image pulled again since the last build invalidates the daemon's cache of every step after FROM
+        base_ids = _base_image_ids(docker_client, bases)
+        if context_digest == previous['digest'] and base_ids is not None and previous.get('bases') == base_ids and \
+                _tags_point_to(docker_client, tags, previous['image']):
+            # the daemon would only replay its cache for the same context, Dockerfile and base images
+            index.save()
+            print(previous['image'] if args.quiet else "Context unchanged, {} is up to date".format(
+                ', '.join(tags) if tags else previous['image']))
+            state['last_image'] = tags[-1] if tags else previous['image']
+            return
+
+    params = {
+        't': tags or None,
+        'dockerfile': dockerfile,
+        'buildargs': json.dumps(build_args) if build_args else None,
+        'target': args.target,
+        'nocache': 1 if args.no_cache else None,
+        'pull': 1 if args.pull else None,
+        'rm': 1
+    }
+    send_progress = progress.TransferProgress("Sending build context", file=sys.stderr)
+
+    def body():
+        for chunk in archive.prefetch(buildcontext.iter_tar(context, entries, index)):
+            send_progress.update(send_progress.transferred + len(chunk))
+            yield chunk
+
+    response = open_stream(docker_client, 'post', '/build', params=params, data=body(),
+                           headers={'Content-Type': 'application/x-tar'})
+    files = len([path for path, path_stat in entries if not stat.S_ISDIR(path_stat.st_mode)])
+    send_progress.finish("Sent build context of {} files:".format(files))
+
+    image_id = None
+    pull_progress = None
+    with response:
+        for event in jsonstream.iter_objects(response.iter_content(None)):
+            if 'error' in event:
+                raise errors.DkrException(event['error'].strip(), errors.DOCKER_ERROR)
+
+            if 'status' in event:
+                if args.quiet:
+                    continue
+                # base images pulled by FROM report like `image pull` does
+                if pull_progress is None:
+                    pull_progress = progress.PullProgress()
+                pull_progress.update(event)
+                continue
+            if pull_progress is not None:
+                pull_progress.finish()
+                pull_progress = None
+
+            if 'aux' in event and 'ID' in (event['aux'] or {}):
+                image_id = event['aux']['ID']
+            elif 'stream' in event:
+                built = re.match(r'Successfully built ([0-9a-f]+)', event['stream'])
+                if built and image_id is None:
+                    image_id = built.group(1)
+                if not args.quiet:
+                    sys.stdout.write(event['stream'])
+                    sys.stdout.flush()
+
+    if image_id is None:
+        raise errors.DkrException("The build did not report an image", errors.DOCKER_ERROR)
+
+    # the index is only updated by a successful build, so a failed one is retried in full next time
+    if len(image_id) < 64:
+        image_id = docker_client.inspect_image(image_id)['Id']
+    base_ids = _base_image_ids(docker_client, bases) if bases is not None else None
+    index.save(key, index.context_digest(context, entries), image_id, base_ids)
 
-            this_id = pull_obj['id'] if 'id' in pull_obj else ""
-            if previous_layer == this_id:
-                print(CURSOR_UP_ONE + ERASE_LINE + CURSOR_UP_ONE)
+    if args.quiet:
+        print(image_id)
+    state['last_image'] = tags[-1] if tags else image_id
 
-            if 'status' in pull_obj:
-                if 'progress' in pull_obj:
-                    print("{} {} {}".format(pull_obj['status'], this_id, pull_obj['progress']))
-                else:
-                    print("{} {}".format(pull_obj['status'], this_id))
-                previous_layer = this_id
-            else:
-                if 'error' in pull_obj:
-                    print("Error while pulling: {}".format(pull_obj['error']))
-                else:
-                    print("derp? {}".format(json.dumps(pull_obj)))
+
+def save_image(docker_client: docker.Client, args, state: dict):
+    images = [state['last_image'] if image == '-' else image for image in args.image]
+    compression = args.compress or archive.compression_for_path(args.output)
+
+    if args.output == '-':
+        if sys.stdout.isatty():
+            raise errors.DkrException("Refusing to write an archive to a terminal, use -o FILE", errors.INVALID_INPUT)
+        output_file = sys.stdout.buffer
+        temp_file = None
+        save_progress = progress.TransferProgress("Saved", file=sys.stderr)
+    else:
+        # written next to the target and renamed when complete, so an interrupted save never looks like an archive
+        temp_file = "{}.{}.tmp".format(args.output, os.getpid())
+        output_file = open(temp_file, 'wb')
+        save_progress = progress.TransferProgress("Saved")
+
+    try:
+        response = open_stream(docker_client, 'get', '/images/get', params={'names': images})
+        with response:
+            writer = archive.open_writer(output_file, compression, args.level, args.parallel)
+            transferred = 0
+            for chunk in archive.prefetch(iter(lambda: response.raw.read(archive.BLOCK_SIZE), b'')):
+                writer.write(chunk)
+                transferred += len(chunk)
+                save_progress.update(transferred, writer.written)
+            writer.close()
+            save_progress.update(transferred, writer.written)
+
+        if temp_file is not None:
+            output_file.close()
+            os.replace(temp_file, args.output)
+    except BaseException:
+        if temp_file is not None:
+            output_file.close()
+            os.remove(temp_file)
+        raise
+
+    target = " to {}".format(args.output) if temp_file is not None else ""
+    save_progress.finish("Saved {} image(s){}:".format(len(images), target))
+    state['last_image'] = images[-1]
+
+
+def load_image(docker_client: docker.Client, args, state: dict):
+    input_file = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    load_progress = progress.TransferProgress("Loaded", file=sys.stderr if args.input == '-' else None)
+
+    with input_file:
+        source, chunks = archive.open_reader(input_file, args.parallel)
+
+        def body():
+            for chunk in archive.prefetch(chunks):
+                # an empty chunk would end the chunked request body early
+                if not chunk:
+                    continue
+                load_progress.update(load_progress.transferred + len(chunk), source.consumed)
+                yield chunk
+
+        response = open_stream(docker_client, 'post', '/images/load', params={'quiet': 1}, data=body(),
+                               headers={'Content-Type': 'application/x-tar'})
+        with response:
+            messages = list(jsonstream.iter_objects(response.iter_content(None)))
+
+    load_progress.finish("Loaded:")
+    for message in messages:
+        if 'error' in message:
+            raise errors.DkrException(message['error'].strip(), errors.DOCKER_ERROR)
+        if message.get('stream', '').strip():
+            print(message['stream'].strip())
+            if message['stream'].startswith('Loaded image: '):
+                state['last_image'] = message['stream'][len('Loaded image: '):].strip()
+
+
+def _layer_graph(docker_client: docker.Client) -> layers.LayerGraph:
+    images = docker_client.images(all=True)
+    containers = docker_client.containers(all=True)
+    return layers.LayerGraph(images, containers)
+
+
+def _tag_string(image_tags: list) -> str:
+    if not image_tags:
+        return layers.NO_TAG
+    if len(image_tags) == 1:
+        return image_tags[0]
+    return "{} (+{})".format(image_tags[0], len(image_tags) - 1)
+
+
+def image_usage(docker_client: docker.Client, args, state: dict):
+    graph = _layer_graph(docker_client)
+    usage = graph.usage()
+
+    key = USAGE_SORT_KEYS[args.sort]
+    if args.limit is not None:
+        usage = heapq.nlargest(args.limit, usage, key=key)
+    else:
+        usage.sort(key=key, reverse=True)
+
+    if args.ndjson:
+        for image in usage:
+            print(json.dumps(image, sort_keys=True))
+        return
+
+    from tabulate import tabulate
+    rows = [[_full_id(image)[:12], _tag_string(image['RepoTags']), image['Containers'],
+             output.sizeof_fmt(image['Size']), output.sizeof_fmt(image['SharedSize']),
+             output.sizeof_fmt(image['UniqueSize'])] for image in usage]
+    print(tabulate(rows, headers=USAGE_HEADERS, tablefmt="plain"))
+
+    print()
+    print("{} layers, {} on disk".format(len(graph.images), output.sizeof_fmt(graph.disk_usage())))
+    print("{} reclaimable by removing dangling images".format(
+        output.sizeof_fmt(graph.reclaimable(graph.tagged() | graph.used()))))
+    print("{} reclaimable by removing images no container uses".format(
+        output.sizeof_fmt(graph.reclaimable(graph.used()))))
+
+
+def prune_images(docker_client: docker.Client, args, state: dict):
+    created_before = None
+    if args.older_than:
+        created_before = time.time() - cmd_to_json.parse_duration(args.older_than)
+    min_size = cmd_to_json.parse_size(args.min_size) if args.min_size else None
+
+    graph = _layer_graph(docker_client)
+    plan = layers.plan_prune(graph, unused=args.unused, created_before=created_before, min_size=min_size)
+
+    if args.dry_run:
+        for image_id, exclusive in plan.targets:
+            print("Would remove {} {} {}".format(image_id, _tag_string(layers.tags(graph.images[image_id])),
+                                                 output.sizeof_fmt(exclusive)))
+        print("Would reclaim {}".format(output.sizeof_fmt(plan.reclaimed)))
+        return
+
+    def remove(target):
+        image_id = target[0]
+        # an image with several tags can only be removed by id when forced; nothing uses it, or it wouldn't be a target
+        force = len(layers.tags(graph.images[image_id])) > 1
+        docker_client.remove_image(image_id, force=force)
+
+    error = 0
+    for (image_id, exclusive), _, e in parallel.run_ordered(plan.targets, remove, args.parallel, docker_client):
+        if e is None:
+            print("Removed {} {} {}".format(image_id, _tag_string(layers.tags(graph.images[image_id])),
+                                            output.sizeof_fmt(exclusive)))
+        elif isinstance(e, docker.errors.NotFound):
+            # already gone with an image removed before it
+            continue
+        else:
+            error = errors.merge(error, errors.report(e))
+
+    print("Reclaimed up to {}".format(output.sizeof_fmt(plan.reclaimed)))
+
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
+
+
+def _read_image_list(path: str) -> list:
+    if path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path, 'r') as file:
+            lines = file.readlines()
+
+    images = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            images.append(line)
+    return images
 
 
 def rm_image(docker_client: docker.Client, args, state: dict):
-    images = args.image
+    if not args.image and not args.dangling:
+        raise errors.DkrException("Give the image(s) to remove or --dangling", errors.INVALID_INPUT)
 
-    for image in images:
+    graph = _layer_graph(docker_client)
+
+    # names are grouped by the image they resolve to, so the tags of one image are removed one after the other
+    names = OrderedDict()
+    for image in args.image:
         if image == '-':
             image = state['last_image']
 
-        if ":" not in image:
-            image = "{}:latest".format(image)
-
-        try:
-            docker_client.remove_image(image, force=args.force, noprune=args.no_prune)
-            print("Removed image {}".format(image))
-        except docker.errors.NotFound as e:
+        image_id = graph.resolve(image)
+        if image_id is None:
+            # unknown to the listing, e.g. a digest reference; the daemon reports what is wrong with it
+            if ":" not in image and "@" not in image:
+                image = "{}:latest".format(image)
+            image_id = image
+        names.setdefault(image_id, []).append(image)
+
+    if args.dangling:
+        dangling = graph.dangling()
+        for image_id in graph.order:
+            if image_id in dangling:
+                names.setdefault(image_id, [image_id])
+
+    dependencies = graph.removal_dependencies({image_id for image_id in names if image_id in graph.images})
+
+    # containers keep their image, and so every parent of it, so they are reported before anything is removed
+    in_use = {}
+    users_of = graph.users_of(set(names))
+    for image_id in names:
+        users = users_of.get(image_id)
+        if users:
+            in_use[image_id] = users
+            print("{} is used by {}".format(', '.join(names[image_id]), ', '.join(sorted(users))), file=sys.stderr)
+
+    def remove(image_id):
+        if image_id in in_use and not args.force:
+            raise errors.DkrException(None, errors.INVALID_INPUT)
+
+        removed = []
+        for name in names[image_id]:
+            try:
+                docker_client.remove_image(name, force=args.force, noprune=args.no_prune)
+            except docker.errors.NotFound:
+                # the daemon already removed it as the untagged parent of an image removed before
+                if image_id not in graph.images:
+                    raise
+            removed.append(name)
+        return removed
+
+    error = 0
+    for image_id, removed, e in parallel.run_graph(list(names), dependencies, remove, args.parallel, docker_client):
+        if e is None:
+            for name in removed:
+                print("Removed image {}".format(name))
+        elif isinstance(e, docker.errors.NotFound):
             print(e.explanation.decode('utf8'), file=sys.stderr)
+        else:
+            error = errors.merge(error, errors.report(e))
 
-
-def _sizeof_fmt(num, suffix='B'):
-    for unit in ['','K','M','G','T','P','E','Z']:
-        if abs(num) < 1000.0:
-            return "%3.1f %s%s" % (num, unit, suffix)
-        num /= 1000.0
-    return "%.1f %s%s" % (num, 'Yi', suffix)
\ No newline at end of file
+    if error > 0:
+        raise errors.DkrException("There was an error", error)
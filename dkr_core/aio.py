@@ -0,0 +1,339 @@
+import asyncio
+import codecs
+import json
+import os
+import time
+from urllib.parse import quote, urlencode, urlparse
+
+from dkr_core import errors
+from dkr_core.jsonstream import _Scanner
+
+DEFAULT_SOCKET = '/var/run/docker.sock'
+DEFAULT_MAX_CONNECTIONS = 32
+READ_SIZE = 65536
+
+
+class APIError(errors.DkrException):
+    def __init__(self, status_code: int, message: str):
+        exit_code = errors.INVALID_INPUT if status_code < 500 else errors.DOCKER_ERROR
+        super().__init__(message, exit_code)
+        self.status_code = status_code
+
+
+def _address(environ: dict):
+    host = environ.get('DOCKER_HOST') or "unix://{}".format(DEFAULT_SOCKET)
+    if host.startswith('unix://'):
+        return host[len('unix://'):], None, None
+
+    parsed = urlparse(host if '://' in host else "tcp://{}".format(host))
+    tls = environ.get('DOCKER_TLS_VERIFY') or parsed.scheme == 'https'
+    ssl_context = None
+    if tls:
+        import ssl
+        cert_path = environ.get('DOCKER_CERT_PATH') or os.path.join(os.path.expanduser('~'), '.docker')
+        ssl_context = ssl.create_default_context(cafile=os.path.join(cert_path, 'ca.pem'))
+        ssl_context.load_cert_chain(os.path.join(cert_path, 'cert.pem'), os.path.join(cert_path, 'key.pem'))
+        # same as the blocking client, which is created with assert_hostname=False
+        ssl_context.check_hostname = False
+    return None, (parsed.hostname, parsed.port or (2376 if tls else 2375)), ssl_context
+
+
+def _encode_params(params: dict) -> str:
+    values = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        if isinstance(value, bool):
+            value = 1 if value else 0
+        elif isinstance(value, dict):
+            value = json.dumps(value)
+        values[key] = value
+    return urlencode(values, doseq=True)
+
+
+# One response of the daemon. The connection goes back to the client's pool once the body has been read to the end,
+# and is closed if the response is closed before that, so streams like events can be abandoned at any point.
+class Response:
+    def __init__(self, reader, writer, status: int, headers: dict, method: str, release):
+        self.status = status
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+        self._release = release
+        self._chunked = headers.get('transfer-encoding', '').lower() == 'chunked'
+        self._chunk_left = 0
+        self._remaining = None
+        if 'content-length' in headers and not self._chunked:
+            self._remaining = int(headers['content-length'])
+        if method == 'HEAD' or status in (204, 304):
+            self._remaining = 0
+        self._reusable = headers.get('connection', '').lower() != 'close' and (
+            self._chunked or self._remaining is not None)
+        self._done = False
+        if self._remaining == 0:
+            self._finish()
+
+    def _finish(self, reuse: bool=True):
+        if self._done:
+            return
+        self._done = True
+        self._release(self._reader, self._writer, reuse and self._reusable)
+
+    def close(self):
+        self._finish(reuse=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # The next piece of the body, at most `size` bytes; b'' once it has been read completely
+    async def read(self, size: int=READ_SIZE) -> bytes:
+        if self._done:
+            return b''
+
+        reader = self._reader
+        try:
+            if self._chunked:
+                if self._chunk_left == 0:
+                    line = await reader.readline()
+                    chunk_size = int(line.split(b';')[0], 16) if line.strip() else 0
+                    if chunk_size == 0:
+                        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                            pass
+                        self._finish()
+                        return b''
+                    self._chunk_left = chunk_size
+
+                data = await reader.read(min(size, self._chunk_left))
+                if not data:
+                    raise asyncio.IncompleteReadError(b'', self._chunk_left)
+                self._chunk_left -= len(data)
+                if self._chunk_left == 0:
+                    await reader.readexactly(2)
+                return data
+
+            if self._remaining is None:
+                data = await reader.read(size)
+                if not data:
+                    self._finish(reuse=False)
+                return data
+
+            data = await reader.read(min(size, self._remaining))
+            if not data:
+                raise asyncio.IncompleteReadError(b'', self._remaining)
+            self._remaining -= len(data)
+            if self._remaining == 0:
+                self._finish()
+            return data
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            self.close()
+            raise errors.DkrException("The Docker daemon closed the connection mid-response", errors.DOCKER_ERROR)
+
+    async def body(self) -> bytes:
+        parts = []
+        while True:
+            data = await self.read()
+            if not data:
+                return b''.join(parts)
+            parts.append(data)
+
+    async def json(self):
+        return json.loads((await self.body()).decode('utf-8'))
+
+    # `async for obj in response.objects()` decodes a stream of concatenated JSON objects (events, pull progress,
+    # stats) as the bytes arrive
+    def objects(self):
+        return _Objects(self)
+
+
+class _Objects:
+    def __init__(self, response: Response):
+        self.response = response
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.scanner = _Scanner(array=False)
+        self.ready = []
+        self.finished = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while not self.ready:
+            if self.finished:
+                raise StopAsyncIteration
+            data = await self.response.read()
+            if data:
+                self.ready.extend(self.scanner.feed(self.decoder.decode(data)))
+            else:
+                self.finished = True
+                self.ready.extend(self.scanner.feed(self.decoder.decode(b'', final=True), final=True))
+        return self.ready.pop(0)
+
+
+# HTTP/1.1 over the daemon's socket. Idle keep-alive connections are reused, and at most max_connections requests
+# are in flight at once: callers beyond that wait for a slot, so a handler can asyncio.gather hundreds of calls.
+class AsyncClient:
+    def __init__(self, sync_client=None, max_connections: int=DEFAULT_MAX_CONNECTIONS, version: str=None,
+                 timings=None, environ: dict=None):
+        if environ is None:
+            environ = os.environ
+
+        self.sync = sync_client
+        self.max_connections = max_connections
+        self.version = version or environ.get('DOCKER_API_VERSION')
+        self.timings = timings
+        self._socket_path, self._host, self._ssl = _address(environ)
+        self._idle = []
+        self._semaphore = None
+
+    def url(self, path: str, *path_args, params: dict=None) -> str:
+        if path_args:
+            path = path.format(*[quote(str(arg), safe='') for arg in path_args])
+        if self.version:
+            path = "/v{}{}".format(self.version, path)
+        if params:
+            query = _encode_params(params)
+            if query:
+                path = "{}?{}".format(path, query)
+        return path
+
+    async def _connect(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not reader.at_eof() and not writer.transport.is_closing():
+                return reader, writer, True
+            writer.close()
+
+        if self._socket_path is not None:
+            reader, writer = await asyncio.open_unix_connection(self._socket_path)
+        else:
+            reader, writer = await asyncio.open_connection(self._host[0], self._host[1], ssl=self._ssl)
+        return reader, writer, False
+
+    def _release(self, reader, writer, reuse: bool):
+        if reuse:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        self._semaphore.release()
+
+    async def _send(self, method: str, url: str, body: bytes, headers: dict):
+        lines = ["{} {} HTTP/1.1".format(method, url), "Host: docker", "Content-Length: {}".format(len(body))]
+        lines.extend("{}: {}".format(name, value) for name, value in headers.items())
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + body
+
+        while True:
+            reader, writer, reused = await self._connect()
+            try:
+                writer.write(request)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError()
+            except (OSError, asyncio.IncompleteReadError):
+                writer.close()
+                # the daemon may have dropped an idle connection since it was last used
+                if reused:
+                    continue
+                raise
+
+            try:
+                response_headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    response_headers[name.strip().lower()] = value.strip()
+                return reader, writer, int(status_line.split()[1]), response_headers
+            except BaseException:
+                writer.close()
+                raise
+
+    # Sends a request and returns the Response as soon as its headers have arrived. The caller reads the body and must
+    # close the response if it stops early. Error statuses are raised as APIError with the daemon's message.
+    async def open(self, method: str, path: str, *path_args, params: dict=None, body=None,
+                   headers: dict=None) -> Response:
+        request_headers = dict(headers or {})
+        if body is None:
+            body = b''
+        elif not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+            request_headers.setdefault('Content-Type', 'application/json')
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+        await self._semaphore.acquire()
+
+        started = time.perf_counter()
+        try:
+            reader, writer, status, response_headers = await self._send(
+                method, self.url(path, *path_args, params=params), body, request_headers)
+        except BaseException:
+            self._semaphore.release()
+            self._record(method, path, started, True)
+            raise
+        failed = status >= 400
+        self._record(method, path, started, failed)
+
+        response = Response(reader, writer, status, response_headers, method, self._release)
+        if failed:
+            content = (await response.body()).decode('utf-8', 'replace').strip()
+            try:
+                message = json.loads(content).get('message', content)
+            except (ValueError, AttributeError):
+                message = content
+            raise APIError(status, message or "{} {} failed with {}".format(method, path, status))
+        return response
+
+    def _record(self, method: str, path: str, started: float, failed: bool):
+        if self.timings is not None:
+            self.timings.record_call("async {} {}".format(method, path), time.perf_counter() - started, failed)
+
+    # Sends a request and returns its decoded JSON body, or None when the daemon sent no body
+    async def request(self, method: str, path: str, *path_args, params: dict=None, body=None, headers: dict=None):
+        response = await self.open(method, path, *path_args, params=params, body=body, headers=headers)
+        content = await response.body()
+        if not content:
+            return None
+        if 'json' not in response.headers.get('content-type', 'json'):
+            return content
+        return json.loads(content.decode('utf-8'))
+
+    async def get(self, path: str, *path_args, params: dict=None):
+        return await self.request('GET', path, *path_args, params=params)
+
+    async def post(self, path: str, *path_args, params: dict=None, body=None):
+        return await self.request('POST', path, *path_args, params=params, body=body)
+
+    async def delete(self, path: str, *path_args, params: dict=None):
+        return await self.request('DELETE', path, *path_args, params=params)
+
+    def close(self):
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+# Runs an `async def func(docker_client, args, state)` handler on its own event loop, handing it an AsyncClient whose
+# `sync` attribute is the regular docker-py client
+def run(func, docker_client, args, state: dict):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    client = AsyncClient(docker_client, timings=getattr(docker_client, 'timings', None))
+    try:
+        return loop.run_until_complete(func(client, args, state))
+    finally:
+        all_tasks = getattr(asyncio, 'all_tasks', None) or asyncio.Task.all_tasks
+        pending = [task for task in all_tasks(loop) if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+        client.close()
+        # lets the closed transports finish before the loop goes away
+        loop.run_until_complete(asyncio.sleep(0))
+        loop.close()
+        asyncio.set_event_loop(None)
@@ -0,0 +1,325 @@
+import queue
+import struct
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dkr_core import errors
+
+BLOCK_SIZE = 1 << 20
+# chunks a reading thread may run ahead of whoever consumes them
+QUEUE_SIZE = 16
+
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# Every gzip member dkr writes holds one block and carries its own compressed size in an extra field, the way bgzip
+# does, so a reader can find the next member without inflating the current one and decompress them in parallel. Other
+# tools see a plain multi-member gzip file.
+SIZE_SUBFIELD = b'DK'
+_BLOCK_HEADER = struct.Struct('<4sIBBH2sHI')
+_BLOCK_TRAILER = struct.Struct('<II')
+_BLOCK_MAGIC = GZIP_MAGIC + b'\x08\x04'
+_BLOCK_EXTRA_SIZE = 8
+
+
+def compression_for_path(path: str) -> str:
+    if path.endswith(('.gz', '.tgz')):
+        return 'gzip'
+    if path.endswith(('.zst', '.tzst')):
+        return 'zstd'
+    return 'none'
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise errors.DkrException("zstd archives need the zstandard package: pip install zstandard",
+                                  errors.INVALID_INPUT)
+    return zstandard
+
+
+def _compress_block(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    deflated = compressor.compress(data) + compressor.flush()
+    member_size = _BLOCK_HEADER.size + len(deflated) + _BLOCK_TRAILER.size
+    header = _BLOCK_HEADER.pack(_BLOCK_MAGIC, 0, 0, 255, _BLOCK_EXTRA_SIZE, SIZE_SUBFIELD, 4, member_size)
+    trailer = _BLOCK_TRAILER.pack(zlib.crc32(data) & 0xffffffff, len(data) & 0xffffffff)
+    return b''.join((header, deflated, trailer))
+
+
+def _decompress_block(member: bytes) -> bytes:
+    view = memoryview(member)
+    crc, size = _BLOCK_TRAILER.unpack_from(member, len(member) - _BLOCK_TRAILER.size)
+    try:
+        data = zlib.decompress(view[_BLOCK_HEADER.size:len(member) - _BLOCK_TRAILER.size], -zlib.MAX_WBITS)
+    except zlib.error as e:
+        raise errors.DkrException("Corrupt gzip block: {}".format(e), errors.INVALID_INPUT)
+    if len(data) != size or zlib.crc32(data) & 0xffffffff != crc:
+        raise errors.DkrException("Corrupt gzip block: checksum mismatch", errors.INVALID_INPUT)
+    return data
+
+
+class _PlainWriter:
+    def __init__(self, file):
+        self.file = file
+        self.written = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.written += len(data)
+
+    def close(self):
+        pass
+
+
+# Compresses BLOCK_SIZE blocks on `jobs` threads (zlib releases the GIL) and writes them in order. At most 2 * jobs
+# blocks are in flight, so memory stays the same no matter how much is written.
+class _GzipWriter:
+    def __init__(self, file, level: int, jobs: int):
+        self.file = file
+        self.level = level
+        self.written = 0
+        self.buffer = bytearray()
+        self.blocks = 0
+        self.pending = deque()
+        self.limit = jobs * 2
+        self.executor = ThreadPoolExecutor(max_workers=jobs)
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            block = bytes(self.buffer[:BLOCK_SIZE])
+            del self.buffer[:BLOCK_SIZE]
+            self._submit(block)
+
+    def _submit(self, block: bytes):
+        self.pending.append(self.executor.submit(_compress_block, block, self.level))
+        self.blocks += 1
+        while len(self.pending) >= self.limit:
+            self._write_next()
+
+    def _write_next(self):
+        member = self.pending.popleft().result()
+        self.file.write(member)
+        self.written += len(member)
+
+    def close(self):
+        # an empty archive still needs one member to be a valid gzip file
+        if self.buffer or not self.blocks:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self._write_next()
+        self.executor.shutdown()
+
+
+class _ZstdWriter:
+    def __init__(self, file, level: int, jobs: int):
+        zstandard = _import_zstandard()
+        self.file = file
+        self.written = 0
+        # libzstd splits the input between its own worker threads
+        self.compressor = zstandard.ZstdCompressor(level=level, threads=jobs).compressobj()
+
+    def write(self, data):
+        self._write(self.compressor.compress(data))
+
+    def _write(self, data: bytes):
+        if data:
+            self.file.write(data)
+            self.written += len(data)
+
+    def close(self):
+        self._write(self.compressor.flush())
+
+
+# Returns an object with write(data), close() and `written`, the number of bytes that reached `file`
+def open_writer(file, compression: str, level: int=None, jobs: int=1):
+    if compression == 'none':
+        return _PlainWriter(file)
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == 'gzip':
+        return _GzipWriter(file, level, max(1, jobs))
+    return _ZstdWriter(file, level, max(1, jobs))
+
+
+# A file whose first bytes have already been read to detect the format; `consumed` counts what was read from it
+class _Source:
+    def __init__(self, file):
+        self.file = file
+        self.head = b''
+        self.consumed = 0
+        # read() hands these bytes out again before reading on
+        self.head = self.read_exactly(_BLOCK_HEADER.size)
+        self.consumed = 0
+
+    def read(self, size: int=BLOCK_SIZE) -> bytes:
+        if self.head:
+            data, self.head = self.head[:size], self.head[size:]
+        else:
+            data = self.file.read(size)
+        self.consumed += len(data)
+        return data
+
+    def read_exactly(self, size: int) -> bytes:
+        parts = []
+        remaining = size
+        while remaining > 0:
+            data = self.read(remaining)
+            if not data:
+                break
+            parts.append(data)
+            remaining -= len(data)
+        return b''.join(parts)
+
+
+def _is_block_gzip(head: bytes) -> bool:
+    if len(head) < _BLOCK_HEADER.size:
+        return False
+    magic, _, _, _, extra_size, subfield, subfield_size, _ = _BLOCK_HEADER.unpack(head)
+    return magic == _BLOCK_MAGIC and extra_size == _BLOCK_EXTRA_SIZE and subfield == SIZE_SUBFIELD and \
+        subfield_size == 4
+
+
+def _iter_block_members(source: _Source):
+    while True:
+        header = source.read_exactly(_BLOCK_HEADER.size)
+        if not header:
+            return
+        if not _is_block_gzip(header):
+            raise errors.DkrException("Corrupt gzip block header", errors.INVALID_INPUT)
+
+        member_size = _BLOCK_HEADER.unpack(header)[-1]
+        rest = source.read_exactly(member_size - len(header))
+        if len(rest) < member_size - len(header):
+            raise errors.DkrException("Truncated gzip archive", errors.INVALID_INPUT)
+        yield header + rest
+
+
+def _iter_block_gzip(source: _Source, jobs: int):
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        pending = deque()
+        for member in _iter_block_members(source):
+            pending.append(executor.submit(_decompress_block, member))
+            if len(pending) >= jobs * 2:
+                data = pending.popleft().result()
+                # the member of an empty archive holds nothing
+                if data:
+                    yield data
+        while pending:
+            data = pending.popleft().result()
+            if data:
+                yield data
+
+
+def _iter_gzip(source: _Source):
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    in_member = False
+    while True:
+        data = source.read()
+        if not data:
+            break
+
+        while data:
+            in_member = True
+            # bounded output, so a block that inflates enormously is still handed on in pieces
+            output = decompressor.decompress(data, BLOCK_SIZE)
+            if output:
+                yield output
+            if decompressor.eof:
+                data = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+                in_member = False
+            else:
+                data = decompressor.unconsumed_tail
+
+        while in_member:
+            output = decompressor.decompress(b'', BLOCK_SIZE)
+            if not output:
+                break
+            yield output
+
+    if in_member and not decompressor.eof:
+        raise errors.DkrException("Truncated gzip archive", errors.INVALID_INPUT)
+
+
+def _iter_zstd(source: _Source):
+    decompressor = _import_zstandard().ZstdDecompressor()
+    try:
+        reader = decompressor.stream_reader(source, read_across_frames=True)
+    except TypeError:
+        # zstandard before 0.13 only reads the first frame, which is all dkr itself writes
+        reader = decompressor.stream_reader(source)
+    while True:
+        data = reader.read(BLOCK_SIZE)
+        if not data:
+            return
+        yield data
+
+
+def _iter_plain(source: _Source):
+    while True:
+        data = source.read()
+        if not data:
+            return
+        yield data
+
+
+# Returns (source, chunks): the tar inside `file`, whichever way it is compressed, as an iterator of chunks. The
+# format is detected from the first bytes, so stdin works as well as files. source.consumed is the bytes read so far.
+def open_reader(file, jobs: int=1):
+    source = _Source(file)
+    head = source.head
+    if _is_block_gzip(head):
+        return source, _iter_block_gzip(source, max(1, jobs))
+    if head.startswith(GZIP_MAGIC):
+        return source, _iter_gzip(source)
+    if head.startswith(ZSTD_MAGIC):
+        return source, _iter_zstd(source)
+    return source, _iter_plain(source)
+
+
+# Runs the `chunks` iterator on its own thread, at most QUEUE_SIZE chunks ahead of the consumer, so reading and
+# decompressing overlap with whatever the consumer does with them
+def prefetch(chunks):
+    items = queue.Queue(QUEUE_SIZE)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(done)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = items.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
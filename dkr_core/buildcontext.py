@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import re
+import stat
+import tarfile
+import time
+
+from dkr_core import errors
+from dkr_core.state import read_json, write_json_atomic
+
+READ_SIZE = 1 << 20
+INDEX_VERSION = 1
+# files modified this close to the last index write may have changed again within the same mtime tick
+RACY_SECONDS = 2
+
+_END_OF_ARCHIVE = b'\0' * (2 * tarfile.BLOCKSIZE)
+
+
+def _translate(pattern: str) -> str:
+    regex = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith('**', index):
+            index += 2
+            if pattern.startswith('/', index):
+                # `**/` also matches no directory at all
+                regex.append('(?:.*/)?')
+                index += 1
+            else:
+                regex.append('.*')
+            continue
+
+        if char == '*':
+            regex.append('[^/]*')
+        elif char == '?':
+            regex.append('[^/]')
+        elif char == '[' and pattern.find(']', index + 1) > index + 1:
+            end = pattern.find(']', index + 1)
+            body = pattern[index + 1:end]
+            if body[0] in '!^':
+                body = '^' + body[1:]
+            regex.append('[{}]'.format(body.replace('\\', '\\\\')))
+            index = end
+        elif char == '\\' and index + 1 < len(pattern):
+            index += 1
+            regex.append(re.escape(pattern[index]))
+        else:
+            regex.append(re.escape(char))
+        index += 1
+    return ''.join(regex)
+
+
+# .dockerignore rules, compiled once. A pattern excludes the paths it matches and everything below them, the last
+# matching pattern wins and `!pattern` lines include paths again, the same as the docker CLI.
+class IgnoreRules:
+    def __init__(self, lines: list):
+        self.rules = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+
+            excluded = not line.startswith('!')
+            if not excluded:
+                line = line[1:].strip()
+            line = os.path.normpath(line).lstrip('/')
+            if line in ('', '.'):
+                continue
+            self.rules.append((_translate(line), excluded))
+
+        self.has_exceptions = not all(excluded for _, excluded in self.rules)
+        self.compiled = [(re.compile('(?:{})(?:/.*)?$'.format(regex), re.DOTALL), excluded)
+                         for regex, excluded in self.rules]
+        # without exceptions the order does not matter, so one alternation decides every path
+        self.combined = None
+        if self.rules and not self.has_exceptions:
+            self.combined = re.compile('(?:{})(?:/.*)?$'.format('|'.join(regex for regex, _ in self.rules)), re.DOTALL)
+
+    @classmethod
+    def from_context(cls, context: str):
+        try:
+            with open(os.path.join(context, '.dockerignore'), 'r') as file:
+                return cls(file.readlines())
+        except FileNotFoundError:
+            return cls([])
+
+    def excluded(self, path: str) -> bool:
+        if self.combined is not None:
+            return self.combined.match(path) is not None
+        for regex, excluded in reversed(self.compiled):
+            if regex.match(path):
+                return excluded
+        return False
+
+
+# Yields (path, stat) for everything in the context that is sent, parents before their children, walking every
+# directory once. Excluded directories are skipped as a whole unless an exception pattern could include something
+# below them. Paths in `always` are sent even when ignored, like the Dockerfile and .dockerignore.
+def iter_context(context: str, rules: IgnoreRules, always: set=()):
+    # excluded directories holding one of `always` are still walked to find it
+    always_parents = set()
+    for path in always:
+        parts = path.split('/')[:-1]
+        always_parents.update('/'.join(parts[:index]) for index in range(1, len(parts) + 1))
+
+    pending = ['']
+    while pending:
+        directory = pending.pop()
+        subdirectories = []
+        for entry in sorted(os.scandir(os.path.join(context, directory)), key=lambda item: item.name):
+            path = "{}/{}".format(directory, entry.name) if directory else entry.name
+            entry_stat = entry.stat(follow_symlinks=False)
+            is_directory = stat.S_ISDIR(entry_stat.st_mode)
+
+            if path not in always and rules.excluded(path):
+                if is_directory and (rules.has_exceptions or path in always_parents):
+                    subdirectories.append(path)
+                continue
+
+            if is_directory:
+                subdirectories.append(path)
+            elif not (stat.S_ISREG(entry_stat.st_mode) or stat.S_ISLNK(entry_stat.st_mode)):
+                # sockets, fifos and devices have no place in an image
+                continue
+            yield path, entry_stat
+        pending.extend(reversed(subdirectories))
+
+
+_from_instruction = re.compile(r'FROM\s+(.*)$', re.IGNORECASE)
+_escape_directive = re.compile(r'#\s*escape\s*=', re.IGNORECASE)
+
+
+# The images the stages of a Dockerfile start from, other than earlier stages and scratch. None when that can not be
+# told without evaluating it, e.g. a FROM that uses an ARG.
+def base_images(text: str):
+    bases = []
+    stages = set()
+    instruction = ''
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#'):
+            if _escape_directive.match(line):
+                return None
+            continue
+        if line.endswith('\\'):
+            instruction += line[:-1] + ' '
+            continue
+
+        match = _from_instruction.match(instruction + line)
+        instruction = ''
+        if match is None:
+            continue
+        words = [word for word in match.group(1).split() if not word.startswith('--')]
+        if not words or '$' in words[0]:
+            return None
+        if words[0].lower() not in stages and words[0] != 'scratch':
+            bases.append(words[0])
+        if len(words) >= 3 and words[1].lower() == 'as':
+            stages.add(words[2].lower())
+    return bases
+
+
+def _tar_header(context: str, path: str, path_stat) -> bytes:
+    info = tarfile.TarInfo(path)
+    info.mode = stat.S_IMODE(path_stat.st_mode)
+    info.mtime = int(path_stat.st_mtime)
+    # ownership is reset the way the docker CLI does it, files in the image belong to root
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    if stat.S_ISDIR(path_stat.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(path_stat.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = os.readlink(os.path.join(context, path))
+    else:
+        info.size = path_stat.st_size
+    return info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape')
+
+
+# Generates the context as a tar stream in chunks of about READ_SIZE; small files are batched into one chunk, large
+# ones are read piece by piece. Files the index has no hash for are hashed as they are read.
+def iter_tar(context: str, entries: list, index=None):
+    batch = []
+    batch_size = 0
+    for path, path_stat in entries:
+        header = _tar_header(context, path, path_stat)
+        batch.append(header)
+        batch_size += len(header)
+
+        if stat.S_ISREG(path_stat.st_mode) and path_stat.st_size:
+            digest = None
+            if index is not None and index.known(path, path_stat) is None:
+                digest = hashlib.sha256()
+
+            remaining = path_stat.st_size
+            with open(os.path.join(context, path), 'rb') as file:
+                while remaining:
+                    data = file.read(min(READ_SIZE, remaining))
+                    if not data:
+                        raise errors.DkrException("{} shrank while the build context was sent".format(path),
+                                                  errors.INVALID_INPUT)
+                    remaining -= len(data)
+                    if digest is not None:
+                        digest.update(data)
+
+                    batch.append(data)
+                    batch_size += len(data)
+                    if batch_size >= READ_SIZE:
+                        yield b''.join(batch)
+                        batch = []
+                        batch_size = 0
+
+            if digest is not None:
+                index.remember(path, path_stat, digest.hexdigest())
+
+            padding = -path_stat.st_size % tarfile.BLOCKSIZE
+            if padding:
+                batch.append(b'\0' * padding)
+                batch_size += padding
+
+        if batch_size >= READ_SIZE:
+            yield b''.join(batch)
+            batch = []
+            batch_size = 0
+
+    batch.append(_END_OF_ARCHIVE)
+    yield b''.join(batch)
+
+
+def index_file(context: str, dkr_directory: str=None) -> str:
+    if dkr_directory is None:
+        dkr_directory = os.path.join(os.path.expanduser("~"), ".dkr")
+    key = hashlib.sha1(os.path.realpath(context).encode('utf-8', 'surrogateescape')).hexdigest()
+    return os.path.join(dkr_directory, "build", "{}.json".format(key))
+
+
+# Content hashes of the files of one context directory, keyed by path and trusted while size, mtime and inode are
+# unchanged, plus the context digest and image of previous builds. A later build only reads the files whose stat
+# changed to know whether anything it would send is different.
+class ContextIndex:
+    def __init__(self, path: str):
+        self.path = path
+        data = read_json(path)
+        if data.get('version') != INDEX_VERSION:
+            data = {}
+        self.files = data.get('files', {})
+        self.builds = data.get('builds', {})
+        self.written = data.get('written', 0)
+        self.current = {}
+
+    def known(self, path: str, path_stat):
+        if path in self.current:
+            return self.current[path][3]
+
+        entry = self.files.get(path)
+        if entry is None or entry[:3] != [path_stat.st_size, path_stat.st_mtime_ns, path_stat.st_ino]:
+            return None
+        if path_stat.st_mtime >= self.written - RACY_SECONDS:
+            return None
+        self.current[path] = entry
+        return entry[3]
+
+    def remember(self, path: str, path_stat, digest: str):
+        self.current[path] = [path_stat.st_size, path_stat.st_mtime_ns, path_stat.st_ino, digest]
+
+    def _hash_file(self, context: str, path: str, path_stat) -> str:
+        digest = hashlib.sha256()
+        with open(os.path.join(context, path), 'rb') as file:
+            for data in iter(lambda: file.read(READ_SIZE), b''):
+                digest.update(data)
+        self.remember(path, path_stat, digest.hexdigest())
+        return digest.hexdigest()
+
+    # Digest of everything that is sent: paths, modes, link targets and file contents, but not mtimes, which the
+    # builder's cache ignores as well. Only files without a trusted hash are read.
+    def context_digest(self, context: str, entries: list) -> str:
+        digest = hashlib.sha256()
+        for path, path_stat in entries:
+            if stat.S_ISREG(path_stat.st_mode):
+                content = self.known(path, path_stat) or self._hash_file(context, path, path_stat)
+            elif stat.S_ISLNK(path_stat.st_mode):
+                content = os.readlink(os.path.join(context, path))
+            else:
+                content = ''
+            line = "{}\0{:o}\0{}\n".format(path, path_stat.st_mode, content)
+            digest.update(line.encode('utf-8', 'surrogateescape'))
+        return digest.hexdigest()
+
+    def previous_build(self, key: str) -> dict:
+        return self.builds.get(key)
+
+    def save(self, key: str=None, context_digest: str=None, image_id: str=None, bases: dict=None):
+        if key is not None:
+            self.builds[key] = {'digest': context_digest, 'image': image_id, 'bases': bases}
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # hashes of files no longer in the context are dropped
+        write_json_atomic(self.path, {
+            'version': INDEX_VERSION,
+            'written': time.time(),
+            'files': self.current,
+            'builds': self.builds
+        }, indent=None)
+
+
+def build_key(dockerfile: str, tags: list, build_args: dict, target: str=None) -> str:
+    return json.dumps([dockerfile, sorted(tags), sorted(build_args.items()), target])
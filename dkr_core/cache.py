@@ -0,0 +1,248 @@
+import fcntl
+import os
+import sys
+import time
+
+from dkr_core import errors
+from dkr_core.state import read_json, write_json_atomic
+
+CACHE_VERSION = 1
+DEFAULT_MAX_AGE = 30
+HEARTBEAT_INTERVAL = 5
+RESYNC_INTERVAL = 300
+WRITE_INTERVAL = 1
+
+CONTAINER_ACTIONS_REMOVED = ('destroy',)
+# events that change which container a name resolves to, written at once instead of batched
+CONTAINER_ACTIONS_NAMING = ('create', 'destroy', 'rename')
+IMAGE_ACTIONS = ('pull', 'push', 'tag', 'untag', 'delete', 'import', 'load', 'save')
+
+
+def cache_file(dkr_directory: str=None) -> str:
+    if dkr_directory is None:
+        dkr_directory = os.path.join(os.path.expanduser("~"), ".dkr")
+    return os.path.join(dkr_directory, "cache.json")
+
+
+def _short_id(object_id: str) -> str:
+    if object_id.startswith("sha256:"):
+        return object_id[7:]
+    return object_id
+
+
+class Snapshot:
+    def __init__(self, data: dict):
+        self.synced = data.get('synced', 0)
+        self.heartbeat = data.get('heartbeat', 0)
+        self.container_index = data.get('containers', {})
+        self.image_index = data.get('images', {})
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.heartbeat
+
+    def containers(self, include_stopped: bool=False) -> list:
+        result = sorted(self.container_index.values(), key=lambda c: c.get('Created', 0), reverse=True)
+        if include_stopped:
+            return result
+        return [container for container in result if container.get('Status', '').startswith('Up')]
+
+    def images(self) -> list:
+        return sorted(self.image_index.values(), key=lambda i: i.get('Created', 0), reverse=True)
+
+    def resolve_container(self, reference: str) -> list:
+        if reference in self.container_index:
+            return [reference]
+
+        name = '/' + reference.lstrip('/')
+        by_name = [container_id for container_id, container in self.container_index.items()
+                   if name in container.get('Names', [])]
+        if by_name:
+            return by_name
+
+        return [container_id for container_id in self.container_index if container_id.startswith(reference)]
+
+    def resolve_image(self, reference: str) -> list:
+        tag = reference if ':' in reference.split('/')[-1] else "{}:latest".format(reference)
+        by_tag = [image_id for image_id, image in self.image_index.items() if tag in (image.get('RepoTags') or [])]
+        if by_tag:
+            return by_tag
+
+        reference = _short_id(reference)
+        return [image_id for image_id in self.image_index if _short_id(image_id).startswith(reference)]
+
+
+def load_snapshot(max_age: float=DEFAULT_MAX_AGE, path: str=None):
+    data = read_json(path if path else cache_file())
+    if data.get('version') != CACHE_VERSION:
+        return None
+
+    snapshot = Snapshot(data)
+    if snapshot.age > max_age:
+        return None
+    return snapshot
+
+
+def require_snapshot(state: dict):
+    if 'cache_max_age' not in state:
+        state['cache_max_age'] = DEFAULT_MAX_AGE
+
+    snapshot = load_snapshot(state['cache_max_age'])
+    if snapshot is None:
+        message = "No cache newer than {}s, start one with `{} cache watch`".format(state['cache_max_age'],
+                                                                                   os.path.basename(sys.argv[0]))
+        raise errors.DkrException(message, errors.INVALID_INPUT)
+    return snapshot
+
+
+_snapshots = {}
+
+
+# The snapshot the lookups below use, read at most once per command. None unless a watcher keeps it fresh.
+def fresh_snapshot(state: dict):
+    max_age = state.get('cache_max_age', DEFAULT_MAX_AGE)
+    if max_age not in _snapshots:
+        _snapshots[max_age] = load_snapshot(max_age)
+    return _snapshots[max_age]
+
+
+# The full id of a container name or ID prefix, from a fresh snapshot. References the snapshot does not know, or
+# that match several containers, are returned unchanged for the daemon to resolve and report.
+def container_id(reference: str, state: dict) -> str:
+    snapshot = fresh_snapshot(state)
+    if snapshot is None:
+        return reference
+    matches = snapshot.resolve_container(reference)
+    return matches[0] if len(matches) == 1 else reference
+
+
+def image_id(reference: str, state: dict) -> str:
+    snapshot = fresh_snapshot(state)
+    if snapshot is None:
+        return reference
+    matches = snapshot.resolve_image(reference)
+    return matches[0] if len(matches) == 1 else reference
+
+
+# Calls `call` with the full id of the container from a fresh snapshot. Until the watcher has written the event, the
+# snapshot can still name a container that was removed or renamed; the daemon then gets the user's reference instead.
+def with_container(reference: str, state: dict, call):
+    return _with_resolved(container_id(reference, state), reference, call)
+
+
+def with_image(reference: str, state: dict, call):
+    return _with_resolved(image_id(reference, state), reference, call)
+
+
+def _with_resolved(resolved: str, reference: str, call):
+    import docker.errors
+
+    try:
+        return call(resolved)
+    except docker.errors.NotFound:
+        if resolved == reference:
+            raise
+        return call(reference)
+
+
+class Watcher:
+    def __init__(self, docker_client, path: str=None, resync_interval: float=RESYNC_INTERVAL,
+                 heartbeat_interval: float=HEARTBEAT_INTERVAL, log=None):
+        self.docker_client = docker_client
+        self.path = path if path else cache_file()
+        self.resync_interval = resync_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.log = log if log else sys.stderr
+
+        self.containers = {}
+        self.images = {}
+        self.synced = 0
+        self.last_event = 0
+        self.last_write = 0
+        self.dirty = False
+
+    def full_sync(self):
+        containers = self.docker_client.containers(all=True)
+        images = self.docker_client.images()
+
+        self.containers = {container['Id']: container for container in containers}
+        self.images = {image['Id']: image for image in images}
+        self.synced = time.time()
+        self.last_event = int(self.synced)
+        self.write()
+
+        print("Synced {} containers and {} images".format(len(self.containers), len(self.images)), file=self.log)
+
+    def write(self):
+        now = time.time()
+        write_json_atomic(self.path, {
+            'version': CACHE_VERSION,
+            'synced': self.synced,
+            'heartbeat': now,
+            'containers': self.containers,
+            'images': self.images
+        }, indent=None)
+        self.last_write = now
+        self.dirty = False
+
+    def _refresh_container(self, container_id: str):
+        matches = self.docker_client.containers(all=True, filters={'id': container_id})
+        if matches:
+            self.containers[matches[0]['Id']] = matches[0]
+        else:
+            self.containers.pop(container_id, None)
+
+    def _refresh_images(self):
+        self.images = {image['Id']: image for image in self.docker_client.images()}
+
+    def apply(self, event: dict):
+        # newer daemons send Type/Action/Actor, older ones only status/id/from
+        event_type = event.get('Type', 'container' if 'from' in event else 'image')
+        action = event.get('Action', event.get('status', ''))
+        object_id = event.get('Actor', {}).get('ID', event.get('id'))
+        self.last_event = max(self.last_event, event.get('time', 0))
+
+        if event_type == 'container' and object_id:
+            if action in CONTAINER_ACTIONS_REMOVED:
+                self.containers.pop(object_id, None)
+            else:
+                self._refresh_container(object_id)
+            self.dirty = True
+            if action.split(':')[0] in CONTAINER_ACTIONS_NAMING:
+                self.write()
+                return
+        elif event_type == 'image' and action.split(':')[0] in IMAGE_ACTIONS:
+            self._refresh_images()
+            self.dirty = True
+
+        if self.dirty and time.time() - self.last_write >= WRITE_INTERVAL:
+            self.write()
+
+    def watch(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise errors.DkrException("Another cache watcher is already running", errors.INVALID_INPUT)
+
+        with lock_file:
+            self.full_sync()
+            gap = False
+            while True:
+                try:
+                    if gap or time.time() - self.synced >= self.resync_interval:
+                        self.full_sync()
+                        gap = False
+
+                    # each window ends on its own, which is when the heartbeat is written; reconnecting with `since`
+                    # replays anything that happened between windows
+                    until = int(time.time() + self.heartbeat_interval)
+                    for event in self.docker_client.events(since=self.last_event, until=until, decode=True):
+                        self.apply(event)
+                    self.write()
+                except Exception as e:
+                    print("Event stream interrupted, resyncing: {}".format(e), file=self.log)
+                    gap = True
+                    time.sleep(1)
@@ -0,0 +1,120 @@
+import inspect
+import threading
+
+DEFAULT_POOL_SIZE = 10
+
+_pool_lock = threading.Lock()
+
+
+def create_client(max_pool_size: int=None):
+    import docker
+
+    kwargs = {'assert_hostname': False}
+    if max_pool_size and 'max_pool_size' in inspect.signature(docker.from_env).parameters:
+        kwargs['max_pool_size'] = max_pool_size
+    client = docker.from_env(**kwargs)
+
+    if max_pool_size and 'max_pool_size' not in kwargs:
+        grow_pools(client, max_pool_size)
+    return client
+
+
+def _grow_pool(pool, size: int):
+    idle = getattr(pool, 'pool', None)
+    if idle is None or idle.maxsize >= size:
+        return
+
+    with _pool_lock:
+        if pool.pool is not idle:
+            return
+        grown = pool.QueueCls(size)
+        # idle connections are kept, connections in use are put into the new queue when they are released
+        while not idle.empty():
+            grown.put(idle.get_nowait())
+        for _ in range(size - idle.maxsize):
+            grown.put(None)
+        pool.pool = grown
+
+
+def _sized(adapter, get_connection):
+    def sized_get_connection(*args, **kwargs):
+        pool = get_connection(*args, **kwargs)
+        _grow_pool(pool, adapter.dkr_pool_size)
+        return pool
+    return sized_get_connection
+
+
+# Lets every connection pool of the client keep `size` connections, without replacing the client. docker-py before 2.0
+# has no max_pool_size, and its unix socket pools keep a single connection: every other concurrent request would open
+# a new one and throw it away afterwards.
+def grow_pools(client, size: int):
+    for adapter in getattr(client, 'adapters', {}).values():
+        if getattr(adapter, 'dkr_pool_size', 0) >= size:
+            continue
+        if not hasattr(adapter, 'dkr_pool_size'):
+            for name in ('get_connection', 'get_connection_with_tls_context'):
+                if hasattr(adapter, name):
+                    setattr(adapter, name, _sized(adapter, getattr(adapter, name)))
+        adapter.dkr_pool_size = size
+
+
+class LazyClient:
+    def __init__(self, factory=create_client, timings=None):
+        self._factory = factory
+        self._client = None
+        self._max_pool_size = None
+        self.timings = timings
+
+    def _resolve(self):
+        if self._client is None:
+            if self.timings is not None:
+                with self.timings.phase('client'):
+                    self._client = self._factory(self._max_pool_size)
+            else:
+                self._client = self._factory(self._max_pool_size)
+        return self._client
+
+    def ensure_pool_size(self, size: int):
+        current = self._max_pool_size if self._max_pool_size else DEFAULT_POOL_SIZE
+        if size <= current:
+            return
+
+        self._max_pool_size = size
+        if self._client is not None:
+            # grown in place, streams that are already open keep their connections
+            grow_pools(self._client, size)
+
+    def __getattr__(self, name):
+        value = getattr(self._resolve(), name)
+        if self.timings is not None and callable(value):
+            from dkr_core.timings import TIMED_PRIVATE_CALLS
+            if not name.startswith('_') or name in TIMED_PRIVATE_CALLS:
+                return self.timings.wrap(name, value)
+        return value
+
+
+def stream_json(docker_client, path: str, params: dict=None, chunk_size: int=16384):
+    from dkr_core import jsonstream
+
+    response = docker_client._get(docker_client._url(path), params=params, stream=True)
+    docker_client._raise_for_status(response)
+    return jsonstream.iter_array(response.iter_content(chunk_size))
+
+
+def open_stream(docker_client, method: str, path: str, *path_args, params: dict=None, data=None, headers: dict=None):
+    url = docker_client._url(path, *path_args)
+    if method == 'post':
+        kwargs = {'headers': headers} if headers else {}
+        response = docker_client._post(url, params=params, data=data, stream=True, **kwargs)
+    else:
+        response = docker_client._get(url, params=params, stream=True)
+    docker_client._raise_for_status(response)
+
+    # long running streams like attach and logs must not hit the client's request timeout between frames
+    if hasattr(docker_client, '_get_raw_response_socket'):
+        sock = docker_client._get_raw_response_socket(response)
+        for candidate in (sock, getattr(sock, '_sock', None)):
+            if hasattr(candidate, 'settimeout'):
+                candidate.settimeout(None)
+
+    return response
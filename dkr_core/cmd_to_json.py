@@ -1,8 +1,15 @@
 import json
+import re
 import sys
 
 import dkr_core.errors
 
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+SIZE_UNITS = {'': 1, 'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3, 'T': 1000 ** 4}
+
+_duration = re.compile(r'^([0-9]+(?:\.[0-9]+)?)([smhdw])$')
+_size = re.compile(r'^([0-9]+(?:\.[0-9]+)?)\s*([KMGT]?)B?$', re.IGNORECASE)
+
 
 def parse_options(options: list):
     result = {}
@@ -33,6 +40,40 @@ def parse_options(options: list):
     return result
 
 
+def parse_filters(filters: list) -> dict:
+    result = {}
+    if filters:
+        for docker_filter in filters:
+            split = docker_filter.split(sep="=", maxsplit=1)
+            if len(split) != 2 or not split[0]:
+                raise dkr_core.errors.DkrException("Invalid filter, expected KEY=VALUE: {}".format(docker_filter),
+                                                   dkr_core.errors.INVALID_INPUT)
+
+            name = split[0]
+            if name not in result:
+                result[name] = []
+            result[name].append(split[1])
+
+    return result
+
+
+def parse_duration(value: str) -> float:
+    match = _duration.match(value)
+    if not match:
+        raise dkr_core.errors.DkrException("Invalid duration, expected e.g. 30s, 10m, 2h, 7d or 4w: {}".format(value),
+                                           dkr_core.errors.INVALID_INPUT)
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+# Sizes use the same decimal units as output.sizeof_fmt
+def parse_size(value: str) -> int:
+    match = _size.match(value.strip())
+    if not match:
+        raise dkr_core.errors.DkrException("Invalid size, expected e.g. 500M or 2G: {}".format(value),
+                                           dkr_core.errors.INVALID_INPUT)
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
 if __name__ == "__main__":
     try:
         print(parse_options(sys.argv[1:]))
@@ -2,86 +2,249 @@ import json
 import os
 import importlib
 import importlib.util
-import docker
+import inspect
 import argparse
 import sys
 import os.path
+import time
+
+from dkr_core.client import LazyClient
+from dkr_core.state import StateStore
+from dkr_core import timings as timings_module
+
+MANIFEST_VERSION = 1
+
+
+class CommandEntry:
+    def __init__(self, name: str, path: str, mtime: int, module_name: str, help_text: str, module=None):
+        self.name = name
+        self.path = path
+        self.mtime = mtime
+        self.module_name = module_name
+        self.help_text = help_text
+        self._module = module
+
+    def load(self, timings=None):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = _exec_module(self.module_name, self.path)
+            if timings is not None:
+                timings.record_import(self.path, time.perf_counter() - started)
+        return self._module
+
+
+def _exec_module(module_name: str, path: str):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    imported_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(imported_module)
+    return imported_module
+
+
+def _describe_module(imported_module, module_name: str) -> list:
+    if not hasattr(imported_module, 'import_command'):
+        return []
+
+    names = []
+    if hasattr(imported_module, 'command'):
+        command_name = imported_module.command()
+        if isinstance(command_name, list):
+            names.extend(command_name)
+        elif isinstance(command_name, str):
+            names.append(command_name)
+    else:
+        names.append(module_name)
 
+    commands = []
+    for name in names:
+        if hasattr(imported_module, 'help_summary'):
+            help_text = imported_module.help_summary(name)
+        else:
+            help_text = "Does something wonderful!"
+        commands.append([name, help_text])
+    return commands
 
-def load_modules(extensions_dir: str) -> dict:
-    result = {}
 
-    if os.path.isdir(extensions_dir):
-        directories = os.listdir(extensions_dir)
-        for file in directories:
-            if file.endswith(".py"):
-                module_name = file[:-3]
-                spec = importlib.util.spec_from_file_location(module_name, os.path.join(extensions_dir, file))
-                imported_module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(imported_module)
-
-                if hasattr(imported_module, 'command'):
-                    command_name = imported_module.command()
-                    if isinstance(command_name, list):
-                        for name in command_name:
-                            result[name] = imported_module
-                    elif isinstance(command_name, str):
-                        result[command_name] = imported_module
-                else:
-                    result[module_name] = imported_module
+def load_modules(extensions_dir: str, manifest: dict=None, timings=None) -> dict:
+    result = {}
+    if manifest is None:
+        manifest = {}
+
+    if not os.path.isdir(extensions_dir):
+        manifest.pop(extensions_dir, None)
+        return result
+
+    cached_files = manifest.get(extensions_dir, {})
+    files = {}
+    for file in sorted(os.listdir(extensions_dir)):
+        if not file.endswith(".py"):
+            continue
+
+        module_name = file[:-3]
+        path = os.path.join(extensions_dir, file)
+        stat = os.stat(path)
+
+        imported_module = None
+        entry = cached_files.get(file)
+        if entry is None or entry['mtime'] != stat.st_mtime_ns or entry['size'] != stat.st_size:
+            started = time.perf_counter()
+            imported_module = _exec_module(module_name, path)
+            if timings is not None:
+                timings.record_import(path, time.perf_counter() - started)
+            entry = {
+                'mtime': stat.st_mtime_ns,
+                'size': stat.st_size,
+                'commands': _describe_module(imported_module, module_name)
+            }
+        files[file] = entry
+
+        for name, help_text in entry['commands']:
+            result[name] = CommandEntry(name, path, entry['mtime'], module_name, help_text, imported_module)
+
+    manifest[extensions_dir] = files
     return result
 
 
-def load_state(state_file):
-    if os.path.isfile(state_file):
-        state_file = os.path.join(state_file)
-        with open(state_file, 'r') as json_data:
+def load_manifest(manifest_file: str) -> dict:
+    try:
+        with open(manifest_file, 'r') as json_data:
             loaded_json = json.load(json_data)
+    except (OSError, ValueError):
+        return {}
+
+    if loaded_json.get('version') != MANIFEST_VERSION:
+        return {}
+    return loaded_json.get('directories', {})
+
+
+def save_manifest(manifest: dict, manifest_file: str):
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+
+    temp_file = "{}.{}.tmp".format(manifest_file, os.getpid())
+    with open(temp_file, 'w') as file:
+        json.dump({'version': MANIFEST_VERSION, 'directories': manifest}, file)
+    os.replace(temp_file, manifest_file)
+
+
+# the options build_parser adds before the command, and whether they take a value
+GLOBAL_OPTIONS = {'-h': False, '--help': False, '--debug': False, '--server': False, '--timings': False,
+                  '--timings-file': True}
+
+
+def selected_command(argv: list):
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+            continue
+        if arg == '--':
+            return None
+        if not arg.startswith('-'):
+            return arg
+        skip_value = GLOBAL_OPTIONS.get(arg, False)
+    return None
+
+
+def dkr_home() -> str:
+    return os.path.join(os.path.expanduser("~"), ".dkr")
+
+
+def load_commands(dkr_directory: str, timings=None) -> dict:
+    manifest_file = os.path.join(dkr_directory, "manifest.json")
+    manifest = load_manifest(manifest_file)
+    previous_manifest = json.dumps(manifest, sort_keys=True)
+
+    script_directory = os.path.dirname(os.path.realpath(__file__))
+    project_directory = os.path.dirname(script_directory)
+    built_in_modules = load_modules(os.path.join(project_directory, "commands"), manifest, timings)
+
+    user_module_dir = os.path.join(dkr_directory, "commands")
+    user_modules = load_modules(user_module_dir, manifest, timings)
+
+    if json.dumps(manifest, sort_keys=True) != previous_manifest:
+        try:
+            save_manifest(manifest, manifest_file)
+        except OSError:
+            pass
+
+    modules = {}
+    modules.update(built_in_modules)
+    modules.update(user_modules)
+    return modules
+
+
+def build_parser(modules: dict, command_name: str, docker_client, state: dict,
+                 timings=None) -> argparse.ArgumentParser:
+    # no abbreviations: the global options are also looked for in argv before the parser exists, see selected_command
+    # and timings.from_arguments
+    arg_parser = argparse.ArgumentParser(description="Extensible Docker CLI Client", allow_abbrev=False)
+    arg_parser.add_argument('--debug', action='store_true', help="Print stack traces for errors")
+    arg_parser.add_argument('--server', action='store_true',
+                            help="Run a persistent server that other dkr invocations are forwarded to")
+    arg_parser.add_argument('--timings', action='store_true',
+                            help="Print how long each phase and Docker API call took to stderr. "
+                                 "Also enabled by {}=1".format(timings_module.ENV_VAR))
+    arg_parser.add_argument('--timings-file', metavar='FILE',
+                            help="Write the timings as JSON to FILE. Also enabled by {}=FILE".format(
+                                timings_module.ENV_VAR))
+
+    subparsers = arg_parser.add_subparsers(title="Commands", metavar="COMMAND")
+    for name, entry in modules.items():
+        subparser = subparsers.add_parser(name, help=entry.help_text)
+        if name == command_name:
+            entry.load(timings).import_command(docker_client, subparser, state)
+
+    return arg_parser
+
+
+def execute(parsed_args, docker_client, state: dict):
+    if 'func' in parsed_args:
+        if inspect.iscoroutinefunction(parsed_args.func):
+            # asyncio is only imported for extensions that registered an `async def` handler
+            from dkr_core import aio
+            aio.run(parsed_args.func, docker_client, parsed_args, state)
+        else:
+            parsed_args.func(docker_client, parsed_args, state)
     else:
-        loaded_json = {}
-
-    return loaded_json
-
-
-def save_state(state, state_file):
-    if not os.path.isdir(os.path.dirname(state_file)):
-        os.makedirs(state_file)
-
-    with open(state_file, 'w') as file:
-        json.dump(state, file, indent=2)
+        print("No valid command specified. `{} -h` for help.".format(sys.argv[0]))
 
 
 def main():
-    state_file = os.path.join(os.path.expanduser("~"), ".dkr", "state.json")
-    state = load_state(state_file)
-
+    timings = timings_module.from_arguments(sys.argv[1:])
     try:
-        docker_client = docker.from_env(assert_hostname=False)
+        _main(timings)
+    finally:
+        if timings is not None:
+            timings.write()
 
-        script_directory = os.path.dirname(os.path.realpath(__file__))
-        project_directory = os.path.dirname(script_directory)
-        built_in_modules = load_modules(os.path.join(project_directory, "commands"))
 
-        user_module_dir = os.path.join(os.path.expanduser("~"), ".dkr", "commands")
-        user_modules = load_modules(user_module_dir)
+def _main(timings):
+    phase = timings.phase if timings is not None else timings_module.no_phase
 
-        modules = {}
-        modules.update(built_in_modules)
-        modules.update(user_modules)
+    dkr_directory = dkr_home()
+    state_store = StateStore(os.path.join(dkr_directory, "state.json"))
+    with phase('load state'):
+        state = state_store.load()
 
-        arg_parser = argparse.ArgumentParser(description="Extensible Docker CLI Client")
-        subparsers = arg_parser.add_subparsers(title="Commands", metavar="COMMAND")
-        for name, module in modules.items():
-            if hasattr(module, 'import_command'):
-                subparser = subparsers.add_parser(name, help=module.help_summary(name) if hasattr(module, 'help_summary') else "Does something wonderful!")
-                module.import_command(docker_client, subparser, state)
+    try:
+        docker_client = LazyClient(timings=timings)
 
-        parsed_args = arg_parser.parse_args()
+        with phase('load commands'):
+            modules = load_commands(dkr_directory, timings)
+        command_name = selected_command(sys.argv[1:])
+        with phase('build parser'):
+            arg_parser = build_parser(modules, command_name, docker_client, state, timings)
+        with phase('parse arguments'):
+            parsed_args = arg_parser.parse_args()
 
-        if 'func' in parsed_args:
-            parsed_args.func(docker_client, parsed_args, state)
-        else:
-            print("No valid command specified. `{} -h` for help.".format(sys.argv[0]))
+        if parsed_args.server:
+            from dkr_core import server
+            server.serve(dkr_directory, state_store)
+            return
+
+        with phase('execute'):
+            execute(parsed_args, docker_client, state)
 
     finally:
-        save_state(state, state_file)
+        with phase('save state'):
+            state_store.save()
+
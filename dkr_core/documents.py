@@ -0,0 +1,83 @@
+import json
+import sys
+from collections import OrderedDict
+
+from dkr_core import errors, parallel
+from dkr_core.template import compile_field, format_value
+
+DEFAULT_PARALLEL = 8
+
+
+def add_inspect_arguments(cmd):
+    cmd.add_argument('--json', action='store_true', help='Render all as json')
+    cmd.add_argument('--ndjson', action='store_true', help='Print one compact json object per line')
+    cmd.add_argument('--pprint', action='store_true', help='Dump contents using python\'s pprint function')
+    cmd.add_argument('--field', action='append', metavar='PATH',
+                     help="Only output this field, e.g. State.Status. Can be specified multiple times")
+    parallel.add_parallel_argument(cmd, default=DEFAULT_PARALLEL)
+
+
+def dump_yaml(data, explicit_start: bool=False) -> str:
+    import yaml
+
+    # libyaml's emitter is an order of magnitude faster than the pure python one, but is an optional part of pyyaml
+    dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+    return yaml.dump(data, Dumper=dumper, default_flow_style=False, explicit_start=explicit_start)
+
+
+def dump_json(data, indent: int=None) -> str:
+    # the json module only uses its C encoder when indent is None
+    if indent is None:
+        return json.dumps(data, separators=(',', ':'))
+    return json.dumps(data, indent=indent)
+
+
+def projector(fields: list):
+    if not fields:
+        return None
+
+    getters = [(field, compile_field(field)) for field in fields]
+
+    def project(document: dict) -> OrderedDict:
+        return OrderedDict((field, getter(document)) for field, getter in getters)
+    return project
+
+
+# Fetches every target with `fetch` concurrently and prints the results in the order the targets were given, as they
+# arrive. Failures are reported as they happen; returns the fetched documents and the merged exit code.
+def print_inspected(targets: list, fetch, args, docker_client, file=None):
+    if file is None:
+        file = sys.stdout
+
+    project = projector(args.field)
+    multiple = len(targets) > 1
+    documents = []
+    json_documents = []
+    error = 0
+    for target, document, e in parallel.run_ordered(targets, fetch, args.parallel, docker_client):
+        if e is not None:
+            error = errors.merge(error, errors.report(e))
+            continue
+
+        documents.append(document)
+        selected = project(document) if project else document
+
+        if args.json:
+            json_documents.append(selected)
+        elif args.ndjson:
+            print(dump_json(selected), file=file)
+        elif args.pprint:
+            from pprint import pprint
+            pprint(selected, stream=file)
+        elif project:
+            values = '\t'.join(format_value(value) for value in selected.values())
+            print("{}\t{}".format(target, values) if multiple else values, file=file)
+        else:
+            print(dump_yaml(selected, explicit_start=multiple), file=file)
+
+    if args.json and multiple:
+        print(dump_json(json_documents, indent=4), file=file)
+    elif args.json and json_documents:
+        print(dump_json(json_documents[0], indent=4), file=file)
+
+    return documents, error
@@ -1,9 +1,60 @@
+import sys
+import traceback
+
 INVALID_INPUT = 1
 DOCKER_ERROR = 2
 UNKNOWN_ERROR = 3
+COMMAND_ERROR = 4
+TIMEOUT = 5
 
 
 class DkrException(Exception):
     def __init__(self, message, exit_code):
         self.message = message
-        self.exit_code = exit_code
\ No newline at end of file
+        self.exit_code = exit_code
+
+
+def report(e: Exception, debug: bool=False, file=None) -> int:
+    if file is None:
+        file = sys.stderr
+
+    # docker is imported lazily, so its exceptions can only have been raised if the module has been loaded
+    docker_errors = sys.modules.get('docker.errors')
+
+    if isinstance(e, DkrException):
+        if e.message:
+            print(e.message, file=file)
+        return e.exit_code
+
+    if docker_errors and isinstance(e, docker_errors.APIError):
+        status_code = e.response.status_code
+        message = e.response.content.decode('utf-8').strip()
+        print(message, file=file)
+
+        if debug:
+            traceback.print_exc(file=file)
+
+        if status_code < 500:
+            return INVALID_INPUT
+        else:
+            return DOCKER_ERROR
+
+    if docker_errors and isinstance(e, docker_errors.DockerException):
+        print(e.explanation.decode('utf-8').strip(), file=file)
+        if debug:
+            traceback.print_exc(file=file)
+        return DOCKER_ERROR
+
+    message = str(e)
+    if not message or not message.strip():
+        message = "Unknown Error: {}".format(e.__repr__())
+    print(message.strip(), file=file)
+    if debug:
+        traceback.print_exc(file=file)
+    return UNKNOWN_ERROR
+
+
+def merge(error: int, exit_code: int) -> int:
+    if exit_code == INVALID_INPUT:
+        return exit_code
+    return error if error else exit_code
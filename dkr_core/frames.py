@@ -0,0 +1,128 @@
+import struct
+import sys
+
+STDIN = 0
+STDOUT = 1
+STDERR = 2
+
+HEADER = struct.Struct('>BxxxL')
+RAW_CHUNK_SIZE = 4096
+INITIAL_BUFFER_SIZE = 65536
+MAX_LINE = 65536
+
+
+def _readinto_function(source):
+    if hasattr(source, 'readinto'):
+        return source.readinto
+
+    read = source.read if hasattr(source, 'read') else source
+
+    def readinto(view) -> int:
+        data = read(len(view))
+        if not data:
+            return 0
+        view[:len(data)] = data
+        return len(data)
+    return readinto
+
+
+def _readinto_exactly(readinto, view) -> int:
+    filled = 0
+    size = len(view)
+    while filled < size:
+        count = readinto(view[filled:])
+        if not count:
+            break
+        filled += count
+    return filled
+
+
+# Yields (stream, buffer, start, end) for every frame of a docker attach/logs/exec response, where buffer[start:end] is
+# the payload. The buffer is reused: it is only valid until the next frame is requested. Containers with a tty send a
+# raw stream instead of 8-byte-header frames, which is reported as stdout.
+def iter_frame_spans(source, tty: bool=False):
+    if tty:
+        # read1 returns whatever has arrived instead of blocking until the whole chunk is filled
+        read = getattr(source, 'read1', None) or getattr(source, 'read', source)
+        while True:
+            data = read(RAW_CHUNK_SIZE)
+            if not data:
+                return
+            yield STDOUT, data, 0, len(data)
+
+    readinto = _readinto_function(source)
+    buffer = bytearray(INITIAL_BUFFER_SIZE)
+    view = memoryview(buffer)
+    header_view = view[:HEADER.size]
+    while True:
+        # headers and payloads are read with their exact sizes, so a follow never waits for more than one frame
+        if _readinto_exactly(readinto, header_view) < HEADER.size:
+            return
+
+        stream, length = HEADER.unpack_from(buffer)
+        end = HEADER.size + length
+        if end > len(buffer):
+            # views handed out for earlier frames keep referencing the old buffer, so it is replaced rather than resized
+            buffer = bytearray(max(end, len(buffer) * 2))
+            view = memoryview(buffer)
+            header_view = view[:HEADER.size]
+
+        if _readinto_exactly(readinto, view[HEADER.size:end]) < length:
+            return
+        yield stream, buffer, HEADER.size, end
+
+
+# Yields (stream, payload) pairs, where payload is a memoryview that is only valid until the next frame is requested
+def iter_frames(source, tty: bool=False):
+    for stream, buffer, start, end in iter_frame_spans(source, tty):
+        yield stream, memoryview(buffer)[start:end]
+
+
+# Yields (stream, data) where data holds every complete line of one frame, each starting with `prefix`. Lines are
+# split and matched against the bytes `pattern` inside the frame buffer, so only lines that are printed are copied. A
+# line longer than max_line is passed on in pieces rather than buffered without bound.
+def iter_lines(source, tty: bool=False, prefix: bytes=b'', pattern=None, max_line: int=MAX_LINE):
+    pending = {}
+    for stream, buffer, start, end in iter_frame_spans(source, tty):
+        view = memoryview(buffer)
+        parts = []
+        position = start
+        while position < end:
+            newline = buffer.find(b'\n', position, end)
+            if newline < 0:
+                # the rest of a line that was split across frames arrives with the next one
+                carry = pending.get(stream, b'') + bytes(view[position:end])
+                if len(carry) >= max_line:
+                    if pattern is None or pattern.search(carry):
+                        parts.extend((prefix, carry, b'\n'))
+                    carry = b''
+                pending[stream] = carry
+                break
+
+            if pending.get(stream):
+                line = pending.pop(stream) + bytes(view[position:newline + 1])
+                if pattern is None or pattern.search(line, 0, len(line) - 1):
+                    parts.extend((prefix, line))
+            elif pattern is None or pattern.search(view[position:newline]):
+                # matched against a view of the line alone, so ^ and \A anchor at its start without copying it
+                parts.extend((prefix, view[position:newline + 1]))
+            position = newline + 1
+
+        if parts:
+            yield stream, b''.join(parts)
+
+    for stream, line in pending.items():
+        if line and (pattern is None or pattern.search(line)):
+            yield stream, prefix + line + b'\n'
+
+
+def copy_to_stdio(source, tty: bool=False):
+    stdout = sys.stdout.buffer
+    stderr = sys.stderr.buffer
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    for stream, payload in iter_frames(source, tty):
+        out = stderr if stream == STDERR else stdout
+        out.write(payload)
+        out.flush()
@@ -0,0 +1,158 @@
+import codecs
+import json
+import re
+
+from dkr_core import errors
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+_structure = re.compile(r'[{}\[\]"]')
+_string_end = re.compile(r'["\\]')
+
+
+def _text_chunks(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        text = decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+class _Scanner:
+    def __init__(self, array: bool):
+        self.array = array
+        self.expect = '[' if array else 'value'
+        self.buffer = ''
+        self.pending = 0
+        # how far the brackets of the value that could not be decoded yet have been counted
+        self.scanned = 0
+        self.depth = 0
+        self.in_string = False
+
+    # Whether the pending value may be complete: its brackets are counted across chunks, so a huge object arriving in
+    # many small chunks is only decoded once its closing bracket arrived and not re-parsed for every chunk
+    def _complete(self) -> bool:
+        buffer = self.buffer
+        if buffer[0] not in '{[':
+            return True
+
+        position = self.scanned
+        depth = self.depth
+        in_string = self.in_string
+        complete = False
+        while True:
+            if in_string:
+                match = _string_end.search(buffer, position)
+                if match is None:
+                    position = len(buffer)
+                    break
+                if match.group() == '\\':
+                    if match.end() == len(buffer):
+                        # the escaped character is in the next chunk
+                        position = match.start()
+                        break
+                    position = match.end() + 1
+                    continue
+                in_string = False
+                position = match.end()
+                continue
+
+            match = _structure.search(buffer, position)
+            if match is None:
+                position = len(buffer)
+                break
+            char = match.group()
+            position = match.end()
+            if char == '"':
+                in_string = True
+            elif char in '{[':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    complete = True
+                    break
+
+        self.scanned, self.depth, self.in_string = position, depth, in_string
+        return complete
+
+    def feed(self, text: str, final: bool=False) -> list:
+        self.buffer += text
+
+        # once the buffer has doubled a retry costs no more than the bytes that arrived, before that only a closing
+        # bracket can complete the pending value
+        if not final and self.pending and len(self.buffer) < self.pending * 2 and not self._complete():
+            return []
+
+        result = []
+        buffer = self.buffer
+        length = len(buffer)
+        position = 0
+        while True:
+            position = _whitespace.match(buffer, position).end()
+            if position == length:
+                break
+
+            if self.expect == 'done':
+                raise errors.DkrException("Unexpected data after JSON array", errors.DOCKER_ERROR)
+
+            if self.expect == '[':
+                if buffer[position] != '[':
+                    raise errors.DkrException("Expected a JSON array", errors.DOCKER_ERROR)
+                position += 1
+                self.expect = 'first'
+                continue
+
+            if self.expect in ('first', 'separator') and buffer[position] == ']':
+                position += 1
+                self.expect = 'done'
+                continue
+
+            if self.expect == 'separator':
+                if buffer[position] != ',':
+                    raise errors.DkrException("Expected ',' in JSON array", errors.DOCKER_ERROR)
+                position += 1
+                self.expect = 'value'
+                continue
+
+            try:
+                obj, position = _decoder.raw_decode(buffer, position)
+            except ValueError:
+                if final:
+                    raise errors.DkrException("Truncated JSON in response", errors.DOCKER_ERROR)
+                break
+
+            result.append(obj)
+            if self.array:
+                self.expect = 'separator'
+
+        self.buffer = buffer[position:]
+        self.pending = len(self.buffer)
+        if position or self.depth == 0:
+            # the counts only stay valid while the same value is still pending
+            self.scanned = self.depth = 0
+            self.in_string = False
+
+        if final and self.array and self.expect != 'done':
+            raise errors.DkrException("Truncated JSON array in response", errors.DOCKER_ERROR)
+        return result
+
+
+def _scan(chunks, array: bool):
+    scanner = _Scanner(array)
+    for text in _text_chunks(chunks):
+        for obj in scanner.feed(text):
+            yield obj
+    for obj in scanner.feed('', final=True):
+        yield obj
+
+
+def iter_array(chunks):
+    return _scan(chunks, array=True)
+
+
+def iter_objects(chunks):
+    return _scan(chunks, array=False)
@@ -0,0 +1,197 @@
+from collections import Counter, deque
+
+NO_TAG = '<none>:<none>'
+
+
+def tags(image: dict) -> list:
+    return [tag for tag in image.get('RepoTags') or [] if tag != NO_TAG]
+
+
+# Parent/child index over `images(all=True)`. Everything is computed in passes over a topological order, so the cost is
+# linear in the number of layers no matter how deep the chains are or how many tags share them.
+class LayerGraph:
+    def __init__(self, images: list, containers: list=None):
+        self.images = {image['Id']: image for image in images}
+        self.children = {image_id: [] for image_id in self.images}
+        self.parent = {}
+        for image_id, image in self.images.items():
+            parent_id = image.get('ParentId')
+            if parent_id and parent_id in self.images:
+                self.parent[image_id] = parent_id
+                self.children[parent_id].append(image_id)
+
+        # parents always come before their children
+        self.order = []
+        queue = deque(image_id for image_id in self.images if image_id not in self.parent)
+        while queue:
+            image_id = queue.popleft()
+            self.order.append(image_id)
+            queue.extend(self.children[image_id])
+
+        self.total = {}
+        self.own = {}
+        for image_id in self.order:
+            image = self.images[image_id]
+            # older daemons report the layer in Size and everything in VirtualSize, newer ones everything in both
+            total = image.get('VirtualSize', image.get('Size', 0)) or 0
+            parent_id = self.parent.get(image_id)
+            self.total[image_id] = total
+            self.own[image_id] = max(total - self.total[parent_id], 0) if parent_id else total
+
+        self.by_tag = {}
+        for image_id, image in self.images.items():
+            for tag in tags(image):
+                self.by_tag[tag] = image_id
+
+        self.containers = Counter()
+        self.users = {}
+        for container in containers or []:
+            image_id = container.get('ImageID')
+            if image_id not in self.images:
+                # containers listed by daemons older than API 1.21 only carry the image reference they were created from
+                image = container.get('Image', '')
+                image_id = self.by_tag.get(image, self.by_tag.get("{}:latest".format(image), image))
+            if image_id in self.images:
+                self.containers[image_id] += 1
+                names = container.get('Names') or [container.get('Id', '')[:12]]
+                self.users.setdefault(image_id, []).append(names[0].lstrip('/'))
+
+    def tagged(self) -> set:
+        return {image_id for image_id, image in self.images.items() if tags(image)}
+
+    def used(self) -> set:
+        return set(self.containers)
+
+    def tops(self) -> set:
+        return {image_id for image_id, children in self.children.items() if not children}
+
+    def dangling(self) -> set:
+        return {image_id for image_id in self.tops()
+                if not tags(self.images[image_id]) and not self.containers[image_id]}
+
+    # The image id a name refers to the way the daemon resolves it: a tag, a tag without ":latest", or an id prefix
+    def resolve(self, name: str):
+        if name in self.by_tag:
+            return self.by_tag[name]
+        if ':' not in name and "{}:latest".format(name) in self.by_tag:
+            return self.by_tag["{}:latest".format(name)]
+
+        prefix = name if name.startswith('sha256:') else "sha256:{}".format(name)
+        matches = [image_id for image_id in self.images if image_id.startswith(prefix) or image_id.startswith(name)]
+        return matches[0] if len(matches) == 1 else None
+
+    # For each of `image_ids`, the ones among them that are built on it and have to be removed first. Only the nearest
+    # selected descendant of every chain is listed, which is enough to order the removals.
+    def removal_dependencies(self, image_ids: set) -> dict:
+        dependencies = {image_id: set() for image_id in image_ids}
+        nearest = {}
+        for image_id in self.order:
+            parent_id = self.parent.get(image_id)
+            selected_above = nearest.get(parent_id) if parent_id is not None else None
+            if image_id in dependencies:
+                if selected_above is not None:
+                    dependencies[selected_above].add(image_id)
+                nearest[image_id] = image_id
+            elif selected_above is not None:
+                nearest[image_id] = selected_above
+        return dependencies
+
+    # For each of `image_ids`, the names of the containers using it or any image built on it. Names are handed up from
+    # each selected image to the nearest selected one below it, children first, like reference_counts.
+    def users_of(self, image_ids: set) -> dict:
+        selected_above = {}
+        for image_id in self.order:
+            parent_id = self.parent.get(image_id)
+            if image_id in image_ids:
+                selected_above[image_id] = image_id
+            elif parent_id in selected_above:
+                selected_above[image_id] = selected_above[parent_id]
+
+        result = {image_id: [] for image_id in image_ids if image_id in self.images}
+        for image_id, names in self.users.items():
+            if image_id in selected_above:
+                result[selected_above[image_id]].extend(names)
+        for image_id in reversed(self.order):
+            parent_id = self.parent.get(image_id)
+            if image_id in result and parent_id in selected_above:
+                result[selected_above[parent_id]].extend(result[image_id])
+        return result
+
+    def disk_usage(self) -> int:
+        return sum(self.own.values())
+
+    # For every layer, how many of `references` have it in their chain: the number of references in its subtree
+    def reference_counts(self, references: set) -> dict:
+        counts = {image_id: 1 if image_id in references else 0 for image_id in self.images}
+        for image_id in reversed(self.order):
+            parent_id = self.parent.get(image_id)
+            if parent_id is not None:
+                counts[parent_id] += counts[image_id]
+        return counts
+
+    # Bytes only `image_id` holds on to: its chain up to the first layer another reference also needs, or that has a
+    # nonzero count in `keep_counts`. Reference counts never decrease towards the root, so these walks touch every layer
+    # at most once across all references.
+    def exclusive_bytes(self, image_id: str, counts: dict, keep_counts: dict=None) -> int:
+        exclusive = 0
+        while image_id is not None and counts[image_id] == 1 and not (keep_counts and keep_counts[image_id]):
+            exclusive += self.own[image_id]
+            image_id = self.parent.get(image_id)
+        return exclusive
+
+    def usage(self) -> list:
+        # untagged tops count too, they hold on to their chain until they are pruned
+        references = self.tagged() | self.used() | self.tops()
+        counts = self.reference_counts(references)
+
+        result = []
+        for image_id in self.order:
+            if image_id not in references:
+                continue
+            unique = self.exclusive_bytes(image_id, counts)
+            result.append({
+                'Id': image_id,
+                'RepoTags': tags(self.images[image_id]),
+                'Containers': self.containers[image_id],
+                'Created': self.images[image_id].get('Created', 0),
+                'Size': self.total[image_id],
+                'SharedSize': self.total[image_id] - unique,
+                'UniqueSize': unique
+            })
+        return result
+
+    def reclaimable(self, keep: set) -> int:
+        counts = self.reference_counts(keep)
+        return sum(self.own[image_id] for image_id, count in counts.items() if count == 0)
+
+    # Images to delete so that nothing outside of `keep`'s chains is left. Deleting the top of an unreferenced chain
+    # makes the daemon delete its untagged parents, so only the tops are returned, as (image id, exclusive bytes).
+    def removal_targets(self, keep: set) -> list:
+        counts = self.reference_counts(keep)
+        targets = [image_id for image_id in self.order if counts[image_id] == 0 and not self.children[image_id]]
+
+        target_counts = self.reference_counts(set(targets))
+        return [(image_id, self.exclusive_bytes(image_id, target_counts, counts)) for image_id in targets]
+
+
+class PrunePlan:
+    def __init__(self, graph: LayerGraph, targets: list, keep: set):
+        self.graph = graph
+        self.targets = targets
+        self.reclaimed = graph.reclaimable(keep)
+
+
+def plan_prune(graph: LayerGraph, unused: bool=False, created_before: float=None, min_size: int=None) -> PrunePlan:
+    keep = graph.used()
+    if not unused:
+        keep |= graph.tagged()
+    if created_before is not None:
+        keep |= {image_id for image_id, image in graph.images.items() if image.get('Created', 0) > created_before}
+
+    targets = graph.removal_targets(keep)
+    if min_size:
+        # a target below the size is kept, which keeps its chain; the other targets' exclusive bytes are unaffected
+        keep |= {image_id for image_id, exclusive in targets if exclusive < min_size}
+        targets = [(image_id, exclusive) for image_id, exclusive in targets if exclusive >= min_size]
+
+    return PrunePlan(graph, targets, keep)
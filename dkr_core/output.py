@@ -0,0 +1,47 @@
+import sys
+
+
+def sizeof_fmt(num, suffix='B'):
+    for unit in ['','K','M','G','T','P','E','Z']:
+        if abs(num) < 1000.0:
+            return "%3.1f %s%s" % (num, unit, suffix)
+        num /= 1000.0
+    return "%.1f %s%s" % (num, 'Yi', suffix)
+
+
+class StreamTable:
+    def __init__(self, headers: list, widths: list, file=None):
+        self.headers = headers
+        self.widths = widths
+        self.file = file
+        self.rows_written = 0
+        self.headers_written = False
+
+    def _format(self, row: list) -> str:
+        cells = []
+        last = len(row) - 1
+        for index, value in enumerate(row):
+            value = str(value)
+            if index == last:
+                cells.append(value)
+                continue
+
+            width = self.widths[index]
+            if len(value) > width:
+                value = value[:width - 1] + '~'
+            cells.append(value.ljust(width))
+        return '  '.join(cells).rstrip()
+
+    def write_headers(self):
+        if self.headers and not self.headers_written:
+            print(self._format(self.headers), file=self.file if self.file else sys.stdout)
+        self.headers_written = True
+
+    def write_row(self, row: list):
+        file = self.file if self.file else sys.stdout
+        self.write_headers()
+
+        print(self._format(row), file=file)
+        self.rows_written += 1
+        if self.rows_written == 1:
+            file.flush()
@@ -0,0 +1,115 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dkr_core import errors
+
+
+def add_parallel_argument(cmd, default: int=1):
+    cmd.add_argument('-j', '--parallel', type=int, default=default, metavar='N',
+                     help="Number of operations to run concurrently. Default: {}".format(default))
+
+
+# Yields (item, result, exception) in the order the items were given, no matter which call finishes first
+def run_ordered(items: list, func, jobs: int=1, docker_client=None):
+    jobs = max(1, min(jobs, len(items)))
+    if jobs == 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    if docker_client is not None and hasattr(docker_client, 'ensure_pool_size'):
+        docker_client.ensure_pool_size(jobs)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(func, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                yield item, future.result(), None
+            except Exception as e:
+                yield item, None, e
+
+
+def topological_order(nodes: list, dependencies: dict) -> list:
+    remaining = {node: set(dependencies.get(node, ())) for node in nodes}
+    for node, depends_on in remaining.items():
+        unknown = depends_on - set(remaining)
+        if unknown:
+            message = "{} depends on unknown {}".format(node, ', '.join(sorted(unknown)))
+            raise errors.DkrException(message, errors.INVALID_INPUT)
+
+    order = []
+    ready = [node for node in nodes if not remaining[node]]
+    dependents = {node: [] for node in nodes}
+    for node in nodes:
+        for dependency in remaining[node]:
+            dependents[dependency].append(node)
+
+    while ready:
+        node = ready.pop(0)
+        order.append(node)
+        for dependent in dependents[node]:
+            remaining[dependent].discard(node)
+            if not remaining[dependent]:
+                ready.append(dependent)
+
+    if len(order) != len(nodes):
+        cycle = sorted(node for node in nodes if remaining[node])
+        raise errors.DkrException("Dependency cycle between {}".format(', '.join(cycle)), errors.INVALID_INPUT)
+    return order
+
+
+# Calls func(node) once every dependency of node has succeeded, running independent nodes concurrently, and yields
+# (node, result, exception) as each one completes. Nodes behind a failed dependency are yielded with a DkrException.
+def run_graph(nodes: list, dependencies: dict, func, jobs: int=1, docker_client=None):
+    topological_order(nodes, dependencies)
+
+    waiting = {node: set(dependencies.get(node, ())) for node in nodes}
+    dependents = {node: [] for node in nodes}
+    for node in nodes:
+        for dependency in waiting[node]:
+            dependents[dependency].append(node)
+
+    jobs = max(1, min(jobs, len(nodes)))
+    if jobs > 1 and docker_client is not None and hasattr(docker_client, 'ensure_pool_size'):
+        docker_client.ensure_pool_size(jobs)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        for node in nodes:
+            if not waiting[node]:
+                running[executor.submit(func, node)] = node
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    yield node, None, e
+                    for skipped in _skip_dependents(node, dependents, waiting):
+                        message = "Skipped {} because {} failed".format(skipped, node)
+                        yield skipped, None, errors.DkrException(message, errors.INVALID_INPUT)
+                    continue
+
+                yield node, result, None
+                for dependent in dependents[node]:
+                    if dependent not in waiting:
+                        continue
+                    waiting[dependent].discard(node)
+                    if not waiting[dependent]:
+                        running[executor.submit(func, dependent)] = dependent
+
+
+def _skip_dependents(node, dependents: dict, waiting: dict) -> list:
+    skipped = []
+    pending = list(dependents[node])
+    while pending:
+        dependent = pending.pop()
+        if dependent in waiting:
+            waiting.pop(dependent)
+            skipped.append(dependent)
+            pending.extend(dependents[dependent])
+    return skipped
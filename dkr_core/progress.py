@@ -0,0 +1,229 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from dkr_core import errors
+from dkr_core.output import sizeof_fmt
+
+CURSOR_UP_ONE = '\x1b[1A'
+ERASE_LINE = '\x1b[2K'
+
+TTY_INTERVAL = 0.1
+LOG_INTERVAL = 5.0
+
+DONE_STATUSES = ('Pull complete', 'Already exists')
+QUEUED_STATUSES = ('Pulling fs layer', 'Waiting')
+
+
+class Layer:
+    def __init__(self, layer_id: str):
+        self.id = layer_id
+        self.status = ''
+        self.progress = ''
+        self.current = 0
+        self.total = 0
+        self.started = time.time()
+        self.finished = None
+        self.images = set()
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def update(self, event: dict):
+        status = event.get('status', self.status)
+
+        # layers shared between concurrent pulls report from every pull, so never move a layer backwards
+        if self.done and status not in DONE_STATUSES:
+            return
+        if self.done or (status in QUEUED_STATUSES and self.status and self.status not in QUEUED_STATUSES):
+            return
+
+        self.status = status
+        self.progress = event.get('progress', '')
+
+        detail = event.get('progressDetail') or {}
+        if self.status == 'Downloading' and 'total' in detail:
+            self.current = detail.get('current', 0)
+            self.total = detail['total']
+
+        if self.status in DONE_STATUSES:
+            self.finished = time.time()
+        if self.status == 'Download complete' or self.done:
+            self.current = self.total
+
+    def line(self) -> str:
+        if self.progress:
+            return "{} {} {}".format(self.status, self.id, self.progress)
+        return "{} {}".format(self.status, self.id)
+
+
+class PullProgress:
+    def __init__(self, file=None, interval: float=None, images: list=None):
+        self.file = file if file else sys.stdout
+        self.tty = self.file.isatty()
+        if interval is None:
+            interval = TTY_INTERVAL if self.tty else LOG_INTERVAL
+        self.interval = interval
+
+        self.started = time.time()
+        self.layers = OrderedDict()
+        self.messages = []
+        self.images = images if images else []
+        self.errors = OrderedDict()
+        self.last_render = 0
+        self.lines_drawn = 0
+        self.lock = threading.Lock()
+
+    def _prefix(self, image: str, message: str) -> str:
+        if image and len(self.images) > 1:
+            return "{}: {}".format(image, message)
+        return message
+
+    def message(self, message: str, image: str=None):
+        with self.lock:
+            self.messages.append(self._prefix(image, message))
+            self._render()
+
+    def update(self, event: dict, image: str=None):
+        with self.lock:
+            if 'error' in event:
+                self.errors[image] = event['error']
+                self.messages.append(self._prefix(image, "Error while pulling: {}".format(event['error'])))
+            elif 'status' not in event:
+                return
+            elif event.get('id') and not event['status'].startswith('Pulling from'):
+                layer = self.layers.get(event['id'])
+                if layer is None:
+                    layer = self.layers[event['id']] = Layer(event['id'])
+                layer.images.add(image)
+                layer.update(event)
+            else:
+                message = event['status']
+                if event.get('id'):
+                    message = "{} {}".format(message, event['id'])
+                self.messages.append(self._prefix(image, message))
+
+            self._render()
+
+    def _render(self, force: bool=False):
+        now = time.time()
+        if not force and not self.messages and now - self.last_render < self.interval:
+            return
+
+        if self.tty:
+            self._render_block()
+            self.last_render = now
+        else:
+            summary = force or now - self.last_render >= self.interval
+            self._render_log(summary)
+            if summary:
+                self.last_render = now
+
+        self.file.flush()
+
+    def _render_block(self):
+        output = [CURSOR_UP_ONE * self.lines_drawn]
+        for message in self.messages:
+            output.append(ERASE_LINE + message + '\n')
+        self.messages = []
+
+        for layer in self.layers.values():
+            output.append(ERASE_LINE + layer.line() + '\n')
+        self.lines_drawn = len(self.layers)
+
+        self.file.write(''.join(output))
+
+    def _render_log(self, summary: bool):
+        for message in self.messages:
+            print(message, file=self.file)
+        self.messages = []
+
+        if summary and self.layers:
+            print(self.summary_line(), file=self.file)
+
+    def summary_line(self) -> str:
+        done = len([layer for layer in self.layers.values() if layer.done])
+        current = sum(layer.current for layer in self.layers.values())
+        total = sum(layer.total for layer in self.layers.values())
+        return "{}/{} layers complete, {} / {} downloaded, {:.1f}s elapsed".format(
+            done, len(self.layers), sizeof_fmt(current), sizeof_fmt(total), time.time() - self.started)
+
+    def finish(self):
+        with self.lock:
+            self._render(force=True)
+
+            for layer in self.layers.values():
+                finished = layer.finished if layer.finished else time.time()
+                shared = " (shared by {} images)".format(len(layer.images)) if len(layer.images) > 1 else ""
+                print("{} {} in {:.1f}s{}".format(layer.id, sizeof_fmt(layer.total), finished - layer.started, shared),
+                      file=self.file)
+            print("Pulled {} layers in {:.1f}s".format(len(self.layers), time.time() - self.started), file=self.file)
+
+            if len(self.images) > 1:
+                for image in self.images:
+                    if image in self.errors:
+                        print("{}: failed: {}".format(image, self.errors[image]), file=self.file)
+                    else:
+                        print("{}: pulled".format(image), file=self.file)
+
+        if len(self.errors) == 1 and len(self.images) <= 1:
+            message = "Error while pulling: {}".format(list(self.errors.values())[0])
+            raise errors.DkrException(message, errors.DOCKER_ERROR)
+        if self.errors:
+            message = "Failed to pull {} of {} images".format(len(self.errors), len(self.images))
+            raise errors.DkrException(message, errors.DOCKER_ERROR)
+
+
+# Byte counts and throughput of a transfer that has no layers to show, like image save and load
+class TransferProgress:
+    def __init__(self, action: str, file=None, interval: float=None):
+        self.action = action
+        self.file = file if file else sys.stdout
+        self.tty = self.file.isatty()
+        if interval is None:
+            interval = TTY_INTERVAL if self.tty else LOG_INTERVAL
+        self.interval = interval
+
+        self.started = time.time()
+        self.transferred = 0
+        self.stored = None
+        self.last_render = self.started
+        self.lines_drawn = 0
+
+    def update(self, transferred: int, stored: int=None):
+        self.transferred = transferred
+        self.stored = stored
+
+        now = time.time()
+        if now - self.last_render < self.interval:
+            return
+        self.last_render = now
+
+        if self.tty:
+            self.file.write(CURSOR_UP_ONE * self.lines_drawn + ERASE_LINE + self.summary_line() + '\n')
+            self.lines_drawn = 1
+        else:
+            print(self.summary_line(), file=self.file)
+        self.file.flush()
+
+    def _rate(self) -> str:
+        elapsed = time.time() - self.started
+        return sizeof_fmt(self.transferred / elapsed if elapsed > 0 else 0)
+
+    def _amount(self) -> str:
+        if self.stored is None:
+            return sizeof_fmt(self.transferred)
+        return "{} ({} on disk)".format(sizeof_fmt(self.transferred), sizeof_fmt(self.stored))
+
+    def summary_line(self) -> str:
+        return "{} {}, {}/s, {:.1f}s elapsed".format(self.action, self._amount(), self._rate(),
+                                                     time.time() - self.started)
+
+    def finish(self, message: str):
+        if self.tty and self.lines_drawn:
+            self.file.write(CURSOR_UP_ONE * self.lines_drawn + ERASE_LINE)
+        print("{} {} in {:.1f}s, {}/s".format(message, self._amount(), time.time() - self.started, self._rate()),
+              file=self.file)
+        self.file.flush()
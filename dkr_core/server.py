@@ -0,0 +1,294 @@
+import array
+import fcntl
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from dkr_core import errors, timings as timings_module
+from dkr_core.client import LazyClient
+
+MAX_FDS = 3
+# seconds an interrupted command gets to clean up before its handler is killed
+INTERRUPT_GRACE = 5
+
+
+def socket_path(dkr_directory: str=None) -> str:
+    if 'DKR_SOCKET' in os.environ:
+        return os.environ['DKR_SOCKET']
+    if dkr_directory is None:
+        dkr_directory = os.path.join(os.path.expanduser("~"), ".dkr")
+    return os.path.join(dkr_directory, "dkr.sock")
+
+
+def forward(argv: list):
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+
+    with sock:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        request = json.dumps({'argv': argv, 'cwd': os.getcwd(), 'environ': dict(os.environ)}).encode('utf-8') + b'\n'
+        fds = array.array('i', [0, 1, 2])
+        try:
+            sent = sock.sendmsg([request], [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)])
+            sock.sendall(request[sent:])
+
+            response = _read_line(sock)
+        except KeyboardInterrupt:
+            # the server interrupts the command as soon as this connection is closed
+            return 128 + signal.SIGINT
+
+    if not response:
+        print("dkr server closed the connection without an exit code", file=sys.stderr)
+        return errors.UNKNOWN_ERROR
+
+    return json.loads(response.decode('utf-8'))['exit_code']
+
+
+def _read_line(sock: socket.socket, first: bytes=b'') -> bytes:
+    data = first
+    while not data.endswith(b'\n'):
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+def _receive_request(connection: socket.socket):
+    fd_size = array.array('i').itemsize * MAX_FDS
+    data, ancdata, flags, address = connection.recvmsg(65536, socket.CMSG_SPACE(fd_size))
+
+    fds = array.array('i')
+    for level, kind, payload in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(payload[:len(payload) - (len(payload) % fds.itemsize)])
+
+    request = json.loads(_read_line(connection, data).decode('utf-8'))
+    return request, list(fds)
+
+
+def _reap_children(signum, frame):
+    try:
+        while os.waitpid(-1, os.WNOHANG)[0]:
+            pass
+    except ChildProcessError:
+        pass
+
+
+# Runs in a handler process: the client closes its end of the connection when it is interrupted or killed, which
+# interrupts the command the same way Ctrl-C would have if it ran in the client
+def _watch_client(connection: socket.socket):
+    try:
+        connection.recv(1)
+    except OSError:
+        pass
+    signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+    time.sleep(INTERRUPT_GRACE)
+    os._exit(128 + signal.SIGINT)
+
+
+class Server:
+    def __init__(self, dkr_directory: str, state_store):
+        from dkr_core import dkr
+
+        self.dkr = dkr
+        self.dkr_directory = dkr_directory
+        self.state_store = state_store
+        self.state = state_store.state
+        self.loaded = {}
+        self.modules = None
+
+    # Imports every command module in the server process, so that the handlers forked from it start with them loaded
+    def refresh(self):
+        self.state_store.reload_if_changed()
+
+        try:
+            modules = self.dkr.load_commands(self.dkr_directory)
+        except Exception:
+            # the handler loads them again and reports the error to the client
+            self.modules = None
+            return
+        for name, entry in modules.items():
+            key = (name, entry.path, entry.mtime)
+            if key not in self.loaded:
+                try:
+                    entry.load()
+                except Exception:
+                    # reported by the handler of the first command that needs it
+                    continue
+                self.loaded[key] = entry
+            modules[name] = self.loaded[key]
+        self.modules = modules
+
+    def handle(self, argv: list, environ: dict) -> int:
+        debug = '--debug' in argv
+        # DKR_TIMINGS of the client, not of the server
+        timings = timings_module.from_arguments(argv[1:], environ)
+        try:
+            return self._handle(argv, debug, timings)
+        finally:
+            if timings is not None:
+                try:
+                    timings.write()
+                except OSError as e:
+                    print("Could not write timings: {}".format(e), file=sys.stderr)
+
+    def _handle(self, argv: list, debug: bool, timings) -> int:
+        phase = timings.phase if timings is not None else timings_module.no_phase
+
+        with phase('load state'):
+            self.state_store.reload_if_changed()
+        try:
+            # created in the handler, from the client's environment, never shared with other handlers
+            docker_client = LazyClient(timings=timings)
+            modules = self.modules
+            if modules is None:
+                with phase('load commands'):
+                    modules = self.dkr.load_commands(self.dkr_directory, timings)
+            with phase('build parser'):
+                parser = self.dkr.build_parser(modules, self.dkr.selected_command(argv[1:]), docker_client, self.state,
+                                               timings)
+            with phase('parse arguments'):
+                parsed_args = parser.parse_args(argv[1:])
+
+            if parsed_args.server:
+                raise errors.DkrException("A dkr server is already running on {}".format(socket_path()),
+                                          errors.INVALID_INPUT)
+
+            with phase('execute'):
+                self.dkr.execute(parsed_args, docker_client, self.state)
+            return 0
+        except SystemExit as e:
+            if e.code is None:
+                return 0
+            if isinstance(e.code, int):
+                return e.code
+            print(e.code, file=sys.stderr)
+            return errors.INVALID_INPUT
+        except Exception as e:
+            return errors.report(e, debug)
+        finally:
+            with phase('save state'):
+                self.state_store.save()
+
+    # Runs one request in a forked handler process, which takes over the client's standard streams, working directory
+    # and environment. Returns the exit code the handler process should exit with.
+    def serve_connection(self, connection: socket.socket) -> int:
+        request, fds = _receive_request(connection)
+        if len(fds) != MAX_FDS:
+            for fd in fds:
+                os.close(fd)
+            raise errors.DkrException("dkr client did not send its standard streams", errors.INVALID_INPUT)
+
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = os.fdopen(0, 'r', closefd=False)
+        sys.stdout = os.fdopen(1, 'w', closefd=False)
+        sys.stderr = os.fdopen(2, 'w', closefd=False)
+        sys.argv = request['argv']
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request.get('environ', {}))
+
+        threading.Thread(target=_watch_client, args=(connection,), daemon=True).start()
+        try:
+            exit_code = self.handle(request['argv'], request.get('environ', {}))
+        except KeyboardInterrupt:
+            exit_code = 128 + signal.SIGINT
+
+        # the client hanging up after reading the exit code must not interrupt anything anymore
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except OSError:
+            pass
+        try:
+            connection.sendall(json.dumps({'exit_code': exit_code}).encode('utf-8') + b'\n')
+        except OSError:
+            pass
+        return exit_code
+
+
+def _run_handler(server: Server, listener: socket.socket, connection: socket.socket):
+    exit_code = errors.UNKNOWN_ERROR
+    try:
+        listener.close()
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        exit_code = server.serve_connection(connection)
+    except BaseException as e:
+        print("dkr server: dropped request: {}".format(e), file=sys.__stderr__)
+    finally:
+        # never fall back into the accept loop of the server process
+        os._exit(exit_code)
+
+
+def serve(dkr_directory: str, state_store):
+    path = socket_path(dkr_directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # held for as long as the server runs, so a second server can not take over the socket of a running one
+    lock_file = open(path + '.lock', 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise errors.DkrException("A dkr server is already running on {}".format(path), errors.INVALID_INPUT)
+
+    with lock_file:
+        _serve(path, lock_file, dkr_directory, state_store)
+
+
+def _serve(path: str, lock_file, dkr_directory: str, state_store):
+    # whoever held the lock before is gone, so a socket left behind is stale
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = Server(dkr_directory, state_store)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)
+    try:
+        listener.bind(path)
+    finally:
+        os.umask(old_umask)
+    listener.listen(64)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGCHLD, _reap_children)
+
+    print("dkr server listening on {}".format(path), file=sys.stderr)
+    try:
+        while True:
+            connection, address = listener.accept()
+            with connection:
+                server.refresh()
+
+                # every request runs in its own process, so a long `logs -f` never holds up other invocations
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if os.fork() == 0:
+                    # a handler still running after the server stopped must not keep the next one from starting
+                    lock_file.close()
+                    _run_handler(server, listener, connection)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        listener.close()
+        os.remove(path)
@@ -0,0 +1,145 @@
+import copy
+import fcntl
+import json
+import os
+import re
+import tempfile
+from contextlib import contextmanager
+
+from dkr_core import errors
+
+_namespace_pattern = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+def read_json(path: str) -> dict:
+    try:
+        with open(path, 'r') as json_data:
+            loaded_json = json.load(json_data)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        # a file truncated by an older dkr is treated as empty rather than breaking every command
+        return {}
+
+    return loaded_json if isinstance(loaded_json, dict) else {}
+
+
+def _mtime(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+@contextmanager
+def locked(path: str):
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_json_atomic(path: str, data: dict, indent: int=2):
+    directory = os.path.dirname(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.{}.'.format(os.path.basename(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file, indent=indent)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class _Document:
+    def __init__(self, path: str, data: dict=None):
+        self.path = path
+        self.data = data if data is not None else {}
+        self.snapshot = {}
+        self.mtime = None
+
+    def load(self):
+        self.mtime = _mtime(self.path)
+        loaded = read_json(self.path)
+        self.data.clear()
+        self.data.update(loaded)
+        self.snapshot = copy.deepcopy(loaded)
+
+    def reload_if_changed(self) -> bool:
+        if _mtime(self.path) == self.mtime:
+            return False
+        self.load()
+        return True
+
+    def save(self) -> bool:
+        changed = {}
+        for key, value in self.data.items():
+            if key not in self.snapshot or self.snapshot[key] != value:
+                changed[key] = value
+        removed = [key for key in self.snapshot if key not in self.data]
+
+        if not changed and not removed:
+            return False
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with locked(self.path):
+            # only the keys this process touched are applied, on top of whatever other processes wrote meanwhile
+            current = read_json(self.path)
+            current.update(changed)
+            for key in removed:
+                current.pop(key, None)
+            write_json_atomic(self.path, current)
+            self.mtime = _mtime(self.path)
+
+        self.data.clear()
+        self.data.update(current)
+        self.snapshot = copy.deepcopy(current)
+        return True
+
+
+class State(dict):
+    def __init__(self, store):
+        super().__init__()
+        self._store = store
+
+    def namespace(self, name: str) -> dict:
+        return self._store.namespace(name)
+
+
+class StateStore:
+    def __init__(self, state_file: str):
+        self.state_file = state_file
+        self.namespace_directory = os.path.join(os.path.dirname(state_file), "state")
+        self.state = State(self)
+        self._document = _Document(state_file, self.state)
+        self._namespaces = {}
+
+    def load(self) -> State:
+        self._document.load()
+        self._namespaces = {}
+        return self.state
+
+    def reload_if_changed(self):
+        self._document.reload_if_changed()
+        for document in self._namespaces.values():
+            document.reload_if_changed()
+
+    def namespace(self, name: str) -> dict:
+        if not _namespace_pattern.match(name):
+            raise errors.DkrException("Invalid state namespace: {}".format(name), errors.INVALID_INPUT)
+
+        if name not in self._namespaces:
+            document = _Document(os.path.join(self.namespace_directory, "{}.json".format(name)))
+            document.load()
+            self._namespaces[name] = document
+        return self._namespaces[name].data
+
+    def save(self):
+        self._document.save()
+        for document in self._namespaces.values():
+            document.save()
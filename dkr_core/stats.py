@@ -0,0 +1,149 @@
+import threading
+import time
+from collections import OrderedDict
+
+from dkr_core import jsonstream
+from dkr_core.client import open_stream
+
+
+def _cpu_totals(cpu_stats: dict):
+    return cpu_stats.get('cpu_usage', {}).get('total_usage', 0), cpu_stats.get('system_cpu_usage', 0)
+
+
+def _online_cpus(cpu_stats: dict) -> int:
+    if cpu_stats.get('online_cpus'):
+        return cpu_stats['online_cpus']
+    return len(cpu_stats.get('cpu_usage', {}).get('percpu_usage') or []) or 1
+
+
+def _network_totals(sample: dict):
+    # API versions before 1.21 report a single interface under 'network'
+    networks = sample.get('networks') or {}
+    if not networks and sample.get('network'):
+        networks = {'eth0': sample['network']}
+
+    rx = sum(network.get('rx_bytes', 0) for network in networks.values())
+    tx = sum(network.get('tx_bytes', 0) for network in networks.values())
+    return rx, tx
+
+
+def _block_totals(sample: dict):
+    read = 0
+    write = 0
+    for entry in sample.get('blkio_stats', {}).get('io_service_bytes_recursive') or []:
+        op = entry.get('op', '').lower()
+        if op == 'read':
+            read += entry.get('value', 0)
+        elif op == 'write':
+            write += entry.get('value', 0)
+    return read, write
+
+
+def _rate(current: int, previous: int, elapsed: float) -> float:
+    if not elapsed or elapsed <= 0 or current < previous:
+        return 0.0
+    return (current - previous) / elapsed
+
+
+# Turns one sample from the stats endpoint into the numbers dkr shows. CPU is measured against `previous` when given,
+# otherwise against the precpu_stats the daemon includes; the byte rates need `previous` and the seconds between them.
+def compute(sample: dict, previous: dict=None, elapsed: float=None) -> dict:
+    cpu_stats = sample.get('cpu_stats', {})
+    precpu_stats = previous.get('cpu_stats', {}) if previous else sample.get('precpu_stats', {})
+
+    cpu, system = _cpu_totals(cpu_stats)
+    previous_cpu, previous_system = _cpu_totals(precpu_stats)
+    cpu_percent = 0.0
+    if previous_system and system > previous_system and cpu > previous_cpu:
+        cpu_percent = (cpu - previous_cpu) / (system - previous_system) * _online_cpus(cpu_stats) * 100.0
+
+    memory_stats = sample.get('memory_stats', {})
+    memory_details = memory_stats.get('stats', {})
+    # page cache is reclaimable, which is why docker does not count it either (cache on cgroup v1, inactive_file on v2)
+    cache = memory_details.get('cache', memory_details.get('inactive_file', 0))
+    memory_usage = max(memory_stats.get('usage', 0) - cache, 0)
+    memory_limit = memory_stats.get('limit', 0)
+
+    net_rx, net_tx = _network_totals(sample)
+    block_read, block_write = _block_totals(sample)
+
+    result = {
+        'cpu_percent': cpu_percent,
+        'memory_usage': memory_usage,
+        'memory_limit': memory_limit,
+        'memory_percent': memory_usage / memory_limit * 100.0 if memory_limit else 0.0,
+        'net_rx': net_rx,
+        'net_tx': net_tx,
+        'block_read': block_read,
+        'block_write': block_write,
+        'pids': sample.get('pids_stats', {}).get('current', 0),
+        'net_rx_rate': 0.0,
+        'net_tx_rate': 0.0,
+        'block_read_rate': 0.0,
+        'block_write_rate': 0.0
+    }
+
+    if previous:
+        previous_rx, previous_tx = _network_totals(previous)
+        previous_read, previous_write = _block_totals(previous)
+        result['net_rx_rate'] = _rate(net_rx, previous_rx, elapsed)
+        result['net_tx_rate'] = _rate(net_tx, previous_tx, elapsed)
+        result['block_read_rate'] = _rate(block_read, previous_read, elapsed)
+        result['block_write_rate'] = _rate(block_write, previous_write, elapsed)
+
+    return result
+
+
+def fetch_once(docker_client, container_id: str) -> dict:
+    response = docker_client._get(docker_client._url('/containers/{0}/stats', container_id), params={'stream': 0})
+    docker_client._raise_for_status(response)
+    return compute(response.json())
+
+
+# Follows the stats stream of every container on its own thread and keeps only the latest computed sample of each,
+# so rendering costs the same no matter how often the daemon sends samples.
+class StatsWatcher:
+    def __init__(self, docker_client, container_ids: list):
+        self.docker_client = docker_client
+        self.latest = OrderedDict((container_id, None) for container_id in container_ids)
+        self.finished = set()
+        self.errors = []
+        self.lock = threading.Lock()
+
+    def start(self):
+        if hasattr(self.docker_client, 'ensure_pool_size'):
+            self.docker_client.ensure_pool_size(len(self.latest))
+
+        for container_id in self.latest:
+            threading.Thread(target=self._follow, args=(container_id,), daemon=True).start()
+
+    def _follow(self, container_id: str):
+        try:
+            response = open_stream(self.docker_client, 'get', '/containers/{0}/stats', container_id,
+                                   params={'stream': 1})
+            previous = None
+            previous_time = None
+            with response:
+                for sample in jsonstream.iter_objects(response.iter_content(None)):
+                    now = time.monotonic()
+                    usage = compute(sample, previous, now - previous_time if previous else None)
+                    with self.lock:
+                        self.latest[container_id] = usage
+                    previous = sample
+                    previous_time = now
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+        finally:
+            with self.lock:
+                self.finished.add(container_id)
+
+    @property
+    def running(self) -> bool:
+        with self.lock:
+            return len(self.finished) < len(self.latest)
+
+    def snapshot(self) -> list:
+        with self.lock:
+            return [(container_id, usage) for container_id, usage in self.latest.items()
+                    if usage is not None and container_id not in self.finished]
@@ -0,0 +1,90 @@
+import json
+import re
+
+from dkr_core import errors
+
+_field = re.compile(r'\{\{\s*(\.[A-Za-z0-9_.\-]*)\s*\}\}')
+
+
+def format_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return ','.join(format_value(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys=True)
+    return str(value)
+
+
+# Returns a function that looks up a '.State.Status' style path in an object, or None when it is missing
+def compile_field(path: str, derived: dict=None):
+    if derived is None:
+        derived = {}
+
+    keys = [key for key in path.split('.') if key]
+    if not keys:
+        return lambda obj: obj
+
+    first = keys[0]
+    rest = keys[1:]
+    if first in derived:
+        compute = derived[first]
+    else:
+        def compute(obj):
+            return obj.get(first) if isinstance(obj, dict) else None
+
+    if not rest:
+        return compute
+
+    def access(obj):
+        value = compute(obj)
+        index = 0
+        while index < len(rest):
+            if not isinstance(value, dict):
+                return None
+
+            # label keys usually contain dots themselves, so the rest of the path is tried as a single key first
+            joined = '.'.join(rest[index:])
+            if joined in value:
+                return value[joined]
+            value = value.get(rest[index])
+            index += 1
+        return value
+    return access
+
+
+def _accessor(path: str, derived: dict):
+    field = compile_field(path, derived)
+    return lambda obj: format_value(field(obj))
+
+
+def _literal(text: str, template: str) -> str:
+    # braces left over between fields are a field that did not parse, e.g. '{{Id}}' without the dot
+    if '{{' in text or '}}' in text:
+        raise errors.DkrException("Invalid template field in: {}".format(template), errors.INVALID_INPUT)
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+# Turns a '{{.Id}} {{.Labels.com.example}}' style template into a function that renders one object. Only the fields
+# the template references are ever computed; `derived` maps field names to functions computing them from the object.
+def compile_template(template: str, derived: dict=None):
+    if derived is None:
+        derived = {}
+
+    format_parts = []
+    accessors = []
+    position = 0
+    for match in _field.finditer(template):
+        format_parts.append(_literal(template[position:match.start()], template))
+        format_parts.append('{}')
+        accessors.append(_accessor(match.group(1), derived))
+        position = match.end()
+    format_parts.append(_literal(template[position:], template))
+
+    format_string = ''.join(format_parts)
+
+    def render(obj) -> str:
+        return format_string.format(*[accessor(obj) for accessor in accessors])
+    return render
@@ -0,0 +1,124 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+ENV_VAR = 'DKR_TIMINGS'
+
+# the client's own helpers that go over the wire; everything else starting with _ is bookkeeping like _url
+TIMED_PRIVATE_CALLS = ('_get', '_post', '_put', '_delete', '_head')
+
+
+def from_arguments(argv: list, environ: dict=None):
+    if environ is None:
+        environ = os.environ
+
+    # checked before argparse runs, so that loading the commands can be timed too
+    options = argv[:argv.index('--')] if '--' in argv else argv
+
+    json_file = None
+    for index, arg in enumerate(options):
+        if arg == '--timings-file' and index + 1 < len(options):
+            json_file = options[index + 1]
+        elif arg.startswith('--timings-file='):
+            json_file = arg.split('=', 1)[1]
+
+    if json_file is None and '--timings' not in options:
+        value = environ.get(ENV_VAR, '')
+        if not value or value == '0':
+            return None
+        if value not in ('1', 'stderr'):
+            json_file = value
+
+    return Timings(json_file)
+
+
+@contextmanager
+def no_phase(name: str):
+    yield
+
+
+class Timings:
+    def __init__(self, json_file: str=None):
+        self.json_file = json_file
+        self.started = time.perf_counter()
+        self.phases = OrderedDict()
+        self.imports = OrderedDict()
+        self.calls = OrderedDict()
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - started
+
+    def record_import(self, path: str, seconds: float):
+        self.imports[path] = seconds
+
+    def record_call(self, name: str, seconds: float, failed: bool=False):
+        with self.lock:
+            call = self.calls.get(name)
+            if call is None:
+                call = self.calls[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0}
+            call['count'] += 1
+            call['total'] += seconds
+            call['max'] = max(call['max'], seconds)
+            if failed:
+                call['errors'] += 1
+
+    def wrap(self, name: str, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                self.record_call(name, time.perf_counter() - started, failed)
+        return timed
+
+    def to_dict(self) -> dict:
+        return {
+            'total': time.perf_counter() - self.started,
+            'phases': self.phases,
+            'imports': self.imports,
+            'calls': self.calls
+        }
+
+    def write(self, file=None):
+        if self.json_file:
+            with open(self.json_file, 'w') as json_output:
+                json.dump(self.to_dict(), json_output, indent=2)
+            return
+
+        if file is None:
+            file = sys.stderr
+
+        width = max([32] + [len(name) for name in list(self.phases) + list(self.imports) + list(self.calls)])
+        row = "  {:<" + str(width) + "} {:>9.1f}"
+
+        print("Timings (ms):", file=file)
+        for name, seconds in self.phases.items():
+            print(row.format(name, seconds * 1000), file=file)
+        print(row.format("total", (time.perf_counter() - self.started) * 1000), file=file)
+
+        if self.imports:
+            print("Extension imports (ms, slowest first):", file=file)
+            for path, seconds in sorted(self.imports.items(), key=lambda item: item[1], reverse=True):
+                print(row.format(path, seconds * 1000), file=file)
+
+        if self.calls:
+            print("Docker API calls:", file=file)
+            print(("  {:<" + str(width) + "} {:>9} {:>9} {:>9}").format("call", "count", "total ms", "max ms"),
+                  file=file)
+            for name, call in sorted(self.calls.items(), key=lambda item: item[1]['total'], reverse=True):
+                errors = " ({} failed)".format(call['errors']) if call['errors'] else ""
+                print(("  {:<" + str(width) + "} {:>9} {:>9.1f} {:>9.1f}{}").format(
+                    name, call['count'], call['total'] * 1000, call['max'] * 1000, errors), file=file)
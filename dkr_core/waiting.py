@@ -0,0 +1,158 @@
+import json
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+from dkr_core import errors
+from dkr_core import jsonstream
+from dkr_core import parallel
+from dkr_core.client import open_stream
+
+CONDITIONS = ('exited', 'healthy', 'running')
+EVENTS = ['start', 'die', 'destroy', 'health_status']
+
+_END = object()
+
+
+# Waits for containers to reach a condition without polling. The events stream is opened before the containers are
+# looked at, then each one is inspected once: anything that happened before the subscription shows in the inspect,
+# anything after arrives as an event.
+class ContainerWaiter:
+    def __init__(self, docker_client, condition: str, jobs: int=1):
+        self.docker_client = docker_client
+        self.condition = condition
+        self.jobs = jobs
+        self.events = queue.Queue()
+        self.response = None
+
+    def subscribe(self):
+        if hasattr(self.docker_client, 'ensure_pool_size'):
+            # the events stream holds one connection for as long as the wait lasts
+            self.docker_client.ensure_pool_size(self.jobs + 1)
+
+        filters = {'type': ['container'], 'event': EVENTS}
+        self.response = open_stream(self.docker_client, 'get', '/events', params={'filters': json.dumps(filters)})
+        threading.Thread(target=self._read, args=(self.response,), daemon=True).start()
+
+    def _read(self, response):
+        try:
+            for event in jsonstream.iter_objects(response.iter_content(None)):
+                self.events.put(event)
+        except Exception:
+            pass
+        self.events.put(_END)
+
+    def close(self):
+        response, self.response = self.response, None
+        if response is None:
+            return
+
+        # closing the response alone would not wake up the thread blocked reading it
+        if hasattr(self.docker_client, '_get_raw_response_socket'):
+            try:
+                sock = self.docker_client._get_raw_response_socket(response)
+            except Exception:
+                sock = None
+            for candidate in (sock, getattr(sock, '_sock', None)):
+                if hasattr(candidate, 'shutdown'):
+                    try:
+                        candidate.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+                    break
+        response.close()
+
+    # (exit code, exception) once the inspected state settles the condition, None while it is still open
+    def _check_inspected(self, name: str, container_state: dict):
+        running = container_state.get('Running', False)
+        if self.condition == 'exited':
+            return None if running else (container_state.get('ExitCode', 0), None)
+
+        if self.condition == 'running':
+            return (0, None) if running else None
+
+        health = container_state.get('Health')
+        if health is None:
+            return 0, errors.DkrException("{} has no health check".format(name), errors.COMMAND_ERROR)
+        if health.get('Status') == 'healthy':
+            return 0, None
+        if health.get('Status') == 'unhealthy':
+            return 0, errors.DkrException("{} is unhealthy".format(name), errors.COMMAND_ERROR)
+        if not running and container_state.get('Status') not in ('created', None):
+            message = "{} exited with {} before becoming healthy".format(name, container_state.get('ExitCode', 0))
+            return 0, errors.DkrException(message, errors.COMMAND_ERROR)
+        return None
+
+    def _check_event(self, name: str, container_id: str, event: dict):
+        action = event.get('Action', event.get('status', ''))
+        if action == 'destroy':
+            return 0, errors.DkrException("{} was removed".format(name), errors.COMMAND_ERROR)
+
+        if self.condition == 'exited' and action == 'die':
+            exit_code = event.get('Actor', {}).get('Attributes', {}).get('exitCode')
+            if exit_code is None:
+                # daemons before API 1.22 send no attributes with their events
+                exit_code = self.docker_client.inspect_container(container_id)['State'].get('ExitCode', 0)
+            return int(exit_code), None
+
+        if self.condition == 'running' and action == 'start':
+            return 0, None
+
+        if self.condition == 'healthy':
+            if action == 'health_status: healthy':
+                return 0, None
+            if action == 'health_status: unhealthy':
+                return 0, errors.DkrException("{} is unhealthy".format(name), errors.COMMAND_ERROR)
+            if action == 'die':
+                return 0, errors.DkrException("{} exited before becoming healthy".format(name), errors.COMMAND_ERROR)
+        return None
+
+    # Yields (container, exit code, exception) for every container as soon as its condition is settled. The exit code
+    # is the container's own for `exited` and 0 otherwise; containers still waiting at the timeout get a TIMEOUT error.
+    def wait(self, containers: list, timeout: float=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        if self.response is None:
+            self.subscribe()
+
+        def inspect(container):
+            return self.docker_client.inspect_container(container)
+
+        pending = OrderedDict()
+        names = list(OrderedDict.fromkeys(containers))
+        for container, info, e in parallel.run_ordered(names, inspect, self.jobs, self.docker_client):
+            if e is not None:
+                yield container, 0, e
+                continue
+
+            settled = self._check_inspected(container, info.get('State', {}))
+            if settled is None:
+                pending[info['Id']] = container
+            else:
+                yield (container,) + settled
+
+        while pending:
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty()
+                event = self.events.get(timeout=remaining)
+            except queue.Empty:
+                for container in pending.values():
+                    message = "Timed out waiting for {} to be {}".format(container, self.condition)
+                    yield container, 0, errors.DkrException(message, errors.TIMEOUT)
+                return
+
+            if event is _END:
+                for container in pending.values():
+                    message = "The event stream ended while waiting for {}".format(container)
+                    yield container, 0, errors.DkrException(message, errors.DOCKER_ERROR)
+                return
+
+            container_id = event.get('Actor', {}).get('ID', event.get('id'))
+            if container_id not in pending:
+                continue
+            settled = self._check_event(pending[container_id], container_id, event)
+            if settled is not None:
+                yield (pending.pop(container_id),) + settled
@@ -0,0 +1,85 @@
+import asyncio
+import unittest
+
+from benchmarks.fake_engine import FakeEngine, fake_container, pull_events
+from dkr_core import aio
+
+# the fake engine's listen backlog is 5, more connections than that can be refused
+MAX_CONNECTIONS = 4
+TIMEOUT = 10
+
+
+class AsyncClientTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = FakeEngine(containers=3, latency=0.01, pull_steps=5, chunk_size=64).start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.engine.stop()
+
+    def run_client(self, func, max_connections: int=MAX_CONNECTIONS):
+        client = aio.AsyncClient(max_connections=max_connections, environ={'DOCKER_HOST': self.engine.docker_host})
+        try:
+            # a deadlock fails the test instead of hanging it
+            return self.loop.run_until_complete(asyncio.wait_for(func(client), TIMEOUT))
+        finally:
+            client.close()
+            # closed transports let go of their sockets on the next turn of the loop
+            self.loop.run_until_complete(asyncio.sleep(0))
+
+    def test_get_decodes_json(self):
+        async def list_containers(client):
+            return await client.get('/containers/json', params={'all': True})
+
+        containers = self.run_client(list_containers)
+        self.assertEqual([container['Names'] for container in containers],
+                         [fake_container(index)['Names'] for index in range(3)])
+
+    def test_objects_decodes_a_chunked_stream(self):
+        async def pull(client):
+            response = await client.open('POST', '/images/create', params={'fromImage': 'example/image', 'tag': '1'})
+            events = []
+            async with response:
+                async for event in response.objects():
+                    events.append(event)
+            return events
+
+        self.assertEqual(self.run_client(pull), pull_events('example/image:1', 5, 5))
+
+    def test_error_status_raises_api_error(self):
+        async def missing(client):
+            with self.assertRaises(aio.APIError) as raised:
+                await client.get('/plugins')
+            # the slot of the failed request is free again
+            await client.get('/version')
+            return raised.exception
+
+        error = self.run_client(missing, max_connections=1)
+        self.assertEqual(error.status_code, 404)
+        self.assertEqual(error.message, "fake engine does not implement GET /plugins")
+
+    def test_more_requests_than_connections(self):
+        async def inspect_all(client):
+            return await asyncio.gather(*[client.get('/containers/{}/json', 'c{}'.format(index))
+                                          for index in range(MAX_CONNECTIONS * 5)])
+
+        inspected = self.run_client(inspect_all)
+        self.assertEqual([container['Id'] for container in inspected],
+                         ['c{}'.format(index) for index in range(MAX_CONNECTIONS * 5)])
+        self.assertEqual(self.engine.requests, MAX_CONNECTIONS * 5)
+
+    def test_closing_a_stream_early_releases_its_connection(self):
+        async def abandon(client):
+            for _ in range(3):
+                response = await client.open('POST', '/images/create', params={'fromImage': 'example/image'})
+                async for event in response.objects():
+                    break
+                response.close()
+            return await client.get('/version')
+
+        self.assertEqual(self.run_client(abandon, max_connections=1)['Version'], 'fake')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import gzip
+import io
+import os
+import unittest
+
+from dkr_core import archive, errors
+
+
+def _write(data: bytes, jobs: int) -> bytes:
+    output = io.BytesIO()
+    writer = archive.open_writer(output, 'gzip', jobs=jobs)
+    # uneven writes, so blocks are cut in the middle of them
+    for start in range(0, len(data), 300000):
+        writer.write(data[start:start + 300000])
+    writer.close()
+    return output.getvalue()
+
+
+def _read(compressed: bytes, jobs: int) -> list:
+    _, chunks = archive.open_reader(io.BytesIO(compressed), jobs)
+    return list(chunks)
+
+
+class ArchiveTest(unittest.TestCase):
+    def setUp(self):
+        # random blocks that barely compress next to ones that do, over several BLOCK_SIZE blocks
+        self.data = (os.urandom(archive.BLOCK_SIZE) + b'layer.tar\n' * 200000) * 2
+
+    def test_parallel_round_trip(self):
+        compressed = _write(self.data, 4)
+        self.assertTrue(archive._is_block_gzip(compressed[:archive._BLOCK_HEADER.size]))
+        for jobs in (1, 4):
+            self.assertEqual(b''.join(_read(compressed, jobs)), self.data)
+
+    def test_other_tools_read_dkr_archives(self):
+        self.assertEqual(gzip.decompress(_write(self.data, 4)), self.data)
+
+    def test_plain_multi_member_gzip(self):
+        compressed = gzip.compress(self.data[:archive.BLOCK_SIZE]) + gzip.compress(self.data[archive.BLOCK_SIZE:])
+        self.assertFalse(archive._is_block_gzip(compressed[:archive._BLOCK_HEADER.size]))
+        self.assertEqual(b''.join(_read(compressed, 4)), self.data)
+
+    def test_empty_archive_yields_no_chunks(self):
+        compressed = _write(b'', 4)
+        self.assertEqual(gzip.decompress(compressed), b'')
+        self.assertEqual(_read(compressed, 4), [])
+        self.assertEqual(_read(gzip.compress(b''), 1), [])
+        self.assertEqual(_read(b'', 1), [])
+
+    def test_truncated_archives_are_reported(self):
+        for compressed in (_write(self.data, 4), gzip.compress(self.data)):
+            with self.assertRaises(errors.DkrException) as raised:
+                _read(compressed[:len(compressed) // 2], 4)
+            self.assertEqual(raised.exception.exit_code, errors.INVALID_INPUT)
+
+    def test_corrupt_block_is_reported(self):
+        compressed = bytearray(_write(self.data, 4))
+        # the crc in the trailer of the first member
+        member_size = archive._BLOCK_HEADER.unpack_from(compressed)[-1]
+        compressed[member_size - archive._BLOCK_TRAILER.size] ^= 0xff
+        with self.assertRaises(errors.DkrException) as raised:
+            _read(bytes(compressed), 4)
+        self.assertIn("Corrupt gzip block", raised.exception.message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from dkr_core.buildcontext import IgnoreRules, base_images, iter_context
+
+
+class BaseImagesTest(unittest.TestCase):
+    def test_stages_and_scratch_are_not_base_images(self):
+        dockerfile = "# syntax=docker/dockerfile:1\n" \
+                     "FROM golang:1.8 AS build\nRUN make\n" \
+                     "FROM scratch\nCOPY --from=build /app /app\n" \
+                     "from build as test\n" \
+                     "FROM --platform=linux/amd64 \\\n    alpine:3.5\n"
+        self.assertEqual(base_images(dockerfile), ['golang:1.8', 'alpine:3.5'])
+
+    def test_unknown_when_from_uses_a_variable(self):
+        self.assertIsNone(base_images("ARG VERSION=1\nFROM node:${VERSION}\n"))
+        self.assertIsNone(base_images("# escape=`\nFROM node\n"))
+
+
+class IterContextTest(unittest.TestCase):
+    def setUp(self):
+        self.context = tempfile.TemporaryDirectory()
+        for path in ('app.py', 'build/Dockerfile', 'build/cache.bin', 'node_modules/x/index.js'):
+            full_path = os.path.join(self.context.name, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, 'w') as file:
+                file.write(path)
+
+    def tearDown(self):
+        self.context.cleanup()
+
+    def paths(self, lines: list, always: set=()) -> list:
+        return [path for path, _ in iter_context(self.context.name, IgnoreRules(lines), always)]
+
+    def test_excluded_directories_are_skipped(self):
+        self.assertEqual(self.paths(['build', 'node_modules']), ['app.py'])
+
+    def test_always_sent_paths_inside_excluded_directories_are_found(self):
+        self.assertEqual(self.paths(['build', 'node_modules'], {'build/Dockerfile', '.dockerignore'}),
+                         ['app.py', 'build/Dockerfile'])
+
+    def test_exceptions_include_paths_again(self):
+        self.assertEqual(self.paths(['node_modules', 'build', '!build/cache.bin']), ['app.py', 'build/cache.bin'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import importlib.util
+import os
+import tempfile
+import time
+import unittest
+
+from dkr_core import cache
+from dkr_core.state import write_json_atomic
+
+CONTAINERS = {
+    'a1b2c3' + '0' * 58: {'Id': 'a1b2c3' + '0' * 58, 'Names': ['/web']},
+    'a1ffff' + '0' * 58: {'Id': 'a1ffff' + '0' * 58, 'Names': ['/db']},
+}
+IMAGES = {
+    'sha256:' + 'd4' * 32: {'Id': 'sha256:' + 'd4' * 32, 'RepoTags': ['nginx:latest', 'nginx:1.11']},
+}
+
+
+class CacheLookupTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+        self.saved_home = os.environ.get('HOME')
+        os.environ['HOME'] = self.home.name
+        os.makedirs(os.path.join(self.home.name, '.dkr'))
+        cache._snapshots.clear()
+
+    def tearDown(self):
+        cache._snapshots.clear()
+        if self.saved_home is None:
+            os.environ.pop('HOME', None)
+        else:
+            os.environ['HOME'] = self.saved_home
+        self.home.cleanup()
+
+    def write_cache(self, heartbeat: float):
+        write_json_atomic(cache.cache_file(), {
+            'version': cache.CACHE_VERSION,
+            'synced': heartbeat,
+            'heartbeat': heartbeat,
+            'containers': CONTAINERS,
+            'images': IMAGES
+        })
+
+    def test_names_and_unique_prefixes_resolve_to_full_ids(self):
+        self.write_cache(time.time())
+        self.assertEqual(cache.container_id('web', {}), 'a1b2c3' + '0' * 58)
+        self.assertEqual(cache.container_id('/db', {}), 'a1ffff' + '0' * 58)
+        self.assertEqual(cache.container_id('a1b', {}), 'a1b2c3' + '0' * 58)
+        self.assertEqual(cache.image_id('nginx', {}), 'sha256:' + 'd4' * 32)
+        self.assertEqual(cache.image_id('d4d4', {}), 'sha256:' + 'd4' * 32)
+
+    def test_ambiguous_and_unknown_references_are_left_to_the_daemon(self):
+        self.write_cache(time.time())
+        self.assertEqual(cache.container_id('a1', {}), 'a1')
+        self.assertEqual(cache.container_id('missing', {}), 'missing')
+        self.assertEqual(cache.image_id('redis', {}), 'redis')
+
+    def test_stale_or_missing_snapshot_is_not_used(self):
+        self.assertEqual(cache.container_id('web', {}), 'web')
+
+        cache._snapshots.clear()
+        self.write_cache(time.time() - 60)
+        self.assertEqual(cache.container_id('web', {'cache_max_age': 30}), 'web')
+        self.assertEqual(cache.container_id('web', {'cache_max_age': 120}), 'a1b2c3' + '0' * 58)
+
+    @unittest.skipUnless(importlib.util.find_spec('docker'), "the retry catches docker.errors.NotFound")
+    def test_removed_container_is_retried_with_the_reference(self):
+        import docker.errors
+        import requests
+
+        self.write_cache(time.time())
+        response = requests.Response()
+        response.status_code = 404
+        calls = []
+
+        def inspect(container):
+            calls.append(container)
+            if container == 'a1b2c3' + '0' * 58:
+                raise docker.errors.NotFound("No such container", response)
+            return {'Id': 'e5' * 32}
+
+        self.assertEqual(cache.with_container('web', {}, inspect), {'Id': 'e5' * 32})
+        self.assertEqual(calls, ['a1b2c3' + '0' * 58, 'web'])
+
+
+class FakeClient:
+    def __init__(self):
+        self.listed = {}
+
+    def containers(self, all=False, filters=None):
+        return [self.listed[filters['id']]] if filters['id'] in self.listed else []
+
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.client = FakeClient()
+        self.watcher = cache.Watcher(self.client, os.path.join(self.directory.name, 'cache.json'))
+        self.watcher.containers = dict(CONTAINERS)
+        self.watcher.write()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def event(self, action: str, container_id: str) -> dict:
+        return {'Type': 'container', 'Action': action, 'Actor': {'ID': container_id}, 'time': int(time.time())}
+
+    def test_removed_and_renamed_containers_are_written_at_once(self):
+        self.watcher.apply(self.event('destroy', 'a1b2c3' + '0' * 58))
+        self.assertEqual(cache.load_snapshot(60, self.watcher.path).resolve_container('web'), [])
+
+        self.client.listed['a1ffff' + '0' * 58] = {'Id': 'a1ffff' + '0' * 58, 'Names': ['/web']}
+        self.watcher.apply(self.event('rename', 'a1ffff' + '0' * 58))
+        self.assertEqual(cache.load_snapshot(60, self.watcher.path).resolve_container('web'), ['a1ffff' + '0' * 58])
+
+    def test_other_events_are_batched(self):
+        self.client.listed['a1ffff' + '0' * 58] = {'Id': 'a1ffff' + '0' * 58, 'Names': ['/db'], 'State': 'exited'}
+        self.watcher.apply(self.event('die', 'a1ffff' + '0' * 58))
+        self.assertTrue(self.watcher.dirty)
+
+
+if __name__ == '__main__':
+    unittest.main()
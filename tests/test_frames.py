@@ -0,0 +1,53 @@
+import io
+import re
+import unittest
+
+from dkr_core import frames
+
+
+def _frames(*payloads) -> io.BytesIO:
+    data = b''.join(frames.HEADER.pack(stream, len(payload)) + payload for stream, payload in payloads)
+    return io.BytesIO(data)
+
+
+def _lines(source, tty: bool=False, **kwargs) -> list:
+    return [(stream, bytes(data)) for stream, data in frames.iter_lines(source, tty, **kwargs)]
+
+
+class IterLinesTest(unittest.TestCase):
+    def test_anchored_pattern_matches_every_line(self):
+        source = _frames((frames.STDOUT, b'ERROR one\ninfo ERROR two\nERROR three\n'))
+        self.assertEqual(_lines(source, pattern=re.compile(b'^ERROR')),
+                         [(frames.STDOUT, b'ERROR one\nERROR three\n')])
+
+    def test_end_anchor_does_not_see_the_newline_or_the_next_line(self):
+        source = _frames((frames.STDOUT, b'a done\nb done later\nc done\n'))
+        self.assertEqual(_lines(source, pattern=re.compile(b'done$')), [(frames.STDOUT, b'a done\nc done\n')])
+
+    def test_anchored_pattern_on_a_line_split_across_frames(self):
+        source = _frames((frames.STDOUT, b'skip\nERR'), (frames.STDOUT, b'OR split\nnot ERROR\n'))
+        self.assertEqual(_lines(source, pattern=re.compile(b'^ERROR.*split$')),
+                         [(frames.STDOUT, b'ERROR split\n')])
+
+    def test_streams_are_kept_apart(self):
+        source = _frames((frames.STDOUT, b'out '), (frames.STDERR, b'err\n'), (frames.STDOUT, b'line\n'))
+        self.assertEqual(_lines(source, prefix=b'c | '),
+                         [(frames.STDERR, b'c | err\n'), (frames.STDOUT, b'c | out line\n')])
+
+    def test_unterminated_last_line(self):
+        source = _frames((frames.STDOUT, b'first\nlast'))
+        self.assertEqual(_lines(source), [(frames.STDOUT, b'first\n'), (frames.STDOUT, b'last\n')])
+
+    def test_long_line_is_passed_on_in_pieces(self):
+        source = _frames((frames.STDOUT, b'x' * 10), (frames.STDOUT, b'y' * 10 + b'\n'))
+        self.assertEqual(_lines(source, max_line=8),
+                         [(frames.STDOUT, b'x' * 10 + b'\n'), (frames.STDOUT, b'y' * 10 + b'\n')])
+
+    def test_tty_stream(self):
+        source = io.BytesIO(b'ERROR a\nok\nERROR b\n')
+        self.assertEqual(_lines(source, tty=True, pattern=re.compile(b'^ERROR')),
+                         [(frames.STDOUT, b'ERROR a\nERROR b\n')])
+
+
+if __name__ == '__main__':
+    unittest.main()
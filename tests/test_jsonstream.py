@@ -0,0 +1,85 @@
+import json
+import unittest
+
+from dkr_core import errors
+from dkr_core.jsonstream import _Scanner, iter_array, iter_objects
+
+
+def _feed_all(scanner: _Scanner, chunks: list) -> list:
+    return [scanner.feed(chunk) for chunk in chunks]
+
+
+class ObjectStreamTest(unittest.TestCase):
+    def test_object_is_yielded_as_soon_as_it_is_complete(self):
+        scanner = _Scanner(array=False)
+        results = _feed_all(scanner, ['{"status":"start","id":"abc"', '}\n', '{"x":1}\n'])
+        self.assertEqual(results, [[], [{'status': 'start', 'id': 'abc'}], [{'x': 1}]])
+
+    def test_object_split_into_single_characters(self):
+        document = '{"a": {"b": [1, 2, {"c": "d"}]}, "e": "}]"}'
+        scanner = _Scanner(array=False)
+        results = _feed_all(scanner, list(document))
+        self.assertEqual(results[:-1], [[]] * (len(document) - 1))
+        self.assertEqual(results[-1], [json.loads(document)])
+
+    def test_brackets_and_escapes_inside_strings(self):
+        values = [{'message': 'a } b ] c { d'}, {'quote': 'say \\"}\\" now'}, {'backslash': 'ends with \\\\'}]
+        document = ''.join(json.dumps(value) + '\n' for value in values)
+        for split in range(1, len(document)):
+            scanner = _Scanner(array=False)
+            decoded = scanner.feed(document[:split]) + scanner.feed(document[split:]) + scanner.feed('', final=True)
+            self.assertEqual(decoded, values, "split at {}".format(split))
+
+    def test_escape_split_across_chunks(self):
+        scanner = _Scanner(array=False)
+        self.assertEqual(scanner.feed('{"a": "x\\'), [])
+        self.assertEqual(scanner.feed('"}'), [])
+        self.assertEqual(scanner.feed('"}'), [{'a': 'x"}'}])
+
+    def test_large_object_in_small_chunks(self):
+        value = {'items': [{'id': index, 'name': 'item {}'.format(index)} for index in range(5000)]}
+        document = json.dumps(value)
+        scanner = _Scanner(array=False)
+        decoded = []
+        for start in range(0, len(document), 7):
+            decoded.extend(scanner.feed(document[start:start + 7]))
+        self.assertEqual(decoded, [value])
+
+    def test_scalars(self):
+        self.assertEqual(list(iter_objects([b'1 "two"', b' [3] {"four": 4}', b' true'])),
+                         [1, 'two', [3], {'four': 4}, True])
+
+    def test_truncated_stream(self):
+        with self.assertRaises(errors.DkrException):
+            list(iter_objects([b'{"a": 1}', b'{"b":']))
+
+    def test_multibyte_characters_split_across_chunks(self):
+        data = json.dumps({'name': 'café ☃'}, ensure_ascii=False).encode('utf-8')
+        self.assertEqual(list(iter_objects([data[:9], data[9:12], data[12:]])), [{'name': 'café ☃'}])
+
+
+class ArrayStreamTest(unittest.TestCase):
+    def test_elements_split_across_chunks(self):
+        value = [{'Id': str(index), 'Names': ['/c{}'.format(index)]} for index in range(100)]
+        document = json.dumps(value).encode('utf-8')
+        for size in (1, 5, 64, 4096):
+            chunks = [document[start:start + size] for start in range(0, len(document), size)]
+            self.assertEqual(list(iter_array(chunks)), value)
+
+    def test_element_is_yielded_before_the_array_ends(self):
+        scanner = _Scanner(array=True)
+        self.assertEqual(scanner.feed('[{"Id": "a"'), [])
+        self.assertEqual(scanner.feed('}'), [{'Id': 'a'}])
+        self.assertEqual(scanner.feed(', {"Id": "b"}'), [{'Id': 'b'}])
+        self.assertEqual(scanner.feed(']', final=True), [])
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_array([b'[', b']'])), [])
+
+    def test_truncated_array(self):
+        with self.assertRaises(errors.DkrException):
+            list(iter_array([b'[{"a": 1},']))
+
+
+if __name__ == '__main__':
+    unittest.main()
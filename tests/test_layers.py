@@ -0,0 +1,47 @@
+import unittest
+
+from dkr_core.layers import LayerGraph
+
+
+def _image(image_id: str, parent_id: str='', tags: list=None, size: int=0) -> dict:
+    return {'Id': image_id, 'ParentId': parent_id, 'RepoTags': tags, 'VirtualSize': size}
+
+
+def _container(name: str, image_id: str) -> dict:
+    return {'Id': name * 8, 'Names': ['/' + name], 'ImageID': image_id}
+
+
+# base <- mid <- app, base <- other
+IMAGES = [
+    _image('sha256:base', tags=['base:latest'], size=100),
+    _image('sha256:mid', 'sha256:base', size=150),
+    _image('sha256:app', 'sha256:mid', tags=['app:1'], size=200),
+    _image('sha256:other', 'sha256:base', tags=['other:latest'], size=120),
+]
+
+
+class UsersOfTest(unittest.TestCase):
+    def test_users_of_child_images_are_reported_for_their_parents(self):
+        graph = LayerGraph(IMAGES, [_container('web', 'sha256:app'), _container('job', 'sha256:other')])
+        users = graph.users_of({'sha256:base', 'sha256:mid'})
+        self.assertEqual(sorted(users['sha256:mid']), ['web'])
+        self.assertEqual(sorted(users['sha256:base']), ['job', 'web'])
+
+    def test_each_container_is_reported_once_per_selected_image(self):
+        graph = LayerGraph(IMAGES, [_container('web', 'sha256:app')])
+        users = graph.users_of({'sha256:base', 'sha256:mid', 'sha256:app'})
+        self.assertEqual(users, {'sha256:base': ['web'], 'sha256:mid': ['web'], 'sha256:app': ['web']})
+
+    def test_unused_images(self):
+        graph = LayerGraph(IMAGES, [_container('job', 'sha256:other')])
+        self.assertEqual(graph.users_of({'sha256:app', 'sha256:mid'}), {'sha256:app': [], 'sha256:mid': []})
+
+    def test_removal_dependencies_order_children_first(self):
+        graph = LayerGraph(IMAGES)
+        dependencies = graph.removal_dependencies({'sha256:base', 'sha256:app', 'sha256:other'})
+        self.assertEqual(dependencies, {'sha256:base': {'sha256:app', 'sha256:other'}, 'sha256:app': set(),
+                                        'sha256:other': set()})
+
+
+if __name__ == '__main__':
+    unittest.main()
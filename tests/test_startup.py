@@ -0,0 +1,83 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from dkr_core.dkr import selected_command
+
+PROJECT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules that only the commands actually talking to the daemon or rendering output may import
+HEAVY_MODULES = ('docker', 'requests', 'yaml', 'tabulate', 'pretty', 'colors', 'asyncio')
+# seconds from the first dkr import to --help being printed, interpreter startup excluded
+COLD_START_BUDGET = 0.25
+
+_MEASURE = """
+import json, runpy, sys, time
+started = time.perf_counter()
+sys.argv = {argv!r}
+try:
+    runpy.run_path({script!r}, run_name='__main__')
+except SystemExit:
+    pass
+elapsed = time.perf_counter() - started
+sys.stdout = sys.__stdout__
+print(json.dumps({{'elapsed': elapsed, 'modules': sorted(sys.modules)}}))
+"""
+
+
+def _run(code: str, home: str) -> dict:
+    environ = dict(os.environ, HOME=home, DKR_NO_SERVER='1', PYTHONPATH=PROJECT_DIRECTORY)
+    environ.pop('DKR_TIMINGS', None)
+    result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            env=environ, cwd=PROJECT_DIRECTORY, check=True)
+    return json.loads(result.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def _imported(modules: list, name: str) -> bool:
+    return any(module == name or module.startswith(name + '.') for module in modules)
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.home = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.home.cleanup()
+
+    def test_core_imports_no_heavy_modules(self):
+        code = "import json, sys\nimport dkr_core.dkr, dkr_core.server, dkr_core.errors\n" \
+               "print(json.dumps({'modules': sorted(sys.modules)}))"
+        modules = _run(code, self.home.name)['modules']
+        for name in HEAVY_MODULES:
+            self.assertFalse(_imported(modules, name), "importing dkr_core.dkr imported {}".format(name))
+
+    @unittest.skipUnless(importlib.util.find_spec('docker'), "building the manifest imports the commands")
+    def test_help_with_warm_manifest(self):
+        code = _MEASURE.format(argv=['dkr', '--help'], script=os.path.join(PROJECT_DIRECTORY, 'dkr'))
+        # the first run builds ~/.dkr/manifest.json, the second one is what every later invocation pays
+        _run(code, self.home.name)
+        measured = _run(code, self.home.name)
+
+        for name in HEAVY_MODULES:
+            self.assertFalse(_imported(measured['modules'], name), "dkr --help imported {}".format(name))
+        self.assertLess(measured['elapsed'], COLD_START_BUDGET)
+
+
+class SelectedCommandTest(unittest.TestCase):
+    def test_skips_global_options_and_their_values(self):
+        self.assertEqual(selected_command(['--timings-file', '/tmp/t.json', 'container', 'list']), 'container')
+        self.assertEqual(selected_command(['--timings-file=/tmp/t.json', 'image', 'list']), 'image')
+        self.assertEqual(selected_command(['--debug', '--timings', 'container']), 'container')
+
+    def test_no_command(self):
+        self.assertIsNone(selected_command(['--help']))
+        self.assertIsNone(selected_command(['--timings-file', 'container']))
+        self.assertIsNone(selected_command(['--', 'container']))
+
+
+if __name__ == '__main__':
+    unittest.main()
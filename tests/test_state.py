@@ -0,0 +1,92 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from dkr_core.state import StateStore
+
+WRITERS = 16
+ROUNDS = 50
+
+
+def _write_keys(state_file: str, writer: int, start):
+    start.wait()
+    for round_number in range(ROUNDS):
+        # a new store every round, like a new dkr process, so every save merges into what the others wrote
+        store = StateStore(state_file)
+        state = store.load()
+        state["writer-{}-{}".format(writer, round_number)] = round_number
+        state["last-{}".format(writer)] = round_number
+        store.namespace("writer-{}".format(writer % 4))[str(writer * ROUNDS + round_number)] = writer
+        store.save()
+
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.state_file = os.path.join(self.directory.name, "state.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_concurrent_writers_keep_every_key(self):
+        start = multiprocessing.Event()
+        processes = [multiprocessing.Process(target=_write_keys, args=(self.state_file, writer, start))
+                     for writer in range(WRITERS)]
+        for process in processes:
+            process.start()
+        start.set()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(process.exitcode, 0)
+
+        with open(self.state_file, 'r') as file:
+            state = json.load(file)
+        expected = {}
+        for writer in range(WRITERS):
+            expected["last-{}".format(writer)] = ROUNDS - 1
+            for round_number in range(ROUNDS):
+                expected["writer-{}-{}".format(writer, round_number)] = round_number
+        self.assertEqual(state, expected)
+
+        for namespace in range(4):
+            with open(os.path.join(self.directory.name, "state", "writer-{}.json".format(namespace)), 'r') as file:
+                keys = json.load(file)
+            writers = [writer for writer in range(WRITERS) if writer % 4 == namespace]
+            self.assertEqual(set(keys), {str(writer * ROUNDS + round_number)
+                                         for writer in writers for round_number in range(ROUNDS)})
+
+        leftovers = [name for directory in (self.directory.name, os.path.join(self.directory.name, "state"))
+                     for name in os.listdir(directory) if name.endswith('.tmp')]
+        self.assertEqual(leftovers, [])
+
+    def test_removed_keys_do_not_touch_keys_of_others(self):
+        first = StateStore(self.state_file)
+        first.load()
+        first.state.update({'a': 1, 'b': 2})
+        first.save()
+
+        second = StateStore(self.state_file)
+        second.load()
+        del first.state['a']
+        first.save()
+        second.state['c'] = 3
+        second.save()
+
+        self.assertEqual(StateStore(self.state_file).load(), {'b': 2, 'c': 3})
+
+    def test_unchanged_state_is_not_written(self):
+        store = StateStore(self.state_file)
+        store.load()
+        store.save()
+        self.assertFalse(os.path.exists(self.state_file))
+
+    def test_truncated_file_is_read_as_empty(self):
+        with open(self.state_file, 'w') as file:
+            file.write('{"a": ')
+        self.assertEqual(StateStore(self.state_file).load(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+
+from dkr_core import errors
+from dkr_core.template import compile_template
+
+
+class CompileTemplateTest(unittest.TestCase):
+    def test_fields_and_literal_braces(self):
+        render = compile_template('{{.Id}} {x} {{ .Labels.com.example }}')
+        self.assertEqual(render({'Id': 'abc', 'Labels': {'com.example': 'yes'}}), 'abc {x} yes')
+
+    def test_invalid_fields_are_rejected_anywhere(self):
+        for template in ('{{Id}} {{.Id}}', '{{.Id}} {{Id}}', '{{.Id}} }} {{.Id}}'):
+            with self.assertRaises(errors.DkrException) as raised:
+                compile_template(template)
+            self.assertEqual(raised.exception.exit_code, errors.INVALID_INPUT)
+
+
+if __name__ == '__main__':
+    unittest.main()